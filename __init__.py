@@ -1,21 +1,29 @@
 ﻿"""
 Gemini TTS Add-on for Anki
 Provides AI text generation and TTS using Google Gemini API
+
+Startup only sets up logging (utils/log.py, standard library only) and
+registers the menu action and hooks. The dialog, the HTTP client and
+everything under lib/ are imported the first time they are used.
 """
 
-import sys
-from pathlib import Path
+import time
+import weakref
+import logging
+
+_startup_began = time.perf_counter()
 
-# Add lib folder to Python path
-addon_path = Path(__file__).parent
-lib_path = addon_path / "lib"
-if lib_path.exists() and str(lib_path) not in sys.path:
-    sys.path.insert(0, str(lib_path))
+# Same logger as utils.log; init_addon attaches its handlers
+log = logging.getLogger("gemini_tts")
 
-# Anki imports
-from aqt import mw, gui_hooks
-from aqt.utils import showInfo, qconnect
-from aqt.qt import QAction
+# Anki imports (already loaded by Anki, so these cost nothing)
+try:
+    from aqt import mw, gui_hooks
+    from aqt.utils import showInfo, qconnect
+    from aqt.qt import QAction
+except ImportError:
+    # Imported outside Anki, e.g. for the command line (python -m gemini_tts.cli)
+    mw = None
 
 def check_first_run():
     """Check if this is first run and prompt for API key"""
@@ -33,33 +41,147 @@ def check_first_run():
 def show_gemini_dialog():
     """Show the main Gemini dialog"""
     try:
-        # Add addon directory to path for gui imports
-        addon_dir = str(Path(__file__).parent)
-        if addon_dir not in sys.path:
-            sys.path.insert(0, addon_dir)
-            
-        from gui.main_dialog import show_gemini_dialog as show_dialog
+        from .gui.main_dialog import show_gemini_dialog as show_dialog
         show_dialog()
     except Exception as e:
         showInfo(f"Error opening Gemini dialog:\n{str(e)}")
-        print(f"Gemini dialog error: {e}")
+        log.exception("Gemini dialog error: %s", e)
+
+def _get_retriever():
+    from .utils.embedding_index import get_collection_retriever
+
+    return get_collection_retriever(mw.pm.name, lambda: mw.col.db)
+
+def sync_index():
+    """Bring the collection embedding index up to date in the background"""
+    config = mw.addonManager.getConfig(__name__) or {}
+    api_key = config.get("api_key")
+    if not api_key or mw.col is None:
+        return
+    retriever = _get_retriever()
+    if retriever.client is None:
+        from .utils.gemini_client import GeminiClient
+
+        GeminiClient(api_key, retriever=retriever)
+    retriever.sync_in_background(mw.taskman.run_in_background)
+
+def on_note_changed(note):
+    """Queue an added or edited note for re-embedding"""
+    if note.id:
+        _get_retriever().mark_dirty(note.id)
+        mw.taskman.run_on_main(sync_index)
+
+def on_field_unfocused(changed, note, field_idx):
+    """Editor filter hook: queue the note if the field changed"""
+    if changed:
+        on_note_changed(note)
+    return changed
+
+_last_editor = None
+
+def on_editor_loaded_note(editor):
+    """Remember the editor that loaded a note most recently"""
+    global _last_editor
+    _last_editor = weakref.ref(editor)
+
+def current_note_id():
+    """Id of the note in the most recently used editor, or None (closed, or a new note)"""
+    editor = _last_editor() if _last_editor is not None else None
+    note = getattr(editor, "note", None)
+    return note.id if note is not None and note.id else None
+
+def on_notes_deleted(col, ids):
+    """Queue deleted notes so the next sync drops them from the index"""
+    retriever = _get_retriever()
+    for note_id in ids:
+        retriever.mark_dirty(note_id)
+    mw.taskman.run_on_main(sync_index)
+
+def register_index_hooks():
+    """Keep the collection embedding index up to date from note-change hooks.
+
+    The first build runs when the profile opens; every sync runs in the
+    background, so grounded generation never waits for the index.
+    """
+    from anki import hooks
+
+    gui_hooks.profile_did_open.append(sync_index)
+    gui_hooks.add_cards_did_add_note.append(on_note_changed)
+    gui_hooks.editor_did_unfocus_field.append(on_field_unfocused)
+    gui_hooks.editor_did_load_note.append(on_editor_loaded_note)
+    hooks.notes_will_be_deleted.append(on_notes_deleted)
+
+def start_bytecode_warmup():
+    """Compile the add-on and lib/ in the background, once per interpreter"""
+    from .utils import warmup
+
+    if not warmup.is_needed():
+        return
+
+    from aqt.utils import tooltip
+
+    last_reported = [0]
+
+    def report(done, total):
+        percent = done * 100 // total
+        if percent >= last_reported[0] + 25 or done == total:
+            last_reported[0] = percent
+            log.info("Bytecode warm-up: %d/%d files (%d%%)", done, total, percent)
+
+    def on_done(future):
+        try:
+            total, failed, elapsed = future.result()
+        except Exception as e:
+            log.error("Bytecode warm-up failed: %s", e)
+            return
+        log.info("Bytecode warm-up compiled %d/%d files in %.1f s", total - failed, total, elapsed)
+        tooltip("Gemini TTS is ready")
+
+    tooltip("Gemini TTS: preparing add-on for first use in the background...")
+    mw.taskman.run_in_background(lambda: warmup.compile_all(progress=report), on_done)
+
+def setup_logging():
+    """Attach the log handlers and apply the configured level"""
+    from .utils import log as addon_log
+
+    config = mw.addonManager.getConfig(__name__) or {}
+    addon_log.setup(config.get("log_level", "INFO"))
+
+def report_startup():
+    log.info("Gemini TTS add-on initialized in %.2f ms", startup_ms())
 
 def init_addon():
     """Initialize the add-on"""
     try:
+        setup_logging()
+
         # Add menu item
         action = QAction("Gemini TTS", mw)
         qconnect(action.triggered, show_gemini_dialog)
         mw.form.menuTools.addAction(action)
         
         # Check for first run after Anki is fully loaded
+        gui_hooks.main_window_did_init.append(report_startup)
         gui_hooks.main_window_did_init.append(lambda: check_first_run())
+        gui_hooks.main_window_did_init.append(start_bytecode_warmup)
         
-        print("Gemini TTS add-on initialized successfully")
+        config = mw.addonManager.getConfig(__name__) or {}
+        if config.get("rag_enabled"):
+            register_index_hooks()
         
     except Exception as e:
-        print(f"Error initializing Gemini TTS add-on: {e}")
+        log.exception("Error initializing Gemini TTS add-on: %s", e)
         showInfo(f"Error initializing Gemini TTS add-on:\n{str(e)}")
 
-# Initialize the add-on
-init_addon()
+_startup_ms = None
+
+def startup_ms():
+    """Milliseconds this module spent at Anki startup (import + init_addon)"""
+    if _startup_ms is None:
+        return (time.perf_counter() - _startup_began) * 1000
+    return _startup_ms
+
+# Initialize the add-on (mw is None when not running inside Anki)
+if mw is not None:
+    init_addon()
+_startup_ms = startup_ms()
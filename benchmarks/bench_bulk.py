@@ -0,0 +1,379 @@
+﻿"""Load test: a bulk TTS or generation job over a large synthetic collection.
+
+Builds a synthetic collection (SQLite, one row per note) with configurable
+size, field lengths, duplicate ratio and languages, then runs the add-on's
+headless bulk pipeline (utils.bulk_jobs) over it against the mock API:
+
+- outages: --outage-at/--outage-for switch the mock to 503s for a window
+- crash:   --crash-at kills the job process once that fraction of notes is
+           done, then restarts it to check that the job resumes correctly
+- quota:   --capacity/--capacity-at limit how many requests the mock serves
+           at once; with --adaptive the job's concurrency limit (AIMD, see
+           utils/concurrency.py) should settle just below it
+
+Reports end-to-end wall time, per-stage throughput, retries, RSS sampled
+over time, and resume correctness (notes missing a result, notes written
+more than once).
+
+    python benchmarks/bench_bulk.py --notes 100000 --workers 32 --latency lognormal:0.08,0.4 \\
+        --outage-at 20 --outage-for 10 --crash-at 0.5
+    python benchmarks/bench_bulk.py --notes 20000 --workers 64 --adaptive --latency fixed:0.1 \
+        --capacity 16 --capacity-at 10:4 --capacity-at 20:48
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ADDON_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_server import add_settings_arguments, parse_latency  # noqa: E402
+
+WORDS = {
+    "en": "the cat sat on a warm mat near an old window while rain fell softly outside".split(),
+    "de": "der schnelle braune Fuchs springt über den faulen Hund und läuft weiter".split(),
+    "es": "el rápido zorro marrón salta sobre el perro perezoso y sigue corriendo".split(),
+    "ja": "私 は 毎日 学校 へ 行きます そして 友達 と 日本語 を 勉強 します".split(),
+}
+
+
+# -----------------------------
+# SYNTHETIC COLLECTION
+# -----------------------------
+def build_collection(path, notes, field_words, duplicate_ratio, languages, seed):
+    """Create the collection file; texts are drawn word by word per language"""
+    rng = random.Random(seed)
+    length = parse_latency(field_words)
+    recent = []
+    conn = sqlite3.connect(path)
+    # WAL so the job can write results while its reader streams the notes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, lang TEXT, flds TEXT)")
+    conn.execute("CREATE TABLE results (note_id INTEGER PRIMARY KEY, output TEXT, writes INTEGER)")
+    batch = []
+    for note_id in range(1, notes + 1):
+        if recent and rng.random() < duplicate_ratio:
+            lang, text = rng.choice(recent)
+        else:
+            lang = rng.choice(languages)
+            pool = WORDS[lang]
+            count = max(1, int(length(rng)))
+            separator = "" if lang == "ja" else " "
+            text = separator.join(rng.choice(pool) for _ in range(count))
+            if len(recent) < 1000:
+                recent.append((lang, text))
+            else:
+                recent[rng.randrange(1000)] = (lang, text)
+        batch.append((note_id, lang, text))
+        if len(batch) >= 5000:
+            conn.executemany("INSERT INTO notes VALUES (?, ?, ?)", batch)
+            batch.clear()
+    conn.executemany("INSERT INTO notes VALUES (?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def iter_notes(path):
+    """Stream (note_id, text) in id order without loading the collection"""
+    conn = sqlite3.connect(path)
+    try:
+        for row in conn.execute("SELECT id, flds FROM notes ORDER BY id"):
+            yield row
+    finally:
+        conn.close()
+
+
+def rss_mb():
+    """Current resident set size (Linux), else peak RSS, else None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+# -----------------------------
+# JOB PROCESS
+# -----------------------------
+def run_worker(args):
+    """Run (or resume) the bulk job; writes a JSON report as it goes"""
+    from utils import log
+    from utils.gemini_client import GeminiClient
+    from utils.bulk_jobs import BulkRunner, GenerateTask, JobStore, TtsTask
+    from utils.concurrency import get_limiter
+
+    log.setup(args.log_level)
+    client = GeminiClient("mock-key")
+    client.base_url = f"{args.mock_url}/v1beta"
+    client.tts_url = f"{args.mock_url}/v1/text:synthesize"
+    if args.kind == "tts":
+        task = TtsTask(args.media_dir)
+    else:
+        task = GenerateTask(template="Write a one-sentence example using: {text}")
+
+    limiter = get_limiter(args.kind, max_limit=args.workers) if args.adaptive else None
+    runner = BulkRunner(
+        client, task, args.job_id, store=JobStore(args.job_store), workers=args.workers,
+        backoff=args.backoff, max_retries=args.max_retries, profile=args.profile, limiter=limiter,
+    )
+    report = {"pid": os.getpid(), "samples": [], "stats": None}
+    started = time.perf_counter()
+
+    def save():
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+
+    def sample():
+        while not done.wait(args.sample_interval):
+            report["samples"].append((round(time.perf_counter() - started, 2), rss_mb(), runner.stats.done,
+                                      limiter.limit if limiter is not None else None))
+            save()
+
+    results = sqlite3.connect(args.collection)
+
+    def sink(batch):
+        results.executemany(
+            "INSERT INTO results (note_id, output, writes) VALUES (?, ?, 1)"
+            " ON CONFLICT(note_id) DO UPDATE SET output = excluded.output, writes = writes + 1",
+            batch,
+        )
+        results.commit()
+
+    done = threading.Event()
+    threading.Thread(target=sample, daemon=True).start()
+    report["stats"] = runner.run(iter_notes(args.collection), sink=sink)
+    done.set()
+    report["samples"].append((round(time.perf_counter() - started, 2), rss_mb(), runner.stats.done,
+                              limiter.limit if limiter is not None else None))
+    save()
+    return 0
+
+
+# -----------------------------
+# HARNESS
+# -----------------------------
+def control(url, **settings):
+    request = urllib.request.Request(
+        f"{url}/__control", data=json.dumps(settings).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    urllib.request.urlopen(request, timeout=5).read()
+
+
+def start_mock(args):
+    command = [
+        sys.executable, str(Path(__file__).resolve().parent / "mock_server.py"),
+        "--port", "0", "--latency", args.latency, "--text-bytes", str(args.text_bytes),
+        "--audio-bytes-per-char", str(args.audio_bytes_per_char),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--capacity", str(args.capacity), "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().split(" on ", 1)[1].split()[0]
+    return process, url
+
+
+def done_count(job_store, job_id):
+    try:
+        conn = sqlite3.connect(job_store, timeout=1)
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND status = 'done'", (job_id,)
+            ).fetchone()
+            return row[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def spawn_worker(args, report):
+    command = [
+        sys.executable, __file__, "--worker", "--collection", args.collection, "--job-store", args.job_store,
+        "--job-id", args.job_id, "--mock-url", args.mock_url, "--report", report, "--kind", args.kind,
+        "--media-dir", args.media_dir, "--workers", str(args.workers), "--backoff", str(args.backoff),
+        "--max-retries", str(args.max_retries), "--sample-interval", str(args.sample_interval),
+        "--log-level", args.log_level, *(["--profile"] if args.profile else []),
+        *(["--adaptive"] if args.adaptive else []),
+    ]
+    return subprocess.Popen(command)
+
+
+def verify(collection):
+    conn = sqlite3.connect(collection)
+    try:
+        missing = conn.execute(
+            "SELECT COUNT(*) FROM notes LEFT JOIN results ON results.note_id = notes.id WHERE results.note_id IS NULL"
+        ).fetchone()[0]
+        rewritten = conn.execute("SELECT COUNT(*) FROM results WHERE writes > 1").fetchone()[0]
+        empty = conn.execute("SELECT COUNT(*) FROM results WHERE output IS NULL OR output = ''").fetchone()[0]
+        return {"missing": missing, "written_more_than_once": rewritten, "empty_outputs": empty}
+    finally:
+        conn.close()
+
+
+def summarize_run(name, report):
+    stats = report["stats"] or {}
+    samples = [s for s in report["samples"] if s[1] is not None]
+    print(f"  {name}: pid {report['pid']}")
+    if stats:
+        wall = stats["wall_s"] or 1
+        print(f"    wall {stats['wall_s']} s, done {stats['done']}, failed {stats['failed']}, "
+              f"skipped {stats['skipped']} (resume), retries {stats['retries']}, cached {stats['cached']}")
+        print(f"    throughput {stats['items_per_s']} items/s; "
+              f"source read {stats['read'] / wall:.0f} rows/s")
+        busy = stats["stage_seconds"]
+        print(f"    stage busy time: read {busy['read']} s, request {busy['request']} s "
+              f"(summed over workers), write {busy['write']} s")
+        if stats.get("concurrency"):
+            c = stats["concurrency"]
+            print(f"    concurrency limit {c['limit']} (max {c['max']}), latency baseline {c['baseline_ms']} ms, "
+                  f"decreases {c['decreases']}")
+        for kind, path in stats.get("profile", {}).items():
+            print(f"    profile {kind}: {path}")
+    else:
+        print("    killed before finishing")
+    if samples:
+        step = max(1, len(samples) // 8)
+        trace = ", ".join(f"{t:.0f}s:{m:.0f}MB/{n}" for t, m, n, *_ in samples[::step])
+        print(f"    RSS first {samples[0][1]:.1f} MB, peak {max(s[1] for s in samples):.1f} MB, "
+              f"last {samples[-1][1]:.1f} MB")
+        print(f"    RSS over time (t:rss/done): {trace}")
+        limits = [(s[0], s[3]) for s in samples if len(s) > 3 and s[3] is not None]
+        if limits:
+            step = max(1, len(limits) // 16)
+            print(f"    concurrency limit over time: {', '.join(f'{t:.0f}s:{n}' for t, n in limits[::step])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--field-words", default="lognormal:12,0.8", help="words per field (distribution spec)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.15)
+    parser.add_argument("--languages", default="en,de,es,ja")
+    parser.add_argument("--kind", choices=("tts", "generate"), default="tts")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent requests (the maximum with --adaptive)")
+    parser.add_argument("--adaptive", action="store_true", help="adapt concurrency to throttling and latency")
+    parser.add_argument("--capacity-at", action="append", default=[], metavar="SECONDS:N",
+                        help="change the mock's capacity at that time (repeatable)")
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay (s)")
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument("--outage-at", type=float, help="seconds after start to begin a 503 outage")
+    parser.add_argument("--outage-for", type=float, default=10.0)
+    parser.add_argument("--crash-at", type=float, help="kill the job at this fraction done, then resume")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--workdir", help="keep collection, job store and media here (default: temp dir)")
+    parser.add_argument("--log-level", default="CRITICAL")
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each job run (cProfile, tracemalloc, stacks) into user_files/profiles/")
+    # job process options
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--collection", help=argparse.SUPPRESS)
+    parser.add_argument("--job-store", help=argparse.SUPPRESS)
+    parser.add_argument("--job-id", default="load-test", help=argparse.SUPPRESS)
+    parser.add_argument("--mock-url", help=argparse.SUPPRESS)
+    parser.add_argument("--report", help=argparse.SUPPRESS)
+    parser.add_argument("--media-dir", help=argparse.SUPPRESS)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="gemini_bulk_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    args.collection = str(workdir / "collection.sqlite3")
+    args.job_store = str(workdir / "jobs.sqlite3")
+    args.media_dir = str(workdir / "media")
+    for stale in (args.collection, args.job_store):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(stale + suffix):
+                os.remove(stale + suffix)
+
+    print(f"building {args.notes} notes in {workdir} ...")
+    started = time.perf_counter()
+    build_collection(args.collection, args.notes, args.field_words, args.duplicate_ratio,
+                     args.languages.split(","), args.seed)
+    print(f"  built in {time.perf_counter() - started:.1f} s")
+
+    mock, args.mock_url = start_mock(args)
+    timers = []
+    reports = []
+    try:
+        if args.outage_at is not None:
+            timers.append(threading.Timer(args.outage_at, control, (args.mock_url,), {"outage": True}))
+            timers.append(threading.Timer(args.outage_at + args.outage_for, control, (args.mock_url,),
+                                          {"outage": False}))
+        for change in args.capacity_at:
+            at, capacity = change.split(":")
+            timers.append(threading.Timer(float(at), control, (args.mock_url,), {"capacity": int(capacity)}))
+        started = time.perf_counter()
+        for timer in timers:
+            timer.start()
+
+        report = str(workdir / "run1.json")
+        reports.append(report)
+        worker = spawn_worker(args, report)
+        if args.crash_at is not None:
+            threshold = int(args.notes * args.crash_at)
+            while worker.poll() is None and done_count(args.job_store, args.job_id) < threshold:
+                time.sleep(0.1)
+            if worker.poll() is None:
+                worker.kill()
+                worker.wait()
+                print(f"  crashed the job at {done_count(args.job_store, args.job_id)} done notes, resuming")
+                report = str(workdir / "run2.json")
+                reports.append(report)
+                worker = spawn_worker(args, report)
+        worker.wait()
+        wall = time.perf_counter() - started
+    finally:
+        for timer in timers:
+            timer.cancel()
+        mock.terminate()
+        mock.wait()
+
+    print(f"end-to-end wall time {wall:.1f} s for {args.notes} notes ({args.notes / wall:.1f} notes/s)")
+    runs = []
+    for i, path in enumerate(reports, 1):
+        try:
+            with open(path, encoding="utf-8") as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            run = {"pid": "?", "samples": [], "stats": None}
+        runs.append(run)
+        summarize_run(f"run {i}", run)
+
+    check = verify(args.collection)
+    ok = check["missing"] == 0 and check["empty_outputs"] == 0
+    print(f"resume check: {check['missing']} notes without a result, {check['empty_outputs']} empty, "
+          f"{check['written_more_than_once']} written more than once (redone after the crash)")
+    print("OK" if ok else "FAIL")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"wall_s": wall, "runs": runs, "check": check}, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+﻿"""Benchmark GeminiClient against the local mock API at several concurrency levels.
+
+Scenarios:
+- generate: GeminiClient.generate_text
+- tts:      GeminiClient.generate_tts_audio
+- stream:   streamGenerateContent over the shared session (time to first
+            chunk and to the last chunk; the client has no streaming call yet)
+- cards:    the document-to-cards map-reduce pipeline (utils.doc_to_cards)
+
+The mock server runs in a separate process so CPU time per request only
+counts the client. For each scenario and concurrency level it prints
+throughput, latency percentiles, failures, CPU per request and peak RSS.
+
+With --cassette the run records the mock's responses to a cassette, or
+(--cassette-mode replay) runs against a cassette recorded from the real API
+instead of the mock, matched by endpoint (see utils/cassette.py).
+
+    python benchmarks/bench_client.py --concurrency 1,4,16 --requests 200 --throttle-rate 0.02
+    python benchmarks/bench_client.py --cassette real.jsonl.gz --cassette-mode replay --replay-speed 1
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ADDON_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_server import add_settings_arguments  # noqa: E402
+
+SCENARIOS = ("generate", "tts", "stream", "cards")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def start_mock(args):
+    """Run mock_server.py in a child process; returns (process, base url)"""
+    command = [
+        sys.executable, str(Path(__file__).resolve().parent / "mock_server.py"),
+        "--port", "0", "--latency", args.latency, "--text-bytes", str(args.text_bytes),
+        "--audio-bytes-per-char", str(args.audio_bytes_per_char),
+        "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    url = line.split(" on ", 1)[1].split()[0]
+    return process, url
+
+
+def classify(error):
+    if error is None:
+        return "ok"
+    return "throttled" if "HTTP 429" in str(error) else "error"
+
+
+class Runner:
+    def __init__(self, url, args):
+        from utils.gemini_client import GeminiClient, get_session
+
+        self.url = url
+        self.args = args
+        session = get_session()
+        if args.cassette:
+            from utils import cassette
+
+            cassette.install(
+                session, args.cassette, mode=args.cassette_mode, speed=args.replay_speed, match="route"
+            )
+        self.client = GeminiClient("mock-key", session=session)
+        if url:
+            self.client.base_url = f"{url}/v1beta"
+            self.client.tts_url = f"{url}/v1/text:synthesize"
+        self.tts_text = ("Der schnelle braune Fuchs springt über den faulen Hund. " * 8)[: args.tts_chars]
+
+    def generate(self, i):
+        result, error = self.client.generate_text(
+            f"Explain item {i} in one paragraph.", model=self.args.model, max_tokens=512
+        )
+        return classify(error), None
+
+    def tts(self, i):
+        audio, error = self.client.generate_tts_audio(self.tts_text)
+        return classify(error), None
+
+    def stream(self, i):
+        from utils import metrics
+
+        url = f"{self.client.base_url}/models/{self.args.model}:streamGenerateContent"
+        payload = {"contents": [{"parts": [{"text": f"Stream item {i}"}]}]}
+        start = time.perf_counter()
+        first = None
+        with metrics.track("streamGenerateContent", model=self.args.model):
+            response = self.client.session.post(
+                url, params={"alt": "sse"}, headers={"x-goog-api-key": "mock-key"},
+                json=payload, stream=True, timeout=60,
+            )
+            if response.status_code != 200:
+                response.close()
+                return classify(f"HTTP {response.status_code}"), None
+            # Small reads so the first event is seen as soon as it arrives
+            for line in response.iter_lines(chunk_size=64):
+                if line.startswith(b"data:") and first is None:
+                    first = time.perf_counter() - start
+            response.close()
+        return "ok", first
+
+    def run(self, scenario, concurrency, count):
+        """Returns a result row dict"""
+        from utils import metrics
+
+        metrics.registry.clear()
+        latencies = []
+        extras = []
+        outcomes = {"ok": 0, "throttled": 0, "error": 0}
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+
+        if scenario == "cards":
+            from utils.doc_to_cards import generate_cards
+
+            paragraph = "Photosynthesis converts light energy into chemical energy in plants. " * 20
+            document = "\n\n".join(f"Section {i}. {paragraph}" for i in range(count))
+            for _, _, _, error in generate_cards(
+                self.client, document, model=self.args.model, max_tokens=400, overlap_tokens=0,
+                workers=concurrency,
+            ):
+                outcomes[classify(error)] += 1
+            timings = [t for t in metrics.registry.recent() if t.endpoint == "generateContent"]
+            latencies = [t.total for t in timings]
+            extras = [t.phases.get("queue_wait", 0.0) for t in timings]
+        else:
+            call = getattr(self, scenario)
+
+            def timed(i):
+                start = time.perf_counter()
+                outcome, extra = call(i)
+                return outcome, time.perf_counter() - start, extra
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for outcome, elapsed, extra in executor.map(timed, range(count)):
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+                    if extra is not None:
+                        extras.append(extra)
+
+        wall = time.perf_counter() - wall_before
+        cpu = time.process_time() - cpu_before
+        done = sum(outcomes.values())
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        extra_name = {"stream": "first_chunk_p50_ms", "cards": "queue_wait_p50_ms"}.get(scenario)
+        return {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": done,
+            **outcomes,
+            "wall_s": round(wall, 3),
+            "rps": round(done / wall, 2) if wall else None,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p90_ms": ms(percentile(latencies, 90)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "mean_ms": ms(statistics.mean(latencies)) if latencies else None,
+            "cpu_ms_per_request": round(cpu * 1000 / done, 3) if done else None,
+            "peak_rss_mb": None if peak_rss_mb() is None else round(peak_rss_mb(), 1),
+            "extra": {extra_name: ms(percentile(extras, 50))} if extra_name else {},
+        }
+
+
+def print_row(row):
+    def fmt(value, width):
+        return f"{'n/a' if value is None else value:>{width}}"
+
+    extra = " ".join(f"{k}={v}" for k, v in row["extra"].items())
+    print(
+        f"{row['scenario']:<9}{row['concurrency']:>5}{row['requests']:>7}{row['ok']:>6}"
+        f"{row['throttled']:>6}{row['error']:>6}{fmt(row['rps'], 9)}{fmt(row['p50_ms'], 9)}"
+        f"{fmt(row['p90_ms'], 9)}{fmt(row['p99_ms'], 9)}{fmt(row['cpu_ms_per_request'], 9)}"
+        f"{fmt(row['peak_rss_mb'], 9)}  {extra}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=100, help="calls (or document chunks) per run")
+    parser.add_argument("--tts-chars", type=int, default=200)
+    parser.add_argument("--log-level", default="CRITICAL", help="add-on log level during the run")
+    parser.add_argument("--json", help="also write the rows to this file")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--cassette", help="record to / replay from this cassette file")
+    parser.add_argument("--cassette-mode", choices=("record", "replay"), default="record")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay timing factor: 1 = recorded latency, 0 = full speed")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    from utils import log
+
+    log.setup(args.log_level)
+
+    replaying = args.cassette and args.cassette_mode == "replay"
+    process, url = (None, None) if replaying else start_mock(args)
+    rows = []
+    try:
+        runner = Runner(url, args)
+        if replaying:
+            print(f"replaying {args.cassette} at speed {args.replay_speed}")
+        else:
+            print(f"mock API at {url}, latency {args.latency}, "
+                  f"errors {args.error_rate:.1%}, 429s {args.throttle_rate:.1%}")
+        print(f"{'scenario':<9}{'conc':>5}{'reqs':>7}{'ok':>6}{'429':>6}{'err':>6}{'req/s':>9}"
+              f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'cpu ms':>9}{'rss MB':>9}")
+        for scenario in args.scenarios.split(","):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                row = runner.run(scenario.strip(), concurrency, args.requests)
+                rows.append(row)
+                print_row(row)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "rows": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
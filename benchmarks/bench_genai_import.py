@@ -0,0 +1,92 @@
+﻿"""Import-time regression benchmark for the vendored google.generativeai package.
+
+Each scenario runs in a fresh interpreter and reports wall time and the
+number of modules loaded:
+
+- bare: `import google.generativeai` only
+- generation: + GenerativeModel
+- generation+embedding: + embed_content (what the add-on actually touches)
+- everything: every public name (the cost of the old eager __init__)
+
+Use --max-bare-ms to fail when the bare import regresses, e.g. in CI:
+
+    python benchmarks/bench_genai_import.py --repeat 5 --max-bare-ms 50
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "bare": [],
+    "generation": ["GenerativeModel"],
+    "generation+embedding": ["GenerativeModel", "embed_content"],
+    "everything": None,
+}
+
+TEMPLATE = """
+import sys, time, json
+from utils import vendor
+vendor.install()
+before = len(sys.modules)
+t = time.perf_counter()
+genai = vendor.load("google.generativeai")
+names = {names!r}
+for name in (sorted(genai._LAZY_ATTRS) if names is None else names):
+    getattr(genai, name)
+print(json.dumps({{"ms": (time.perf_counter() - t) * 1000, "modules": len(sys.modules) - before}}))
+"""
+
+
+def run_scenario(names):
+    result = subprocess.run(
+        [sys.executable, "-c", TEMPLATE.format(names=names)],
+        cwd=ADDON_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"
+        return None, error
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-bare-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    bare_ms = None
+    print(f"{'scenario':24}{'median ms':>12}{'modules':>10}")
+    for label, names in SCENARIOS.items():
+        timings = []
+        modules = 0
+        error = None
+        for _ in range(args.repeat):
+            sample, error = run_scenario(names)
+            if sample is None:
+                break
+            timings.append(sample["ms"])
+            modules = sample["modules"]
+        if not timings:
+            print(f"{label:24}{'n/a':>12}{'':>10}  ({error})")
+            continue
+        median = statistics.median(timings)
+        if label == "bare":
+            bare_ms = median
+        print(f"{label:24}{median:12.1f}{modules:10d}")
+
+    if args.max_bare_ms is not None and (bare_ms is None or bare_ms > args.max_bare_ms):
+        print(f"FAIL: bare import took {bare_ms} ms (limit {args.max_bare_ms} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
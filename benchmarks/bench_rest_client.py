@@ -0,0 +1,110 @@
+﻿"""Compare the proto-free REST client with the vendored google.generativeai SDK.
+
+Measures, each in a fresh interpreter:
+- import time of utils.rest_client vs google.generativeai
+- per-call request marshalling for an embedContent request: a JSON dict
+  serialized with json.dumps vs the SDK's proto message serialized to bytes
+
+No network access is needed. If the SDK cannot be imported on this platform
+(its vendored binaries are Windows-only), its columns are reported as n/a.
+
+    python benchmarks/bench_rest_client.py [--calls 20000]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_REST = """
+import time
+t = time.perf_counter()
+import utils.rest_client
+print((time.perf_counter() - t) * 1000)
+"""
+
+IMPORT_SDK = """
+import time
+from utils import vendor
+t = time.perf_counter()
+vendor.load("google.generativeai")
+print((time.perf_counter() - t) * 1000)
+"""
+
+MARSHAL_REST = """
+import json, time
+calls = {calls}
+t = time.perf_counter()
+for i in range(calls):
+    payload = {{"content": {{"parts": [{{"text": "word %d" % i}}]}}, "taskType": "RETRIEVAL_DOCUMENT"}}
+    body = json.dumps(payload).encode("utf-8")
+    json.loads(b'{{"embedding": {{"values": [0.1, 0.2, 0.3]}}}}')
+print((time.perf_counter() - t) * 1e6 / calls)
+"""
+
+MARSHAL_SDK = """
+import time
+from utils import vendor
+protos = vendor.load("google.generativeai.protos")
+calls = {calls}
+reply = protos.EmbedContentResponse(embedding=protos.ContentEmbedding(values=[0.1, 0.2, 0.3]))
+reply_bytes = type(reply).serialize(reply)
+t = time.perf_counter()
+for i in range(calls):
+    request = protos.EmbedContentRequest(
+        model="models/text-embedding-004",
+        content=protos.Content(parts=[protos.Part(text="word %d" % i)]),
+        task_type="RETRIEVAL_DOCUMENT",
+    )
+    body = type(request).serialize(request)
+    protos.EmbedContentResponse.deserialize(reply_bytes)
+print((time.perf_counter() - t) * 1e6 / calls)
+"""
+
+
+def run(code):
+    """Run code in a fresh interpreter from the add-on folder; returns a float or None"""
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ADDON_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def fmt(value, unit):
+    return f"{value:10.2f} {unit}" if value is not None else "       n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {
+        "import_ms": {"rest": run(IMPORT_REST), "sdk": run(IMPORT_SDK)},
+        "marshal_us_per_call": {
+            "rest": run(MARSHAL_REST.format(calls=args.calls)),
+            "sdk": run(MARSHAL_SDK.format(calls=args.calls)),
+        },
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{'':24}{'REST client':>14}{'SDK':>14}")
+    for label, key, unit in (
+        ("import", "import_ms", "ms"),
+        ("marshal per call", "marshal_us_per_call", "us"),
+    ):
+        row = results[key]
+        print(f"{label:24}{fmt(row['rest'], unit)}{fmt(row['sdk'], unit)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
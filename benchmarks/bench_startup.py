@@ -0,0 +1,105 @@
+﻿"""Measure what the add-on costs at Anki startup.
+
+Anki is not needed: a minimal stand-in for the few aqt names used by the
+bootstrap is installed, then the add-on package is imported the way Anki's
+add-on manager does it. Reports wall time and every module the import pulled
+in, and fails if anything from lib/ or the dialog/client was loaded.
+
+    python benchmarks/bench_startup.py [--repeat 20]
+"""
+
+import argparse
+import importlib.util
+import statistics
+import sys
+import time
+import types
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+PACKAGE = "gemini_tts_startup_bench"
+
+# Modules that must stay unloaded until the user opens the dialog.
+DEFERRED = ("requests", "urllib3", "cachetools", "google", "pydantic", "gui", "utils", "_gemini_tts_lib")
+# init_addon sets up logging; utils/log.py imports only the standard library
+STARTUP_MODULES = ("utils", "utils.log")
+
+
+class _Hook(list):
+    append = list.append
+
+
+def install_fake_aqt():
+    """Register just enough of aqt for the bootstrap to run"""
+    menu = types.SimpleNamespace(addAction=lambda action: None)
+    manager = types.SimpleNamespace(getConfig=lambda name: {})
+    mw = types.SimpleNamespace(form=types.SimpleNamespace(menuTools=menu), addonManager=manager)
+
+    aqt = types.ModuleType("aqt")
+    aqt.mw = mw
+    aqt.gui_hooks = types.SimpleNamespace(main_window_did_init=_Hook())
+    aqt_utils = types.ModuleType("aqt.utils")
+    aqt_utils.showInfo = print
+    aqt_utils.qconnect = lambda signal, slot: None
+    aqt_qt = types.ModuleType("aqt.qt")
+    aqt_qt.QAction = lambda *args: types.SimpleNamespace(triggered=None)
+
+    sys.modules.update({"aqt": aqt, "aqt.utils": aqt_utils, "aqt.qt": aqt_qt})
+
+
+def import_addon_once():
+    """Import the add-on under a fresh name; returns (ms, new module names)"""
+    for name in [m for m in sys.modules if m == PACKAGE or m.startswith(PACKAGE + ".")]:
+        del sys.modules[name]
+    before = set(sys.modules)
+
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE, ADDON_DIR / "__init__.py", submodule_search_locations=[str(ADDON_DIR)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = module
+    start = time.perf_counter()
+    spec.loader.exec_module(module)
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, sorted(set(sys.modules) - before - {PACKAGE})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    install_fake_aqt()
+    import io
+    import contextlib
+
+    timings = []
+    new_modules = []
+    for i in range(args.repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, loaded = import_addon_once()
+        timings.append(elapsed)
+        if i == 0:
+            new_modules = loaded
+
+    print(f"add-on import + init over {args.repeat} runs:")
+    print(f"  first: {timings[0]:.2f} ms (includes bytecode load)")
+    print(f"  median: {statistics.median(timings):.2f} ms, max: {max(timings):.2f} ms")
+    print(f"  modules loaded besides the add-on: {len(new_modules)}")
+    for name in new_modules:
+        print(f"    {name}")
+
+    allowed = {f"{PACKAGE}.{name}" for name in STARTUP_MODULES}
+    leaked = [
+        m for m in new_modules
+        if m.split(".")[0] in DEFERRED or (m.startswith(PACKAGE + ".") and m not in allowed)
+    ]
+    if leaked:
+        print(f"FAIL: deferred modules imported at startup: {', '.join(leaked)}")
+        return 1
+    print("OK: nothing from lib/, gui/ or utils/ (besides utils/log.py) was imported at startup")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+﻿"""Local stand-in for the Gemini and Cloud Text-to-Speech HTTP APIs.
+
+Serves the endpoints the add-on calls, with configurable latency, payload
+sizes and injected failures, so client benchmarks need no network or quota:
+
+- POST /v1beta/models/<model>:generateContent      (JSON cards when a responseSchema is sent)
+- POST /v1beta/models/<model>:streamGenerateContent (server-sent events with ?alt=sse)
+- POST /v1beta/models/<model>:embedContent / :batchEmbedContents / :countTokens
+- POST /v1/text:synthesize
+- POST /__control  {"outage": true, "throttle_rate": 0.1, "capacity": 16, ...} changes settings
+  at runtime (e.g. to inject an outage window); GET /__control returns the
+  per-endpoint request counts
+
+Latency specs: "fixed:0.05", "uniform:0.02,0.2", "lognormal:<median>,<sigma>"
+or "exp:<mean>" (seconds). With a capacity, requests beyond that many in
+flight are answered with 429 (like a per-project quota). Use it in-process through MockServer, or standalone:
+
+    python benchmarks/mock_server.py --port 8765 --latency lognormal:0.3,0.5 --throttle-rate 0.02
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a function rng -> seconds"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class MockSettings:
+    """Behaviour of the mock endpoints; attributes may be changed while it runs"""
+
+    def __init__(self, latency="fixed:0.05", text_bytes=800, audio_bytes_per_char=400,
+                 embedding_dim=768, stream_chunks=8, stream_chunk_delay=0.02,
+                 error_rate=0.0, throttle_rate=0.0, outage=False, capacity=0, seed=1):
+        self.latency = parse_latency(latency)
+        self.text_bytes = text_bytes
+        self.audio_bytes_per_char = audio_bytes_per_char
+        self.embedding_dim = embedding_dim
+        self.stream_chunks = stream_chunks
+        self.stream_chunk_delay = stream_chunk_delay
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        # When True every request fails with 503, e.g. to simulate an outage window
+        self.outage = outage
+        # Most requests served at once (0 = unlimited); the rest get 429
+        self.capacity = capacity
+        self.active = 0
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+
+    def draw(self):
+        """Return (latency seconds, status) for one request"""
+        with self.rng_lock:
+            delay = self.latency(self.rng)
+            roll = self.rng.random()
+        if self.outage:
+            return delay, 503
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def enter(self):
+        """Admit a request; False when it is over capacity"""
+        with self.counts_lock:
+            if self.capacity and self.active >= self.capacity:
+                self.counts["over_capacity"] = self.counts.get("over_capacity", 0) + 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self.counts_lock:
+            self.active -= 1
+
+    def count(self, key):
+        with self.counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+_WORDS = "the quick brown fox jumps over a lazy dog while seven wizards quietly hex".split()
+
+
+def _text(size, seed):
+    words = []
+    length = 0
+    i = seed
+    while length < size:
+        word = _WORDS[i % len(_WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        i += 7
+    return " ".join(words)[:size]
+
+
+def _generate_reply(settings, request, seed):
+    config = request.get("generationConfig", {})
+    if config.get("responseMimeType") == "application/json":
+        cards = [
+            {"front": f"Question {seed}-{i}: {_text(40, seed + i)}?", "back": _text(60, seed * 3 + i)}
+            for i in range(max(1, settings.text_bytes // 120))
+        ]
+        text = json.dumps(cards)
+    else:
+        text = _text(settings.text_bytes, seed)
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+        "usageMetadata": {
+            "promptTokenCount": 20,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": 20 + len(text) // 4,
+        },
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this Nagle plus delayed
+    # ACKs add ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, extra_headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/__control":
+            with self.server.settings.counts_lock:
+                return self._send_json(200, dict(self.server.settings.counts))
+        return self._send_json(404, {"error": {"code": 404, "message": f"Unknown endpoint {self.path}"}})
+
+    def do_POST(self):
+        settings = self.server.settings
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON"}})
+
+        path = self.path.split("?", 1)[0]
+        if path == "/__control":
+            for name, value in request.items():
+                if name == "latency":
+                    settings.latency = parse_latency(value)
+                elif name in ("outage", "error_rate", "throttle_rate", "capacity", "text_bytes",
+                              "audio_bytes_per_char"):
+                    setattr(settings, name, value)
+            return self._send_json(200, {"ok": True})
+        method = path.rsplit(":", 1)[-1] if ":" in path.rsplit("/", 1)[-1] else path
+        settings.count(method)
+        delay, status = settings.draw()
+        if not settings.enter():
+            status = 429
+        else:
+            try:
+                time.sleep(delay)
+            finally:
+                settings.leave()
+
+        if status != 200:
+            headers = {"Retry-After": "1"} if status == 429 else None
+            return self._send_json(status, {"error": {"code": status, "message": "Injected failure"}}, headers)
+
+        seed = length
+        if method == "generateContent":
+            return self._send_json(200, _generate_reply(settings, request, seed))
+        if method == "streamGenerateContent":
+            return self._stream(settings, request, seed)
+        if method == "embedContent":
+            return self._send_json(200, {"embedding": {"values": self._vector(settings, seed)}})
+        if method == "batchEmbedContents":
+            vectors = [{"values": self._vector(settings, seed + i)} for i in range(len(request.get("requests", [])))]
+            return self._send_json(200, {"embeddings": vectors})
+        if method == "countTokens":
+            return self._send_json(200, {"totalTokens": length // 4})
+        if method == "synthesize":
+            chars = len(request.get("input", {}).get("text", ""))
+            audio = bytes(max(1, chars * settings.audio_bytes_per_char))
+            return self._send_json(200, {"audioContent": base64.b64encode(audio).decode("ascii")})
+        return self._send_json(404, {"error": {"code": 404, "message": f"Unknown endpoint {self.path}"}})
+
+    @staticmethod
+    def _vector(settings, seed):
+        return [((seed * 31 + i * 17) % 1000) / 1000.0 - 0.5 for i in range(settings.embedding_dim)]
+
+    def _stream(self, settings, request, seed):
+        text = _generate_reply(settings, request, seed)["candidates"][0]["content"]["parts"][0]["text"]
+        chunk_size = max(1, len(text) // settings.stream_chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(text), chunk_size):
+            piece = {"candidates": [{"content": {"role": "model", "parts": [{"text": text[start:start + chunk_size]}]}}]}
+            self.wfile.write(f"data: {json.dumps(piece)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(settings.stream_chunk_delay)
+        self.close_connection = True
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # listen() backlog; has to be set before the socket is bound
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-response (killed benchmark processes) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockServer:
+    """The mock API on a background thread; use as a context manager"""
+
+    def __init__(self, host="127.0.0.1", port=0, **settings):
+        self.settings = MockSettings(**settings)
+        self.httpd = _QuietHTTPServer((host, port), MockHandler)
+        self.httpd.settings = self.settings
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def configure_client(self, client):
+        """Point a GeminiClient at this server"""
+        client.base_url = f"{self.url}/v1beta"
+        client.tts_url = f"{self.url}/v1/text:synthesize"
+        return client
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_settings_arguments(parser):
+    """Mock behaviour flags shared by the benchmark scripts"""
+    parser.add_argument("--latency", default="lognormal:0.05,0.4", help="server latency spec (seconds)")
+    parser.add_argument("--text-bytes", type=int, default=800, help="generated text size")
+    parser.add_argument("--audio-bytes-per-char", type=int, default=400, help="TTS audio size per input character")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests failing with 429")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="requests served at once; more get 429 (0 = unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def settings_from_args(args):
+    return {
+        "latency": args.latency,
+        "text_bytes": args.text_bytes,
+        "audio_bytes_per_char": args.audio_bytes_per_char,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "capacity": args.capacity,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(args.host, args.port, **settings_from_args(args))
+    print(f"Mock Gemini/TTS API on {server.url} (Ctrl+C to stop)", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
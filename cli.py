@@ -0,0 +1,349 @@
+﻿"""Run bulk TTS or template generation outside Anki.
+
+    python -m gemini_tts.cli tts deck.csv --field Front --target Audio -o out.csv --media-dir media/
+    python -m gemini_tts.cli generate deck.apkg --field Front --target Example \\
+        --template "Write one example sentence using: {text}" -o out.apkg
+
+Input is a CSV/TSV file with a header row or an .apkg exported with
+"Support older Anki versions"; the output is an updated copy of it. Audio
+goes to --media-dir (and into the .apkg) as [sound:...] tags.
+
+Uses the same engine, job store, audio cache and result cache as the add-on.
+Re-running an interrupted command resumes it; Ctrl+C stops after the requests
+in flight and saves progress. For very large CSV/TSV files, --stream writes
+the output in a single pass with a bounded window of rows in memory (see
+utils/stream_pipeline.py) instead of tracking every row in the job store.
+
+    python -m gemini_tts.cli serve
+
+runs the shared localhost daemon (utils/daemon.py). While it runs, the
+tts/generate commands (with --daemon) and the add-on (with "use_daemon": true
+in its config) send their requests through it, so they share one connection
+pool, cache and rate limit.
+
+The API key comes from --api-key, GEMINI_API_KEY, or the add-on config;
+further keys in the config's "api_keys" are used alongside it (see
+utils/key_pool.py).
+"""
+
+import os
+import sys
+import json
+import shutil
+import signal
+import hashlib
+import argparse
+from pathlib import Path
+
+from .utils import log
+from .utils.bulk_jobs import (
+    DEFAULT_AUDIO_CACHE_DIR, DEFAULT_DB_PATH, BulkRunner, GenerateTask, JobStore, TtsTask,
+)
+from .utils.gemini_client import GeminiClient, get_session
+from .utils.note_files import OutputStore, open_notes
+
+addon_dir = Path(__file__).parent
+
+
+def load_config():
+    """config.json defaults overlaid with the user's settings from meta.json"""
+    config = {}
+    for name, key in (("config.json", None), ("meta.json", "config")):
+        try:
+            with open(addon_dir / name, encoding="utf-8-sig") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        config.update(data.get(key, {}) if key else data)
+    return config
+
+
+def build_task(args, config):
+    if args.command == "tts":
+        return TtsTask(args.media_dir, voice_name=args.voice, cache_dir=args.audio_cache or None)
+    return GenerateTask(
+        template=args.template,
+        model=args.model or config.get("model", "gemini-2.5-flash"),
+        temperature=config.get("temperature", 0.7) if args.temperature is None else args.temperature,
+        max_tokens=args.max_tokens or config.get("max_tokens", 1024),
+        system_instruction=args.system,
+    )
+
+
+def default_job_id(args, task):
+    """Same input, fields and settings -> same job, so re-running resumes"""
+    key = json.dumps(
+        [str(Path(args.input).resolve()), str(Path(args.output).resolve()), args.field, args.target,
+         task.params()],
+        sort_keys=True,
+    )
+    return f"cli-{task.kind}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+
+def describe_progress(stats, limiter):
+    text = f"{stats.done} done, {stats.failed} failed"
+    if limiter is not None:
+        text += f", {limiter.in_flight} in flight (limit {limiter.limit})"
+    return text
+
+
+def render_output(command, for_apkg):
+    if command == "tts":
+        return lambda name: f"[sound:{name}]"
+    if for_apkg:
+        return lambda text: text.strip().replace("\n", "<br>")
+    return lambda text: text.strip()
+
+
+def make_client(args, config, api_key, result_cache=None, pool_size=32):
+    from .utils.key_pool import get_key_pool
+
+    # One connection per worker, so none waits for a free socket
+    session = get_session(pool_size=max(32, pool_size))
+    client = GeminiClient(
+        api_key, result_cache=result_cache, session=session, key_pool=get_key_pool(config, api_key)
+    )
+    if args.base_url:
+        client.base_url = args.base_url.rstrip("/")
+    if args.tts_url:
+        client.tts_url = args.tts_url
+    return client
+
+
+def serve(args, config, api_key):
+    """The serve command: run the daemon until Ctrl+C"""
+    from .utils.daemon import DaemonServer, DaemonService
+    from .utils.result_cache import get_result_cache
+
+    result_cache = get_result_cache(config) if config.get("cache_enabled", True) else None
+    client = make_client(args, config, api_key, result_cache, pool_size=args.pool_size)
+    limits = dict(config.get("daemon_requests_per_minute") or {})
+    if args.generate_rpm is not None:
+        limits["generate"] = args.generate_rpm
+    if args.tts_rpm is not None:
+        limits["tts"] = args.tts_rpm
+    service = DaemonService(client, audio_dir=args.audio_cache, limits=limits)
+    try:
+        server = DaemonServer(service, host=args.host, port=args.port)
+    except OSError as e:
+        print(f"Cannot listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 2
+    print(f"Gemini TTS daemon on {server.url} (limits per minute: {limits or 'none'}); Ctrl+C to stop",
+          flush=True)
+    def on_terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    # kill/systemd stop the daemon like Ctrl+C, so daemon.json is removed
+    signal.signal(signal.SIGTERM, on_terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(service.stats()))
+    return 0
+
+
+def run_stream(args, client, task, output, limiter):
+    """--stream: one pass through the file, resuming from <output>.part if present"""
+    from .utils.stream_pipeline import StreamPipeline
+
+    pipeline = StreamPipeline(
+        client, task, args.field, args.target, workers=args.workers, window=args.window,
+        max_retries=args.max_retries, overwrite=args.overwrite, render=render_output(args.command, False),
+        limiter=limiter,
+    )
+
+    def on_interrupt(signum, frame):
+        print("\nStopping after the rows in flight...", file=sys.stderr)
+        pipeline.stop()
+
+    def progress(stats):
+        print(f"\r{stats.read} rows read, {describe_progress(stats, limiter)}, {stats.cached} cached, "
+              f"{stats.retries} retries", end="", file=sys.stderr, flush=True)
+
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        stats = pipeline.run(args.input, output, delimiter=args.delimiter, progress=progress)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    print(file=sys.stderr)
+
+    stopped = pipeline.stop_event.is_set()
+    print(f"{stats['done']} rows filled in {output if not stopped else str(output) + '.part'} "
+          f"({stats['failed']} failed, {stats['cached']} from cache, {stats['wall_s']} s)")
+    if stopped:
+        print("Stopped; run the same command again to continue", file=sys.stderr)
+    elif stats["failed"]:
+        print(f"Failed rows were left empty; run the output through again to fill them "
+              f"(errors are in {log.LOG_FILE})", file=sys.stderr)
+    return 0 if not stopped and not stats["failed"] else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m gemini_tts.cli", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    from .utils.daemon import DEFAULT_PORT
+
+    p = sub.add_parser("serve", help="run the shared localhost daemon")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--pool-size", type=int, default=64, help="upstream connections")
+    p.add_argument("--generate-rpm", type=int, help="text requests per minute upstream (0 = unlimited)")
+    p.add_argument("--tts-rpm", type=int, help="TTS requests per minute upstream (0 = unlimited)")
+    p.add_argument("--audio-cache", default=str(DEFAULT_AUDIO_CACHE_DIR))
+    p.add_argument("--api-key")
+    p.add_argument("--base-url", help="Gemini API base (e.g. a proxy or benchmarks/mock_server.py)")
+    p.add_argument("--tts-url", help="text:synthesize endpoint")
+    p.add_argument("--log-level", default="INFO", help="level written to user_files/gemini_tts.log")
+    p.add_argument("-v", "--verbose", action="store_true", help="echo warnings and errors to stderr")
+
+    for name, help_text in (("tts", "synthesize a field to audio"), ("generate", "fill a field from a prompt")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("input", help=".csv, .tsv or .apkg")
+        p.add_argument("-o", "--output", required=True, help="updated copy of the input")
+        p.add_argument("--field", required=True, help="column/field with the source text")
+        p.add_argument("--target", required=True, help="column/field to fill")
+        p.add_argument("--overwrite", action="store_true", help="also redo notes whose target is not empty")
+        p.add_argument("--delimiter", help="input CSV delimiter (default: tab for .tsv/.txt, else comma; "
+                            "the output's delimiter follows its own extension)")
+        p.add_argument("--workers", type=int,
+                       help="most requests in flight; the limit adapts below it to throttling and latency "
+                            "(default: adaptive_concurrency in the config)")
+        p.add_argument("--fixed-workers", action="store_true",
+                       help="keep exactly --workers requests in flight (default: 8 per CPU, at most 64)")
+        p.add_argument("--api-key")
+        p.add_argument("--base-url", help="Gemini API base (e.g. a proxy or benchmarks/mock_server.py)")
+        p.add_argument("--tts-url", help="text:synthesize endpoint")
+        p.add_argument("--daemon", action="store_true",
+                       help="send requests through a running daemon (default: config use_daemon)")
+        p.add_argument("--job-id", help="default: derived from the input, output, fields and settings")
+        p.add_argument("--job-store", default=str(DEFAULT_DB_PATH))
+        p.add_argument("--max-retries", type=int, default=5)
+        p.add_argument("--stream", action="store_true", help="single pass, bounded memory (CSV/TSV only)")
+        p.add_argument("--window", type=int, default=1024,
+                       help="rows held between reader and writer with --stream; a row waiting on a "
+                            "retry holds back the rows after it, so keep this well above --workers")
+        p.add_argument("--profile", action="store_true", help="write profiles to user_files/profiles/")
+        p.add_argument("--log-level", default="INFO", help="level written to user_files/gemini_tts.log")
+        p.add_argument("-v", "--verbose", action="store_true", help="echo warnings and errors to stderr")
+        if name == "tts":
+            p.add_argument("--media-dir", help="where audio files go (default: <output>.media/)")
+            p.add_argument("--voice", default="en-US-Wavenet-D")
+            p.add_argument("--audio-cache", default=str(DEFAULT_AUDIO_CACHE_DIR),
+                           help="audio shared between jobs ('' to disable)")
+        else:
+            p.add_argument("--template", default="{text}", help="prompt; {text} is the source field")
+            p.add_argument("--system", help="system instruction")
+            p.add_argument("--model")
+            p.add_argument("--temperature", type=float)
+            p.add_argument("--max-tokens", type=int)
+            p.add_argument("--no-cache", action="store_true", help="do not use the result cache")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    log.setup(args.log_level)
+    # Retried 429s are logged as errors; only the progress line goes to the terminal
+    log.set_console_level("WARNING" if args.verbose else "CRITICAL")
+    config = load_config()
+
+    api_key = args.api_key or os.environ.get("GEMINI_API_KEY") or config.get("api_key")
+    if not api_key:
+        print("No API key: pass --api-key, set GEMINI_API_KEY or configure the add-on", file=sys.stderr)
+        return 2
+    if args.command == "serve":
+        return serve(args, config, api_key)
+    output = Path(args.output)
+    if args.command == "tts" and not args.media_dir:
+        args.media_dir = f"{output}.media"
+    workdir = Path(f"{output}.work")
+
+    try:
+        if args.stream and Path(args.input).suffix.lower() == ".apkg":
+            raise ValueError("--stream reads CSV/TSV files only")
+        notes = open_notes(args.input, workdir, args.delimiter)
+        notes.check_fields(args.field, args.target)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.input}: {e}", file=sys.stderr)
+        return 2
+
+    result_cache = None
+    if args.command == "generate" and not args.no_cache and config.get("cache_enabled", True):
+        from .utils.result_cache import get_result_cache
+
+        result_cache = get_result_cache(config)
+    limiter = None
+    if not args.fixed_workers:
+        from .utils.concurrency import get_limiter
+
+        limiter = get_limiter(args.command, config, max_limit=args.workers)
+    if limiter is not None:
+        args.workers = limiter.max_limit
+    elif not args.workers:
+        args.workers = min(64, (os.cpu_count() or 1) * 8)
+    client = make_client(args, config, api_key, result_cache, pool_size=args.workers)
+    if args.daemon or config.get("use_daemon"):
+        from .utils.daemon import get_daemon
+
+        client.daemon = get_daemon()
+        if client.daemon is not None:
+            print(f"Using the daemon at {client.daemon.url}", file=sys.stderr)
+
+    task = build_task(args, config)
+    if args.stream:
+        return run_stream(args, client, task, output, limiter)
+    job_id = args.job_id or default_job_id(args, task)
+    workdir.mkdir(parents=True, exist_ok=True)
+    outputs = OutputStore(workdir / "outputs.sqlite3")
+    store = JobStore(args.job_store)
+    runner = BulkRunner(
+        client, task, job_id, store=store, workers=args.workers, max_retries=args.max_retries,
+        profile=args.profile, limiter=limiter,
+    )
+
+    def on_interrupt(signum, frame):
+        print("\nStopping after the requests in flight...", file=sys.stderr)
+        runner.stop()
+
+    def progress(stats):
+        print(f"\r{job_id}: {describe_progress(stats, limiter)}, {stats.skipped} already done, "
+              f"{stats.retries} retries", end="", file=sys.stderr, flush=True)
+
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        stats = runner.run(notes.items(args.field, args.target, args.overwrite), sink=outputs.put_many,
+                           progress=progress)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    print(file=sys.stderr)
+
+    if args.command == "tts" and hasattr(notes, "add_media"):
+        media_dir = Path(args.media_dir)
+        for name in sorted(set(outputs.values())):
+            notes.add_media(media_dir / name)
+    updated = notes.write(output, outputs, args.target, render_output(args.command, output.suffix == ".apkg"))
+
+    complete = stats["failed"] == 0 and not runner.stop_event.is_set()
+    if complete:
+        # Everything is in the output; a later run with the same arguments starts over
+        outputs.delete()
+        store.delete_job(job_id)
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        outputs.close()
+    store.close()
+
+    print(f"{updated} notes updated in {output} ({stats['done']} done, {stats['failed']} failed, "
+          f"{stats['cached']} from cache, {stats['wall_s']} s)")
+    if not complete:
+        print(f"Job {job_id} is incomplete; run the same command again to resume "
+              f"(errors are in {log.LOG_FILE})", file=sys.stderr)
+    for kind, path in stats.get("profile", {}).items():
+        print(f"profile {kind}: {path}")
+    return 0 if complete else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,12 @@
-﻿from aqt.qt import *
+﻿import aqt
+from aqt.qt import *
 from aqt.utils import showInfo
 from aqt import mw
-import sys
 from pathlib import Path
 
-# Make Gemini client importable
-addon_dir = Path(__file__).parent.parent
-sys.path.insert(0, str(addon_dir))
+from ..utils.log import get_logger
+
+log = get_logger(__name__)
 
 
 class GeminiDialog(QDialog):
@@ -14,9 +14,14 @@ class GeminiDialog(QDialog):
         super().__init__(parent)
         self.setWindowTitle("Gemini TTS & AI Assistant")
         self.setMinimumSize(500, 400)
+        self.doc_file = None
         self.setup_ui()
         self.load_config()
 
+        self.perf_timer = QTimer(self)
+        self.perf_timer.setInterval(2000)
+        self.perf_timer.timeout.connect(self.refresh_performance)
+
     # -----------------------------
     # UI SETUP
     # -----------------------------
@@ -51,6 +56,8 @@ class GeminiDialog(QDialog):
         self.prompt_input.setMaximumHeight(100)
 
         self.generate_btn = QPushButton("Generate Text")
+        self.bypass_cache_check = QCheckBox("Bypass result cache")
+        self.ground_check = QCheckBox("Ground on my collection (related notes as context)")
 
         self.result_output = QTextEdit()
         self.result_output.setReadOnly(True)
@@ -58,6 +65,8 @@ class GeminiDialog(QDialog):
         text_layout.addWidget(QLabel("Prompt:"))
         text_layout.addWidget(self.prompt_input)
         text_layout.addWidget(self.generate_btn)
+        text_layout.addWidget(self.bypass_cache_check)
+        text_layout.addWidget(self.ground_check)
         text_layout.addWidget(QLabel("Result:"))
         text_layout.addWidget(self.result_output)
         text_group.setLayout(text_layout)
@@ -77,14 +86,43 @@ class GeminiDialog(QDialog):
         tts_layout.addWidget(self.tts_btn)
         tts_group.setLayout(tts_layout)
 
+        # --- Document to cards section ---
+        doc_group = QGroupBox("Document to Cards")
+        doc_layout = QVBoxLayout()
+
+        self.doc_input = QTextEdit()
+        self.doc_input.setPlaceholderText("Paste a long text, or load a text or PDF file…")
+        self.doc_input.setMaximumHeight(80)
+
+        doc_button_layout = QHBoxLayout()
+        self.load_doc_btn = QPushButton("Load Document…")
+        self.cards_btn = QPushButton("Generate Cards")
+        doc_button_layout.addWidget(self.load_doc_btn)
+        doc_button_layout.addWidget(self.cards_btn)
+
+        doc_layout.addWidget(self.doc_input)
+        doc_layout.addLayout(doc_button_layout)
+        doc_group.setLayout(doc_layout)
+
         # --- Status label ---
         self.status_label = QLabel("Ready")
         self.status_label.setStyleSheet("color: blue;")
 
         # Assemble main layout
-        layout.addWidget(api_group)
-        layout.addWidget(text_group)
-        layout.addWidget(tts_group)
+        assistant_tab = QWidget()
+        assistant_layout = QVBoxLayout()
+        assistant_layout.addWidget(api_group)
+        assistant_layout.addWidget(text_group)
+        assistant_layout.addWidget(tts_group)
+        assistant_layout.addWidget(doc_group)
+        assistant_tab.setLayout(assistant_layout)
+
+        self.tabs = QTabWidget()
+        self.tabs.addTab(assistant_tab, "Assistant")
+        self.tabs.addTab(self.setup_performance_tab(), "Performance")
+        self.tabs.addTab(self.setup_log_tab(), "Log")
+
+        layout.addWidget(self.tabs)
         layout.addWidget(self.status_label)
 
         # Close button
@@ -99,6 +137,220 @@ class GeminiDialog(QDialog):
         self.test_api_btn.clicked.connect(self.test_connection)
         self.generate_btn.clicked.connect(self.generate_text)
         self.tts_btn.clicked.connect(self.generate_tts)
+        self.load_doc_btn.clicked.connect(self.load_document)
+        self.cards_btn.clicked.connect(self.generate_cards)
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        self.perf_refresh_btn.clicked.connect(self.refresh_performance)
+        self.perf_export_btn.clicked.connect(self.export_performance)
+        self.perf_reset_btn.clicked.connect(self.reset_performance)
+        self.log_level_combo.currentTextChanged.connect(self.refresh_log)
+        self.log_refresh_btn.clicked.connect(self.refresh_log)
+        self.log_clear_btn.clicked.connect(self.clear_log)
+
+    PERF_COLUMNS = (
+        ("Requests", "requests"),
+        ("Req/s", "rps"),
+        ("p50 ms", "p50_ms"),
+        ("p90 ms", "p90_ms"),
+        ("p99 ms", "p99_ms"),
+        ("Errors", "error_rate"),
+        ("429s", "throttle_rate"),
+        ("Chars/s", "chars_per_s"),
+        ("Tokens/s", "tokens_per_s"),
+    )
+
+    def setup_performance_tab(self):
+        """Rolling latency/throughput table fed by utils.perf_stats"""
+        tab = QWidget()
+        perf_layout = QVBoxLayout()
+
+        self.perf_window_label = QLabel("No requests yet")
+        self.perf_table = QTableWidget(0, len(self.PERF_COLUMNS))
+        self.perf_table.setHorizontalHeaderLabels([title for title, _ in self.PERF_COLUMNS])
+        self.perf_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.perf_cache_label = QLabel("Result cache: –")
+        self.perf_concurrency_label = QLabel("Concurrency: –")
+        self.perf_hedge_label = QLabel("Hedged requests: –")
+
+        self.perf_recent = QPlainTextEdit()
+        self.perf_recent.setReadOnly(True)
+        self.perf_recent.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+
+        perf_button_layout = QHBoxLayout()
+        self.perf_refresh_btn = QPushButton("Refresh")
+        self.perf_export_btn = QPushButton("Export JSON")
+        self.perf_reset_btn = QPushButton("Reset")
+        perf_button_layout.addWidget(self.perf_refresh_btn)
+        perf_button_layout.addWidget(self.perf_export_btn)
+        perf_button_layout.addWidget(self.perf_reset_btn)
+
+        perf_layout.addWidget(self.perf_window_label)
+        perf_layout.addWidget(self.perf_table)
+        perf_layout.addWidget(self.perf_cache_label)
+        perf_layout.addWidget(self.perf_concurrency_label)
+        perf_layout.addWidget(self.perf_hedge_label)
+        perf_layout.addWidget(QLabel("Recent requests (ms per phase):"))
+        perf_layout.addWidget(self.perf_recent)
+        perf_layout.addLayout(perf_button_layout)
+        tab.setLayout(perf_layout)
+        return tab
+
+    def setup_log_tab(self):
+        """Latest add-on log records from the in-memory ring buffer"""
+        tab = QWidget()
+        log_layout = QVBoxLayout()
+
+        self.log_output = QPlainTextEdit()
+        self.log_output.setReadOnly(True)
+        self.log_output.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+
+        log_button_layout = QHBoxLayout()
+        self.log_level_combo = QComboBox()
+        self.log_level_combo.addItems(["DEBUG", "INFO", "WARNING", "ERROR"])
+        self.log_level_combo.setCurrentText("INFO")
+        self.log_refresh_btn = QPushButton("Refresh")
+        self.log_clear_btn = QPushButton("Clear")
+        log_button_layout.addWidget(QLabel("Show from level:"))
+        log_button_layout.addWidget(self.log_level_combo)
+        log_button_layout.addWidget(self.log_refresh_btn)
+        log_button_layout.addWidget(self.log_clear_btn)
+
+        log_layout.addWidget(self.log_output)
+        log_layout.addLayout(log_button_layout)
+        tab.setLayout(log_layout)
+        return tab
+
+    # -----------------------------
+    # PERFORMANCE
+    # -----------------------------
+    def on_tab_changed(self, index):
+        """Only poll the stats while the Performance tab is shown"""
+        name = self.tabs.tabText(index)
+        if name == "Performance":
+            self.refresh_performance()
+            self.perf_timer.start()
+        else:
+            self.perf_timer.stop()
+        if name == "Log":
+            self.refresh_log()
+
+    def cache_stats(self):
+        """Result cache counters, or None when the cache is disabled"""
+        addon_name = Path(__file__).parent.parent.name
+        config = mw.addonManager.getConfig(addon_name) or {}
+        if not config.get("cache_enabled", True):
+            return None
+        from ..utils.result_cache import get_result_cache
+
+        return get_result_cache(config).stats()
+
+    def refresh_performance(self):
+        """Redraw the Performance tab from the current snapshot"""
+        from ..utils import concurrency, hedging, metrics
+        from ..utils.perf_stats import get_perf_stats
+
+        snapshot = get_perf_stats().snapshot()
+        rows = [("All", snapshot["overall"])] + list(snapshot["endpoints"].items())
+        self.perf_table.setRowCount(len(rows))
+        self.perf_table.setVerticalHeaderLabels([name for name, _ in rows])
+        for row, (_, summary) in enumerate(rows):
+            for column, (_, key) in enumerate(self.PERF_COLUMNS):
+                value = summary[key]
+                if value is None:
+                    text = "–"
+                elif key in ("error_rate", "throttle_rate"):
+                    text = f"{value * 100:.1f}%"
+                else:
+                    text = str(value)
+                self.perf_table.setItem(row, column, QTableWidgetItem(text))
+
+        self.perf_window_label.setText(
+            f"Last {snapshot['window_seconds']:.0f} s "
+            f"({snapshot['lifetime']['overall']['requests']} requests since start)"
+        )
+
+        stats = self.cache_stats()
+        if stats is None:
+            self.perf_cache_label.setText("Result cache: disabled")
+        else:
+            self.perf_cache_label.setText(
+                f"Result cache: {stats['hit_ratio'] * 100:.1f}% hits "
+                f"({stats['hits']} hits, {stats['misses']} misses)"
+            )
+
+        limits = concurrency.limiters()
+        if not limits:
+            self.perf_concurrency_label.setText("Concurrency: no adaptive limits in use yet")
+        else:
+            self.perf_concurrency_label.setText("Concurrency: " + "; ".join(
+                f"{name} limit {c['limit']} (of {c['max']}), {c['in_flight']} in flight, "
+                f"latency {c['recent_ms'] if c['recent_ms'] is not None else '–'} ms "
+                f"vs {c['baseline_ms'] if c['baseline_ms'] is not None else '–'} ms baseline"
+                for name, c in limits.items()
+            ))
+
+        hedges = hedging.hedge_status()
+        if hedges is None:
+            self.perf_hedge_label.setText("Hedged requests: none yet")
+        else:
+            self.perf_hedge_label.setText(
+                f"Hedged requests: {hedges['hedged']} of {hedges['requests']} "
+                f"({hedges['hedge_won']} answered first, {hedges['over_budget']} skipped over budget)"
+            )
+
+        self.perf_recent.setPlainText(
+            "\n".join(t.summary() for t in reversed(metrics.registry.recent(50)))
+        )
+
+    def export_performance(self):
+        """Write the current statistics to a JSON file in user_files"""
+        from ..utils.concurrency import limiters
+        from ..utils.hedging import hedge_status
+        from ..utils.perf_stats import get_perf_stats
+
+        try:
+            path = get_perf_stats().export_json(
+                extra={
+                    "result_cache": self.cache_stats(),
+                    "concurrency": limiters(),
+                    "hedging": hedge_status(),
+                }
+            )
+        except Exception as e:
+            showInfo(f"Export failed:\n{str(e)}")
+            return
+        self.status_label.setText(f"Performance data exported to {path}")
+        self.status_label.setStyleSheet("color: green;")
+
+    def reset_performance(self):
+        from ..utils import metrics
+        from ..utils.perf_stats import get_perf_stats
+
+        get_perf_stats().reset()
+        metrics.registry.clear()
+        self.refresh_performance()
+
+    # -----------------------------
+    # LOG
+    # -----------------------------
+    def refresh_log(self):
+        """Show the buffered log records at or above the selected level"""
+        import logging
+        from ..utils.log import ring_buffer
+
+        level = logging.getLevelName(self.log_level_combo.currentText())
+        buffer = ring_buffer()
+        lines = buffer.lines(limit=500, level=level) if buffer is not None else []
+        self.log_output.setPlainText("\n".join(lines))
+        self.log_output.moveCursor(QTextCursor.MoveOperation.End)
+
+    def clear_log(self):
+        from ..utils.log import ring_buffer
+
+        buffer = ring_buffer()
+        if buffer is not None:
+            buffer.clear()
+        self.log_output.clear()
 
     # -----------------------------
     # CONFIG HANDLING
@@ -132,66 +384,137 @@ class GeminiDialog(QDialog):
     # GEMINI CONNECTION
     # -----------------------------
     def test_connection(self):
-        """Test Gemini API connection"""
-        try:
-            api_key = self.api_input.text().strip()
-            if not api_key:
-                showInfo("Please enter an API key first")
-                return
+        """Test Gemini API connection; the request and runtime checks run in the background"""
+        api_key = self.api_input.text().strip()
+        if not api_key:
+            showInfo("Please enter an API key first")
+            return
 
-            self.status_label.setText("Testing connection…")
-            self.status_label.setStyleSheet("color: orange;")
+        self.status_label.setText("Testing connection…")
+        self.status_label.setStyleSheet("color: orange;")
+        self.test_api_btn.setEnabled(False)
+
+        def task():
+            from ..utils.gemini_client import GeminiClient
+            from ..utils.runtime_info import describe
 
-            from utils.gemini_client import GeminiClient
+            success, message = GeminiClient(api_key).test_connection()
+            # describe() walks lib/ and may import the SDK
+            return success, message, describe()
 
-            client = GeminiClient(api_key)
-            success, message = client.test_connection()
+        def on_done(future):
+            self.test_api_btn.setEnabled(True)
+            try:
+                success, message, runtime = future.result()
+            except Exception as e:
+                self.status_label.setText("Connection test failed")
+                self.status_label.setStyleSheet("color: red;")
+                showInfo(f"Connection test error:\n{str(e)}")
+                log.error("Connection test error: %s", e)
+                return
 
+            log.info("Runtime: %s", runtime)
             if success:
                 self.status_label.setText("Connection successful!")
                 self.status_label.setStyleSheet("color: green;")
-                showInfo("Connection test successful!")
+                showInfo(f"Connection test successful!\n\nRuntime: {runtime}")
             else:
                 msg = message or "Unknown connection error"
                 self.status_label.setText(f"Connection failed: {msg}")
                 self.status_label.setStyleSheet("color: red;")
                 showInfo(f"Connection test failed:\n{msg}")
 
-        except Exception as e:
-            self.status_label.setText("Connection test failed")
-            self.status_label.setStyleSheet("color: red;")
-            showInfo(f"Connection test error:\n{str(e)}")
-            print(f"GeminiTTS Connection Error: {e}")
+        mw.taskman.run_in_background(task, on_done)
 
     # -----------------------------
     # TEXT GENERATION
     # -----------------------------
     def generate_text(self):
-        """Generate text using Gemini"""
-        try:
-            api_key = self.api_input.text().strip()
-            prompt = self.prompt_input.toPlainText().strip()
-
-            if not api_key:
-                showInfo("Please enter an API key first")
-                return
+        """Generate text using Gemini; grounding and the request run in the background"""
+        api_key = self.api_input.text().strip()
+        prompt = self.prompt_input.toPlainText().strip()
 
-            if not prompt:
-                showInfo("Please enter a prompt")
-                return
+        if not api_key:
+            showInfo("Please enter an API key first")
+            return
 
-            self.status_label.setText("Generating text…")
-            self.status_label.setStyleSheet("color: orange;")
-            self.generate_btn.setEnabled(False)
+        if not prompt:
+            showInfo("Please enter a prompt")
+            return
 
-            from utils.gemini_client import GeminiClient
+        try:
+            from ..utils.daemon import get_daemon
+            from ..utils.gemini_client import GeminiClient
+            from ..utils.hedging import get_hedge_policy
+            from ..utils.key_pool import get_key_pool
+            from ..utils.result_cache import get_result_cache
+
+            addon_name = Path(__file__).parent.parent.name
+            config = mw.addonManager.getConfig(addon_name) or {}
+            cache = get_result_cache(config) if config.get("cache_enabled", True) else None
+
+            retriever = None
+            ground = self.ground_check.isChecked()
+            if ground:
+                from .. import current_note_id
+                from ..utils.embedding_index import get_collection_retriever
+
+                retriever = get_collection_retriever(mw.pm.name, lambda: mw.col.db)
+
+            client = GeminiClient(
+                api_key, result_cache=cache, retriever=retriever, daemon=get_daemon(config),
+                key_pool=get_key_pool(config, api_key), hedge=get_hedge_policy(config),
+            )
+        except Exception as e:
+            self.result_output.setText(f"Unexpected error: {str(e)}")
+            self.status_label.setText("Text generation failed")
+            self.status_label.setStyleSheet("color: red;")
+            log.exception("Text generation error: %s", e)
+            return
 
-            client = GeminiClient(api_key)
-            result, error = client.generate_text(prompt)
+        index_building = False
+        exclude_notes = ()
+        if retriever is not None:
+            # Ground on the index as it is now; changes since the last sync are
+            # picked up in the background for the next request.
+            retriever.sync_in_background(mw.taskman.run_in_background)
+            index_building = not len(retriever.index)
+            # The note open in the editor would otherwise be its own best match
+            note_id = current_note_id()
+            exclude_notes = (note_id,) if note_id else ()
+
+        use_cache = not self.bypass_cache_check.isChecked()
+        self.status_label.setText("Generating text…")
+        self.status_label.setStyleSheet("color: orange;")
+        self.generate_btn.setEnabled(False)
+
+        def task():
+            return client.generate_text(
+                prompt,
+                template="dialog",
+                use_cache=use_cache,
+                ground=ground,
+                top_k=config.get("rag_top_k", 5),
+                exclude_notes=exclude_notes,
+            )
+
+        def on_done(future):
+            self.generate_btn.setEnabled(True)
+            try:
+                result, error = future.result()
+            except Exception as e:
+                self.result_output.setText(f"Unexpected error: {str(e)}")
+                self.status_label.setText("Text generation failed")
+                self.status_label.setStyleSheet("color: red;")
+                log.exception("Text generation error: %s", e)
+                return
 
             if result and result.strip():
                 self.result_output.setText(str(result))
-                self.status_label.setText("Text generated successfully")
+                if index_building:
+                    self.status_label.setText("Text generated (collection index is still being built, not grounded)")
+                else:
+                    self.status_label.setText("Text generated successfully")
                 self.status_label.setStyleSheet("color: green;")
             else:
                 error_msg = error or "No response received"
@@ -199,13 +522,7 @@ class GeminiDialog(QDialog):
                 self.status_label.setText("Text generation failed")
                 self.status_label.setStyleSheet("color: red;")
 
-        except Exception as e:
-            self.result_output.setText(f"Unexpected error: {str(e)}")
-            self.status_label.setText("Text generation failed")
-            self.status_label.setStyleSheet("color: red;")
-            print(f"GeminiTTS GUI Error: {e}")
-        finally:
-            self.generate_btn.setEnabled(True)
+        mw.taskman.run_in_background(task, on_done)
 
     # -----------------------------
     # TTS GENERATION
@@ -232,21 +549,25 @@ class GeminiDialog(QDialog):
             self.status_label.setStyleSheet("color: orange;")
             self.tts_btn.setEnabled(False)
 
-            from utils.gemini_client import GeminiClient
+            from ..utils.daemon import get_daemon
+            from ..utils.gemini_client import GeminiClient
+            from ..utils.hedging import get_hedge_policy
+            from ..utils.key_pool import get_key_pool
 
-            client = GeminiClient(api_key)
-            audio_data, error = client.generate_tts_audio(text)
-
-            if audio_data:
-                import tempfile
-                import os
+            import tempfile
+            import os
 
-                temp_dir = tempfile.gettempdir()
-                audio_file = os.path.join(temp_dir, "anki_tts_output.mp3")
+            temp_dir = tempfile.gettempdir()
+            audio_file = os.path.join(temp_dir, "anki_tts_output.mp3")
 
-                with open(audio_file, "wb") as f:
-                    f.write(audio_data)
+            config = mw.addonManager.getConfig(Path(__file__).parent.parent.name) or {}
+            client = GeminiClient(
+                api_key, daemon=get_daemon(config), key_pool=get_key_pool(config, api_key),
+                hedge=get_hedge_policy(config),
+            )
+            audio_data, error = client.generate_tts_audio(text, out_path=audio_file)
 
+            if audio_data:
                 self.status_label.setText("Speech generated successfully!")
                 self.status_label.setStyleSheet("color: green;")
 
@@ -280,10 +601,135 @@ class GeminiDialog(QDialog):
             self.status_label.setText("TTS generation failed")
             self.status_label.setStyleSheet("color: red;")
             showInfo(f"TTS error:\n{str(e)}")
-            print(f"GeminiTTS GUI TTS Error: {e}")
+            log.exception("TTS error: %s", e)
         finally:
             self.tts_btn.setEnabled(True)
 
+    # -----------------------------
+    # DOCUMENT TO CARDS
+    # -----------------------------
+    def load_document(self):
+        """Load a text file into the document box, or pick a PDF to upload"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Load Document", "", "Documents (*.txt *.md *.pdf);;All files (*)"
+        )
+        if not path:
+            return
+        if path.lower().endswith(".pdf"):
+            # Uploaded once per API key and reused until shortly before it expires
+            self.doc_file = path
+            self.doc_input.clear()
+            self.doc_input.setPlaceholderText(f"PDF: {Path(path).name} (type here to use text instead)")
+            return
+        self.doc_file = None
+        self.doc_input.setPlaceholderText("Paste a long text, or load a text or PDF file…")
+        with open(path, encoding="utf-8", errors="replace") as f:
+            self.doc_input.setPlainText(f.read())
+
+    def generate_cards(self):
+        """Split the document into chunks, generate cards in parallel and add them as notes"""
+        api_key = self.api_input.text().strip()
+        text = self.doc_input.toPlainText().strip()
+
+        if not api_key:
+            showInfo("Please enter an API key first")
+            return
+
+        doc_file = None if text else self.doc_file
+        if not text and not doc_file:
+            showInfo("Please paste or load a document")
+            return
+
+        from ..utils.concurrency import get_limiter
+        from ..utils.daemon import get_daemon
+        from ..utils.gemini_client import GeminiClient
+        from ..utils.key_pool import get_key_pool
+        from ..utils.result_cache import get_result_cache
+        from ..utils.doc_to_cards import generate_cards
+
+        addon_name = Path(__file__).parent.parent.name
+        config = mw.addonManager.getConfig(addon_name) or {}
+        cache = get_result_cache(config) if config.get("cache_enabled", True) else None
+        client = GeminiClient(
+            api_key, result_cache=cache, daemon=get_daemon(config), key_pool=get_key_pool(config, api_key)
+        )
+
+        # Cards go into the first two fields of a standard (non-cloze) note type
+        notetype = mw.col.models.by_name("Basic")
+        if notetype is None or notetype["type"] != 0 or len(notetype["flds"]) < 2:
+            notetype = next(
+                (m for m in mw.col.models.all() if m["type"] == 0 and len(m["flds"]) >= 2), None
+            )
+        if notetype is None:
+            showInfo("Card generation needs a standard note type with at least two fields, e.g. Basic")
+            return
+        deck_id = mw.col.decks.get_current_id()
+        added_ids = []
+        browser = None
+
+        self.cards_btn.setEnabled(False)
+        self.status_label.setText("Generating cards…")
+        self.status_label.setStyleSheet("color: orange;")
+
+        def show_in_browser():
+            """Open the Browser on the new notes once, then refresh its search as chunks land"""
+            nonlocal browser
+            search = "nid:" + ",".join(str(nid) for nid in added_ids)
+            if browser is None:
+                browser = aqt.dialogs.open("Browser", mw, search=(search,))
+            elif not sip.isdeleted(browser) and browser.isVisible():
+                # Left alone once the user has closed it
+                browser.search_for(search)
+
+        def add_cards(index, total, cards, error):
+            for card in cards:
+                note = mw.col.new_note(notetype)
+                note.fields[0] = card["front"]
+                note.fields[1] = card["back"]
+                mw.col.add_note(note, deck_id)
+                added_ids.append(note.id)
+            if error:
+                log.error("Chunk %d/%d failed: %.500s", index + 1, total, error)
+            self.status_label.setText(f"Chunk {index + 1}/{total} done, {len(added_ids)} cards added…")
+            if cards:
+                show_in_browser()
+
+        def task():
+            files = pages = None
+            if doc_file:
+                from ..utils.doc_to_cards import pdf_page_count
+                from ..utils.upload_cache import get_upload_cache
+
+                mw.taskman.run_on_main(lambda: self.status_label.setText("Uploading document…"))
+                files = [get_upload_cache().upload(doc_file, api_key, mime_type="application/pdf")]
+                pages = pdf_page_count(doc_file)
+            for index, total, cards, error in generate_cards(
+                client,
+                text,
+                model=config.get("model", "gemini-2.5-flash"),
+                workers=config.get("doc_workers", 4),
+                limiter=get_limiter("generate", config),
+                files=files,
+                pages=pages,
+            ):
+                mw.taskman.run_on_main(
+                    lambda i=index, t=total, c=cards, e=error: add_cards(i, t, c, e)
+                )
+
+        def on_done(future):
+            self.cards_btn.setEnabled(True)
+            try:
+                future.result()
+            except Exception as e:
+                self.status_label.setText("Card generation failed")
+                self.status_label.setStyleSheet("color: red;")
+                showInfo(f"Card generation error:\n{str(e)}")
+                return
+            self.status_label.setText(f"Added {len(added_ids)} cards")
+            self.status_label.setStyleSheet("color: green;")
+
+        mw.taskman.run_in_background(task, on_done)
+
 
 # --------------------------------------------------
 # PUBLIC ENTRY POINT
@@ -40,47 +40,90 @@ See the [python quickstart](https://ai.google.dev/tutorials/python_quickstart) f
 """
 from __future__ import annotations
 
-from google.generativeai import version
-
-from google.generativeai import caching
-from google.generativeai import protos
-from google.generativeai import types
-
-from google.generativeai.client import configure
-
-from google.generativeai.embedding import embed_content
-from google.generativeai.embedding import embed_content_async
-
-from google.generativeai.files import upload_file
-from google.generativeai.files import get_file
-from google.generativeai.files import list_files
-from google.generativeai.files import delete_file
+import importlib
+from typing import TYPE_CHECKING, Any
 
-from google.generativeai.generative_models import GenerativeModel
-from google.generativeai.generative_models import ChatSession
+from google.generativeai import version
 
-from google.generativeai.models import list_models
-from google.generativeai.models import list_tuned_models
+# Public names are resolved on first attribute access (PEP 562), so
+# `import google.generativeai` only costs what is actually used. Each entry
+# maps a public name to (module, attribute); attribute None means the module.
+_LAZY_ATTRS = {
+    "caching": ("google.generativeai.caching", None),
+    "protos": ("google.generativeai.protos", None),
+    "types": ("google.generativeai.types", None),
+    "configure": ("google.generativeai.client", "configure"),
+    "embed_content": ("google.generativeai.embedding", "embed_content"),
+    "embed_content_async": ("google.generativeai.embedding", "embed_content_async"),
+    "upload_file": ("google.generativeai.files", "upload_file"),
+    "get_file": ("google.generativeai.files", "get_file"),
+    "list_files": ("google.generativeai.files", "list_files"),
+    "delete_file": ("google.generativeai.files", "delete_file"),
+    "GenerativeModel": ("google.generativeai.generative_models", "GenerativeModel"),
+    "ChatSession": ("google.generativeai.generative_models", "ChatSession"),
+    "list_models": ("google.generativeai.models", "list_models"),
+    "list_tuned_models": ("google.generativeai.models", "list_tuned_models"),
+    "get_model": ("google.generativeai.models", "get_model"),
+    "get_base_model": ("google.generativeai.models", "get_base_model"),
+    "get_tuned_model": ("google.generativeai.models", "get_tuned_model"),
+    "create_tuned_model": ("google.generativeai.models", "create_tuned_model"),
+    "update_tuned_model": ("google.generativeai.models", "update_tuned_model"),
+    "delete_tuned_model": ("google.generativeai.models", "delete_tuned_model"),
+    "list_operations": ("google.generativeai.operations", "list_operations"),
+    "get_operation": ("google.generativeai.operations", "get_operation"),
+    "GenerationConfig": ("google.generativeai.types", "GenerationConfig"),
+}
+
+if TYPE_CHECKING:
+    from google.generativeai import caching
+    from google.generativeai import protos
+    from google.generativeai import types
+
+    from google.generativeai.client import configure
+
+    from google.generativeai.embedding import embed_content
+    from google.generativeai.embedding import embed_content_async
+
+    from google.generativeai.files import upload_file
+    from google.generativeai.files import get_file
+    from google.generativeai.files import list_files
+    from google.generativeai.files import delete_file
+
+    from google.generativeai.generative_models import GenerativeModel
+    from google.generativeai.generative_models import ChatSession
+
+    from google.generativeai.models import list_models
+    from google.generativeai.models import list_tuned_models
+
+    from google.generativeai.models import get_model
+    from google.generativeai.models import get_base_model
+    from google.generativeai.models import get_tuned_model
+
+    from google.generativeai.models import create_tuned_model
+    from google.generativeai.models import update_tuned_model
+    from google.generativeai.models import delete_tuned_model
+
+    from google.generativeai.operations import list_operations
+    from google.generativeai.operations import get_operation
+
+    from google.generativeai.types import GenerationConfig
 
-from google.generativeai.models import get_model
-from google.generativeai.models import get_base_model
-from google.generativeai.models import get_tuned_model
+__version__ = version.__version__
 
-from google.generativeai.models import create_tuned_model
-from google.generativeai.models import update_tuned_model
-from google.generativeai.models import delete_tuned_model
+del version
 
-from google.generativeai.operations import list_operations
-from google.generativeai.operations import get_operation
 
-from google.generativeai.types import GenerationConfig
+def __getattr__(name: str) -> Any:
+    try:
+        module_name, attr = _LAZY_ATTRS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    module = importlib.import_module(module_name)
+    value = module if attr is None else getattr(module, attr)
+    # Cache on the package so later lookups skip __getattr__.
+    globals()[name] = value
+    return value
 
-__version__ = version.__version__
 
-del embedding
-del files
-del generative_models
-del models
-del client
-del operations
-del version
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -22,12 +22,16 @@ from google.generativeai import protos
 from google.generativeai.types import caching_types
 from google.generativeai.types import content_types
 from google.generativeai.client import get_default_cache_client
+from google.generativeai.utils import prefetch_pages
 
 from google.protobuf import field_mask_pb2
 
 _USER_ROLE = "user"
 _MODEL_ROLE = "model"
 
+# The largest page size accepted by ListCachedContents.
+_MAX_LIST_PAGE_SIZE = 1000
+
 
 class CachedContent:
     """Cached content resource."""
@@ -241,12 +245,14 @@ class CachedContent:
         return result
 
     @classmethod
-    def list(cls, page_size: Optional[int] = 1) -> Iterable[CachedContent]:
+    def list(cls, page_size: Optional[int] = _MAX_LIST_PAGE_SIZE) -> Iterable[CachedContent]:
         """Lists `CachedContent` objects associated with the project.
 
         Args:
             page_size: The maximum number of permissions to return (per page).
-            The service may return fewer `CachedContent` objects.
+            The service may return fewer `CachedContent` objects. Defaults to
+            the largest page size the service accepts. The next page is
+            fetched in the background while the current one is consumed.
 
         Returns:
             A paginated list of `CachedContent` objects.
@@ -254,7 +260,8 @@ class CachedContent:
         client = get_default_cache_client()
 
         request = protos.ListCachedContentsRequest(page_size=page_size)
-        for cached_content in client.list_cached_contents(request):
+        pager = client.list_cached_contents(request)
+        for cached_content in prefetch_pages(pager, "cached_contents"):
             cached_content = CachedContent._from_obj(cached_content)
             yield cached_content
 
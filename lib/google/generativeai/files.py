@@ -26,11 +26,15 @@ from io import IOBase
 from google.generativeai.types import file_types
 
 from google.generativeai.client import get_default_file_client
+from google.generativeai.utils import prefetch_pages
 
 __all__ = ["upload_file", "get_file", "list_files", "delete_file"]
 
 mimetypes.add_type("image/webp", ".webp")
 
+# The largest page size accepted by ListFiles.
+_MAX_LIST_PAGE_SIZE = 100
+
 
 def upload_file(
     path: str | pathlib.Path | os.PathLike | IOBase,
@@ -88,12 +92,15 @@ def upload_file(
     return file_types.File(response)
 
 
-def list_files(page_size=100) -> Iterable[file_types.File]:
-    """Calls the API to list files using a supported file service."""
+def list_files(page_size=_MAX_LIST_PAGE_SIZE) -> Iterable[file_types.File]:
+    """Calls the API to list files using a supported file service.
+
+    The next page is fetched in the background while the current one is consumed.
+    """
     client = get_default_file_client()
 
     response = client.list_files(protos.ListFilesRequest(page_size=page_size))
-    for proto in response:
+    for proto in prefetch_pages(response, "files"):
         yield file_types.File(proto)
 
 
@@ -172,6 +172,29 @@ def _add_model_flags(
     ).add_argument_to_parser(parser)
 
 
+def _add_execution_flags(
+    parser: argparse.ArgumentParser,
+) -> None:
+    """Adds flags that control how model calls are executed."""
+
+    def _check_is_greater_than_or_equal_to_one(x: int) -> int:
+        if x < 1:
+            raise ValueError("Value should be greater than or equal to one, got {}".format(x))
+        return x
+
+    flag_def.SingleValueFlagDef(
+        name="max_concurrency",
+        short_name="mc",
+        parse_type=int,
+        default_value=1,
+        parse_to_dest_type_fn=_check_is_greater_than_or_equal_to_one,
+        help_msg=(
+            "The maximum number of model calls to run in parallel. Results are"
+            " returned in the same order as with serial execution."
+        ),
+    ).add_argument_to_parser(parser)
+
+
 def _add_input_flags(
     parser: argparse.ArgumentParser,
     placeholders: AbstractSet[str] | None,
@@ -277,6 +300,7 @@ def _create_run_parser(
       placeholders: Placeholders from prompts in the cell contents.
     """
     _add_model_flags(parser)
+    _add_execution_flags(parser)
     _add_input_flags(parser, placeholders)
     _add_output_flags(parser)
 
@@ -304,6 +328,7 @@ def _create_compile_parser(
     save_name_help = "The name of a Python variable to save the compiled function to."
     parser.add_argument("compile_save_name", help=save_name_help, type=_compile_save_name_fn)
     _add_model_flags(parser)
+    _add_execution_flags(parser)
 
 
 def _create_compare_parser(
@@ -342,6 +367,7 @@ def _create_compare_parser(
     parser.add_argument("lhs_name_and_fn", help=name_help, type=_resolve_llm_function_fn)
     parser.add_argument("rhs_name_and_fn", help=name_help, type=_resolve_llm_function_fn)
 
+    _add_execution_flags(parser)
     _add_input_flags(parser, placeholders)
     _add_output_flags(parser)
     _add_compare_flags(parser)
@@ -358,6 +384,7 @@ def _create_eval_parser(
       placeholders: Placeholders from prompts in the cell contents.
     """
     _add_model_flags(parser)
+    _add_execution_flags(parser)
     _add_input_flags(parser, placeholders)
     _add_output_flags(parser)
     _add_compare_flags(parser)
@@ -96,6 +96,7 @@ def create_llm_function(
         model_args=parsed_args.model_args,
         prompts=prompts,
         outputs_ipython_display_fn=llmfn_outputs_display_fn,
+        max_concurrency=parsed_args.max_concurrency,
     )
     if parsed_args.unique:
         llm_fn = llm_fn.add_post_process_reorder_fn(name="unique", fn=unique_fn.unique_fn)
@@ -126,6 +127,7 @@ def create_llm_compare_function(
         rhs_name_and_fn=parsed_args.rhs_name_and_fn,
         compare_name_and_fns=[_convert_simple_compare_fn(x) for x in parsed_args.compare_fn],
         outputs_ipython_display_fn=llmfn_outputs_display_fn,
+        max_concurrency=parsed_args.max_concurrency,
     )
     for fn in post_processing_fns:
         llm_cmp_fn = fn.add_to_llm_function(llm_cmp_fn)
@@ -159,6 +161,7 @@ def create_llm_eval_function(
         rhs_name_and_fn=("ground_truth", ground_truth_fn),
         compare_name_and_fns=[_convert_simple_compare_fn(x) for x in parsed_args.compare_fn],
         outputs_ipython_display_fn=llmfn_outputs_display_fn,
+        max_concurrency=parsed_args.max_concurrency,
     )
 
     return llm_cmp_fn
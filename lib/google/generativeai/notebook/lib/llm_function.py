@@ -16,6 +16,7 @@
 from __future__ import annotations
 
 import abc
+from concurrent import futures
 import dataclasses
 from typing import (
     AbstractSet,
@@ -167,6 +168,18 @@ class LLMFunction(
             outputs=outputs, ipython_display_fn=self._outputs_ipython_display_fn
         )
 
+    def _call_with_executor(
+        self,
+        inputs: llmfn_input_utils.LLMFunctionInputs | None,
+        executor: futures.Executor,
+    ) -> llmfn_outputs.LLMFnOutputs:
+        """Like __call__(), but model calls may run on a caller-provided executor.
+
+        Used by LLMCompareFunction so that both sides share one bounded pool.
+        The default ignores `executor`.
+        """
+        return self(inputs)
+
     def add_post_process_reorder_fn(
         self, name: str, fn: llmfn_post_process.LLMFnPostProcessBatchReorderFn
     ) -> LLMFunction:
@@ -222,6 +235,7 @@ class LLMFunctionImpl(LLMFunction):
         prompts: Sequence[str],
         model_args: model_lib.ModelArguments | None = None,
         outputs_ipython_display_fn: Callable[[llmfn_outputs.LLMFnOutputs], None] | None = None,
+        max_concurrency: int = 1,
     ):
         """Constructor.
 
@@ -232,11 +246,16 @@ class LLMFunctionImpl(LLMFunction):
           model_args: Optional set of model arguments to configure how the model
             executes the prompts.
           outputs_ipython_display_fn: See documentation in LLMFunction.__init__().
+          max_concurrency: The maximum number of model calls to run at the same
+            time. Results are returned in prompt/input order regardless.
         """
         super().__init__(outputs_ipython_display_fn=outputs_ipython_display_fn)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1, got {}".format(max_concurrency))
         self._model = model
         self._prompts = prompts
         self._model_args = model_lib.ModelArguments() if model_args is None else model_args
+        self._max_concurrency = max_concurrency
 
         # Compute placeholders.
         self._placeholders = frozenset({})
@@ -266,14 +285,43 @@ class LLMFunctionImpl(LLMFunction):
     def get_placeholders(self) -> AbstractSet[str]:
         return self._placeholders
 
+    def _call_model(self, info: _PromptInfo) -> model_lib.ModelResults:
+        return self._model.call_model(model_input=info.model_input, model_args=self._model_args)
+
+    def _call_with_executor(
+        self,
+        inputs: llmfn_input_utils.LLMFunctionInputs | None,
+        executor: futures.Executor,
+    ) -> llmfn_outputs.LLMFnOutputs:
+        return llmfn_outputs.LLMFnOutputs(
+            outputs=self._run(inputs, executor),
+            ipython_display_fn=self._outputs_ipython_display_fn,
+        )
+
     def _call_impl(
         self, inputs: llmfn_input_utils.LLMFunctionInputs | None
     ) -> Sequence[llmfn_outputs.LLMFnOutputEntry]:
+        return self._run(inputs, executor=None)
+
+    def _run(
+        self,
+        inputs: llmfn_input_utils.LLMFunctionInputs | None,
+        executor: futures.Executor | None,
+    ) -> Sequence[llmfn_outputs.LLMFnOutputEntry]:
+        infos = list(_generate_prompts(prompts=self._prompts, inputs=inputs))
+        # Executor.map() yields results in submission order, which keeps
+        # prompt_num/input_num ordering identical to the serial path.
+        num_workers = min(self._max_concurrency, len(infos))
+        if executor is not None:
+            all_model_results = list(executor.map(self._call_model, infos))
+        elif num_workers > 1:
+            with futures.ThreadPoolExecutor(max_workers=num_workers) as own_executor:
+                all_model_results = list(own_executor.map(self._call_model, infos))
+        else:
+            all_model_results = [self._call_model(info) for info in infos]
+
         results: list[llmfn_outputs.LLMFnOutputEntry] = []
-        for info in _generate_prompts(prompts=self._prompts, inputs=inputs):
-            model_results = self._model.call_model(
-                model_input=info.model_input, model_args=self._model_args
-            )
+        for info, model_results in zip(infos, all_model_results):
             output_rows: list[llmfn_output_row.LLMFnOutputRow] = []
             for result_num, text_result in enumerate(model_results.text_results):
                 output_rows.append(
@@ -312,6 +360,7 @@ class LLMCompareFunction(LLMFunction):
         rhs_name_and_fn: tuple[str, LLMFunction],
         compare_name_and_fns: Sequence[tuple[str, CompareFn]] | None = None,
         outputs_ipython_display_fn: Callable[[llmfn_outputs.LLMFnOutputs], None] | None = None,
+        max_concurrency: int = 1,
     ):
         """Constructor.
 
@@ -323,8 +372,16 @@ class LLMCompareFunction(LLMFunction):
           compare_name_and_fns: Optional names and functions for comparing the
             results of the left- and right-hand sides.
           outputs_ipython_display_fn: See documentation in LLMFunction.__init__().
+          max_concurrency: If greater than one, the left- and right-hand side
+            functions are run at the same time instead of one after the other,
+            and their model calls share one pool of this many workers, so at
+            most `max_concurrency` calls are in flight in total (the sides'
+            own max_concurrency settings are not used then).
         """
         super().__init__(outputs_ipython_display_fn=outputs_ipython_display_fn)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1, got {}".format(max_concurrency))
+        self._max_concurrency = max_concurrency
         self._lhs_name: str = lhs_name_and_fn[0]
         self._lhs_fn: LLMFunction = lhs_name_and_fn[1]
         self._rhs_name: str = rhs_name_and_fn[0]
@@ -380,8 +437,17 @@ class LLMCompareFunction(LLMFunction):
     def _call_impl(
         self, inputs: llmfn_input_utils.LLMFunctionInputs | None
     ) -> Sequence[llmfn_outputs.LLMFnOutputEntry]:
-        lhs_results = self._lhs_fn(inputs)
-        rhs_results = self._rhs_fn(inputs)
+        if self._max_concurrency > 1:
+            with futures.ThreadPoolExecutor(
+                max_workers=self._max_concurrency
+            ) as model_calls, futures.ThreadPoolExecutor(max_workers=2) as sides:
+                lhs_future = sides.submit(self._lhs_fn._call_with_executor, inputs, model_calls)
+                rhs_future = sides.submit(self._rhs_fn._call_with_executor, inputs, model_calls)
+                lhs_results = lhs_future.result()
+                rhs_results = rhs_future.result()
+        else:
+            lhs_results = self._lhs_fn(inputs)
+            rhs_results = self._rhs_fn(inputs)
 
         # Combine the results.
         outputs: list[llmfn_outputs.LLMFnOutputEntry] = []
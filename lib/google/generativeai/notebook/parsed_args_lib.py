@@ -58,6 +58,9 @@ class ParsedArgs:
     model_type: model_registry.ModelName | None = None
     unique: bool = False
 
+    # For all commands.
+    max_concurrency: int = 1
+
     # For run, compare and eval commands.
     inputs: Sequence[llmfn_inputs_source.LLMFnInputsSource] = dataclasses.field(
         default_factory=list
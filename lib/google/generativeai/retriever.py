@@ -25,6 +25,10 @@ from google.generativeai.client import get_default_retriever_async_client
 from google.generativeai.types import helper_types
 from google.generativeai.types.model_types import idecode_time
 from google.generativeai.types import retriever_types
+from google.generativeai.utils import prefetch_pages
+
+# The largest page size accepted by ListCorpora.
+_MAX_CORPORA_PAGE_SIZE = 20
 
 
 def create_corpus(
@@ -206,7 +210,7 @@ async def delete_corpus_async(
 
 def list_corpora(
     *,
-    page_size: Optional[int] = None,
+    page_size: Optional[int] = _MAX_CORPORA_PAGE_SIZE,
     client: glm.RetrieverServiceClient | None = None,
     request_options: helper_types.RequestOptionsType | None = None,
 ) -> Iterable[retriever_types.Corpus]:
@@ -218,7 +222,8 @@ def list_corpora(
         request_options: Options for the request.
 
     Return:
-        Paginated list of `Corpora`.
+        Paginated list of `Corpora`. The next page is fetched in the background
+        while the current one is consumed.
     """
     if request_options is None:
         request_options = {}
@@ -227,7 +232,8 @@ def list_corpora(
         client = get_default_retriever_client()
 
     request = protos.ListCorporaRequest(page_size=page_size)
-    for corpus in client.list_corpora(request, **request_options):
+    pager = client.list_corpora(request, **request_options)
+    for corpus in prefetch_pages(pager, "corpora"):
         corpus = type(corpus).to_dict(corpus)
         idecode_time(corpus, "create_time")
         idecode_time(corpus, "update_time")
@@ -236,7 +242,7 @@ def list_corpora(
 
 async def list_corpora_async(
     *,
-    page_size: Optional[int] = None,
+    page_size: Optional[int] = _MAX_CORPORA_PAGE_SIZE,
     client: glm.RetrieverServiceClient | None = None,
     request_options: helper_types.RequestOptionsType | None = None,
 ) -> AsyncIterable[retriever_types.Corpus]:
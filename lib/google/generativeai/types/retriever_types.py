@@ -33,6 +33,11 @@ from google.generativeai.types import helper_types
 from google.generativeai.types import permission_types
 from google.generativeai.types.model_types import idecode_time
 from google.generativeai.utils import flatten_update_paths
+from google.generativeai.utils import prefetch_pages
+
+# The largest page sizes accepted by ListDocuments and ListChunks.
+_MAX_DOCUMENTS_PAGE_SIZE = 20
+_MAX_CHUNKS_PAGE_SIZE = 100
 
 _VALID_NAME = r"[a-z0-9]([a-z0-9-]{0,38}[a-z0-9])$"
 NAME_ERROR_MSG = """The `name` must consist of alphanumeric characters (or -) and be 40 or fewer characters; or be empty. The name you entered:
@@ -625,7 +630,7 @@ class Corpus:
 
     def list_documents(
         self,
-        page_size: int | None = None,
+        page_size: int | None = _MAX_DOCUMENTS_PAGE_SIZE,
         client: glm.RetrieverServiceClient | None = None,
         request_options: helper_types.RequestOptionsType | None = None,
     ) -> Iterable[Document]:
@@ -638,7 +643,8 @@ class Corpus:
             request_options: Options for the request.
 
         Return:
-            Paginated list of `Document`s.
+            Paginated list of `Document`s. The next page is fetched in the
+            background while the current one is consumed.
         """
         if request_options is None:
             request_options = {}
@@ -650,12 +656,13 @@ class Corpus:
             parent=self.name,
             page_size=page_size,
         )
-        for doc in client.list_documents(request, **request_options):
+        pager = client.list_documents(request, **request_options)
+        for doc in prefetch_pages(pager, "documents"):
             yield decode_document(doc)
 
     async def list_documents_async(
         self,
-        page_size: int | None = None,
+        page_size: int | None = _MAX_DOCUMENTS_PAGE_SIZE,
         client: glm.RetrieverServiceAsyncClient | None = None,
         request_options: helper_types.RequestOptionsType | None = None,
     ) -> AsyncIterable[Document]:
@@ -1009,7 +1016,7 @@ class Document(abc.ABC):
 
     def list_chunks(
         self,
-        page_size: int | None = None,
+        page_size: int | None = _MAX_CHUNKS_PAGE_SIZE,
         client: glm.RetrieverServiceClient | None = None,
         request_options: helper_types.RequestOptionsType | None = None,
     ) -> Iterable[Chunk]:
@@ -1021,7 +1028,8 @@ class Document(abc.ABC):
             request_options: Options for the request.
 
         Return:
-            List of chunks in the document.
+            List of chunks in the document. The next page is fetched in the
+            background while the current one is consumed.
         """
         if request_options is None:
             request_options = {}
@@ -1030,12 +1038,13 @@ class Document(abc.ABC):
             client = get_default_retriever_client()
 
         request = protos.ListChunksRequest(parent=self.name, page_size=page_size)
-        for chunk in client.list_chunks(request, **request_options):
+        pager = client.list_chunks(request, **request_options)
+        for chunk in prefetch_pages(pager, "chunks"):
             yield decode_chunk(chunk)
 
     async def list_chunks_async(
         self,
-        page_size: int | None = None,
+        page_size: int | None = _MAX_CHUNKS_PAGE_SIZE,
         client: glm.RetrieverServiceClient | None = None,
         request_options: helper_types.RequestOptionsType | None = None,
     ) -> AsyncIterable[Chunk]:
@@ -14,6 +14,11 @@
 # limitations under the License.
 from __future__ import annotations
 
+import queue
+import threading
+from typing import Any, Iterable, Iterator
+
+_PAGE_DONE = object()
 
 def flatten_update_paths(updates):
     """Flattens a nested dictionary into a single level dictionary, with keys representing the original path."""
@@ -27,3 +32,56 @@ def flatten_update_paths(updates):
             new_updates[key] = value
 
     return new_updates
+
+
+def prefetch_pages(pager: Any, items_field: str, depth: int = 1) -> Iterator[Any]:
+    """Iterates the items of a GAPIC pager, fetching the next page in the background.
+
+    A worker thread walks `pager.pages` and hands each page over through a
+    bounded queue, so the HTTP round trip for page N+1 overlaps with the caller
+    consuming page N. At most `depth` pages are buffered ahead of the caller.
+
+    Args:
+        pager: A GAPIC `List*Pager` (anything with a `pages` iterator).
+        items_field: The repeated field holding the items on each page, e.g.
+            "cached_contents" or "files".
+        depth: The number of pages to fetch ahead of the caller.
+
+    Yields:
+        The items of every page, in order.
+    """
+    pages: queue.Queue = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker() -> None:
+        try:
+            for page in pager.pages:
+                if not _put((page, None)):
+                    return
+        except BaseException as e:  # Re-raised on the caller's thread.
+            _put((None, e))
+            return
+        _put((_PAGE_DONE, None))
+
+    thread = threading.Thread(target=_worker, name="genai-page-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is _PAGE_DONE:
+                return
+            yield from getattr(page, items_field)
+    finally:
+        # Stop fetching if the caller abandons the iteration early.
+        stop.set()
@@ -5,19 +5,23 @@ from .compat import chardet
 # This code exists for backwards compatibility reasons.
 # I don't like it either. Just look the other way. :)
 
+# The aliases are registered under this module's own name (not a literal
+# "requests.packages"), so a copy imported under another name, as the add-on
+# does with lib/, does not overwrite the real requests' entries.
 for package in ("urllib3", "idna"):
     locals()[package] = __import__(package)
+    target = locals()[package].__name__
     # This traversal is apparently necessary such that the identities are
     # preserved (requests.packages.urllib3.* is urllib3.*)
     for mod in list(sys.modules):
-        if mod == package or mod.startswith(f"{package}."):
-            sys.modules[f"requests.packages.{mod}"] = sys.modules[mod]
+        if mod == target or mod.startswith(f"{target}."):
+            sys.modules[f"{__name__}.{package}{mod[len(target):]}"] = sys.modules[mod]
 
 if chardet is not None:
     target = chardet.__name__
+    short_name = target.rpartition(".")[2]
     for mod in list(sys.modules):
         if mod == target or mod.startswith(f"{target}."):
             imported_mod = sys.modules[mod]
-            sys.modules[f"requests.packages.{mod}"] = imported_mod
-            mod = mod.replace(target, "chardet")
-            sys.modules[f"requests.packages.{mod}"] = imported_mod
+            sys.modules[f"{__name__}.{short_name}{mod[len(target):]}"] = imported_mod
+            sys.modules[f"{__name__}.chardet{mod[len(target):]}"] = imported_mod
@@ -0,0 +1,7 @@
+﻿"""Makes utils/ importable the way the benchmarks do, without Anki"""
+
+import sys
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ADDON_DIR))
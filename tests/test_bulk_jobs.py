@@ -0,0 +1,42 @@
+﻿import pytest
+
+from utils.bulk_jobs import call_with_retries, is_retryable
+
+
+@pytest.mark.parametrize("error", [
+    "HTTP 429: Resource exhausted",
+    "HTTP 500: internal",
+    "HTTP 503: unavailable",
+    "HTTP 504: deadline exceeded",
+    "Connection error: connection refused",
+])
+def test_retryable(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize("error", [None, "", "HTTP 400: bad request", "HTTP 403: denied", "No audio in response"])
+def test_not_retryable(error):
+    assert not is_retryable(error)
+
+
+def _outcomes(*results):
+    calls = iter(results)
+    return lambda: next(calls)
+
+
+def test_retries_until_success():
+    attempt = _outcomes((None, "HTTP 503: x", False), (None, "Connection error: y", False), ("ok", None, True))
+    assert call_with_retries(attempt, backoff=0) == ("ok", None, True, 3)
+
+
+def test_gives_up_on_permanent_errors_and_after_max_retries():
+    assert call_with_retries(_outcomes((None, "HTTP 400: x", False)), backoff=0) == (None, "HTTP 400: x", False, 1)
+    always = lambda: (None, "HTTP 429: x", False)  # noqa: E731
+    assert call_with_retries(always, max_retries=2, backoff=0)[1:] == ("HTTP 429: x", False, 3)
+
+
+def test_exceptions_become_errors():
+    def fail():
+        raise ValueError("boom")
+
+    assert call_with_retries(fail, backoff=0) == (None, "ValueError: boom", False, 1)
@@ -0,0 +1,62 @@
+﻿from utils.concurrency import AimdLimiter
+
+
+def _round(limiter, latency=0.1):
+    """Fill every slot, then release them all"""
+    tokens = [limiter.acquire() for _ in range(limiter.limit)]
+    for token in tokens:
+        limiter.release(token, latency)
+
+
+def test_limit_grows_while_it_is_used():
+    limiter = AimdLimiter("t", initial=4, max_limit=8)
+    for _ in range(10):
+        _round(limiter)
+    assert limiter.limit > 4
+    for _ in range(100):
+        _round(limiter)
+    assert limiter.limit == 8
+
+
+def test_limit_does_not_grow_when_idle():
+    limiter = AimdLimiter("t", initial=4)
+    for _ in range(50):
+        limiter.release(limiter.acquire(), 0.1)
+    assert limiter.limit == 4
+
+
+def test_throttling_halves_the_limit_once_per_round_trip():
+    limiter = AimdLimiter("t", initial=16, min_limit=2)
+    early = [limiter.acquire() for _ in range(3)]
+    limiter.release(early[0], throttled=True)
+    assert limiter.limit == 8
+    # Sent before the decrease, so it says nothing new
+    limiter.release(early[1], throttled=True)
+    assert limiter.limit == 8
+    limiter.release(early[2])
+
+    for expected in (4, 2, 2):
+        limiter.release(limiter.acquire(), throttled=True)
+        assert limiter.limit == expected
+    assert limiter.status()["decreases"] == {"throttled": 4}
+
+
+def test_rising_latency_backs_off():
+    limiter = AimdLimiter("t", initial=8, warmup=10)
+    for _ in range(10):
+        limiter.release(limiter.acquire(), 0.01)
+    assert limiter.limit == 8
+    for _ in range(5):
+        limiter.release(limiter.acquire(), 1.0)
+    assert limiter.limit < 8
+    assert limiter.status()["decreases"].get("latency")
+
+
+def test_attempt_reports_throttling_and_passes_results_through():
+    limiter = AimdLimiter("t", initial=8)
+    assert limiter.attempt(lambda: ("ok", None, False)) == ("ok", None, False)
+    assert limiter.attempt(lambda: (None, "HTTP 429: quota", False)) == (None, "HTTP 429: quota", False)
+    assert limiter.limit == 4
+    assert limiter.attempt(lambda: (None, "HTTP 400: bad request", False))[1] == "HTTP 400: bad request"
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
@@ -0,0 +1,188 @@
+﻿import json
+import socket
+import threading
+import time
+
+import pytest
+
+from utils import daemon
+from utils.daemon import (
+    DaemonClient, DaemonError, DaemonServer, DaemonService, DaemonUnavailable, SingleFlight, TokenBucket,
+)
+from utils.result_cache import ResultCache
+
+
+class FakeClient:
+    """GeminiClient stand-in that counts upstream calls"""
+
+    key_pool = None
+
+    def __init__(self, cache_path, delay=0.05):
+        self.delay = delay
+        self.result_cache = ResultCache(cache_path)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_text(self, prompt, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+        time.sleep(self.delay)
+        return f"answer to {prompt}", None
+
+    def generate_tts_audio(self, text, voice_name=None, out_path=None):
+        with self._lock:
+            self.calls.append(text)
+        with open(out_path, "wb") as f:
+            f.write(b"ID3 " + text.encode("utf-8"))
+        return b"", None
+
+
+def _parallel(fn, count):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fn())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_token_bucket():
+    assert TokenBucket(0).acquire() == 0.0
+    bucket = TokenBucket(600, burst=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    waited = bucket.acquire()
+    assert 0.05 <= waited <= 0.11
+    assert bucket.acquire(max_wait=0.01) is None
+
+
+def test_single_flight_shares_results_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.05)
+        return "x"
+
+    results = _parallel(lambda: flight.do("k", slow), 5)
+    assert [r for r, _ in results] == ["x"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert len(calls) == 1
+
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("k", lambda: "fresh") == ("fresh", False)
+
+
+def test_identical_requests_go_upstream_once(tmp_path):
+    client = FakeClient(tmp_path / "cache.sqlite3")
+    service = DaemonService(client, audio_dir=tmp_path)
+    results = _parallel(lambda: service.generate_text("hi"), 4)
+    assert {r[:2] for r in results} == {("answer to hi", None)}
+    assert client.calls == ["hi"]
+    # Later requests are cache hits
+    assert service.generate_text("hi") == ("answer to hi", None, True)
+    # Without the cache every request goes upstream
+    service.generate_text("hi", use_cache=False)
+    assert client.calls == ["hi", "hi"]
+    counters = service.stats()["counters"]
+    assert counters["generate_coalesced"] == 3 and counters["generate_cache_hits"] == 1
+
+
+def test_tts_reuses_the_audio_cache(tmp_path):
+    client = FakeClient(tmp_path / "cache.sqlite3")
+    service = DaemonService(client, audio_dir=tmp_path)
+    (first, error), = set(_parallel(lambda: service.generate_tts("hello", "v"), 3))
+    assert error is None and first.read_bytes() == b"ID3 hello"
+    assert service.generate_tts("hello", "v") == (first, None)
+    assert client.calls == ["hello"]
+
+
+def test_rate_limit_gives_up_after_max_wait(tmp_path):
+    service = DaemonService(FakeClient(tmp_path / "cache.sqlite3", delay=0), audio_dir=tmp_path,
+                            limits={"generate": 60}, max_wait=0.01)
+    service.limiters["generate"].tokens = 0
+    text, error, _ = service.generate_text("hi", use_cache=False)
+    assert text is None and error.startswith("HTTP 429")
+
+
+@pytest.fixture
+def server(tmp_path):
+    client = FakeClient(tmp_path / "cache.sqlite3", delay=0)
+    server = DaemonServer(DaemonService(client, audio_dir=tmp_path / "audio"), port=0,
+                          info_path=tmp_path / "daemon.json")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server.info_path.exists():
+            break
+        time.sleep(0.01)
+    yield server
+    server.shutdown()
+    thread.join()
+
+
+def test_client_round_trip(server):
+    info = json.loads(server.info_path.read_text(encoding="utf-8"))
+    client = DaemonClient(info["url"], info["token"])
+    assert client.health()
+    assert client.generate_text("hi", return_cached=True) == ("answer to hi", None, False)
+    assert client.generate_text("hi", return_cached=True) == ("answer to hi", None, True)
+    audio, error = client.generate_tts_audio("hello")
+    assert error is None and audio == b"ID3 hello"
+    assert client.stats()["counters"]["generate_requests"] == 2
+
+
+def test_bad_token_falls_back(server):
+    client = DaemonClient(server.url, "wrong")
+    assert not client.health()
+    with pytest.raises(DaemonUnavailable):
+        client.generate_text("hi")
+
+
+def test_server_removes_its_info_file(tmp_path):
+    server = DaemonServer(DaemonService(FakeClient(tmp_path / "cache.sqlite3"), audio_dir=tmp_path), port=0,
+                          info_path=tmp_path / "daemon.json")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    server.shutdown()
+    thread.join()
+    assert not server.info_path.exists()
+
+
+def test_refused_connections_fall_back():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with pytest.raises(DaemonUnavailable):
+        DaemonClient(f"http://127.0.0.1:{port}", "t", timeout=2).generate_text("hi")
+
+
+def test_a_request_dropped_after_it_was_sent_is_an_error():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def accept_and_drop():
+        conn, _ = listener.accept()
+        conn.recv(65536)
+        conn.close()
+
+    threading.Thread(target=accept_and_drop, daemon=True).start()
+    client = DaemonClient(f"http://127.0.0.1:{listener.getsockname()[1]}", "t", timeout=2)
+    try:
+        with pytest.raises(DaemonError):
+            client._post("/generate_text", {"prompt": "hi"})
+    finally:
+        listener.close()
+
+
+def test_get_daemon(server, monkeypatch):
+    monkeypatch.setattr(daemon, "_found_at", 0.0)
+    assert daemon.get_daemon({"use_daemon": False}, info_path=server.info_path) is None
+    found = daemon.get_daemon({"use_daemon": True}, info_path=server.info_path)
+    assert found is not None and found.url == server.url
+    # Reused until the recheck interval passes
+    assert daemon.get_daemon(info_path=server.info_path.with_name("missing.json")) is found
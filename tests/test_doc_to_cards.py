@@ -0,0 +1,105 @@
+﻿import json
+import threading
+
+from utils import doc_to_cards
+from utils.doc_to_cards import (
+    CardDeduper, chunk_text, estimate_tokens, generate_cards, page_prompts, parse_cards, pdf_page_count,
+)
+
+
+def test_chunks_respect_the_budget_and_overlap():
+    paragraphs = [f"Paragraph {n}. " + "word " * 150 for n in range(20)]
+    chunks = chunk_text("\n\n".join(paragraphs), max_tokens=500, overlap_tokens=50)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 501 for chunk in chunks)
+    for n in range(20):
+        assert any(f"Paragraph {n}." in chunk for chunk in chunks)
+    # Each chunk starts with the end of the one before it
+    assert chunks[1].split("\n\n")[0] in chunks[0]
+
+
+def test_long_paragraphs_are_split():
+    text = "A sentence that goes on. " * 400
+    chunks = chunk_text(text, max_tokens=200, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 800 for chunk in chunks)
+
+
+def test_pdf_page_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_to_cards, "_PDF_BLOCK", 64)
+    path = tmp_path / "doc.pdf"
+    # The root node (Count 42) straddles a block boundary; a child node has Count 3
+    path.write_bytes(b"%PDF-1.4\n" + b"x" * 50 + b"<< /Type /Pages /Kids [3 0 R] /Count 42 >>"
+                     + b"y" * 200 + b"<< /Count 3 /Type /Pages >>")
+    assert pdf_page_count(path) == 42
+    path.write_bytes(b"%PDF-1.5\n" + b"z" * 500)
+    assert pdf_page_count(path) is None
+
+
+def test_page_prompts():
+    assert page_prompts(None) == ["Make flashcards from the attached document."]
+    prompts = page_prompts(25, pages_per_chunk=10)
+    assert len(prompts) == 3
+    assert "pages 21-25 " in prompts[-1]
+
+
+def test_parse_cards():
+    text = json.dumps([{"front": " Q ", "back": "A"}, {"front": "", "back": "x"}, "junk"])
+    assert parse_cards(text) == [{"front": "Q", "back": "A"}]
+    assert parse_cards("not json") == []
+    assert parse_cards(json.dumps({"front": "Q"})) == []
+
+
+def test_reworded_duplicates_are_dropped():
+    deduper = CardDeduper()
+    assert deduper.add({"front": "What is osmosis?", "back": "a"})
+    assert not deduper.add({"front": "what is Osmosis", "back": "b"})
+    assert deduper.add({"front": "What is diffusion?", "back": "c"})
+    assert [card["back"] for card in deduper.cards] == ["a", "c"]
+
+
+class FakeClient:
+    """Answers every chunk with one card per line starting with "Fact" and one shared card"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_text(self, prompt, files=None, return_cached=False, **kwargs):
+        with self._lock:
+            self.calls.append((prompt, files, kwargs["template"]))
+        if self.fail_on and self.fail_on in prompt:
+            return None, "HTTP 500: boom", False
+        cards = [{"front": line, "back": "yes"} for line in prompt.split("\n") if line.startswith("Fact")]
+        cards.append({"front": "What is this document about?", "back": "facts"})
+        return json.dumps(cards), None, False
+
+
+def test_generate_cards_maps_chunks_and_dedupes():
+    text = "\n\n".join(f"Fact {n} " + "filler " * 100 for n in range(6))
+    client = FakeClient()
+    results = list(generate_cards(client, text, max_tokens=300, overlap_tokens=0, workers=3))
+
+    assert len(results) == len(client.calls) > 1
+    assert sorted(index for index, *_ in results) == list(range(len(results)))
+    cards = [card for _, _, new_cards, _ in results for card in new_cards]
+    fronts = [card["front"] for card in cards]
+    assert fronts.count("What is this document about?") == 1
+    assert sorted(front.split()[1] for front in fronts if front.startswith("Fact")) == [str(n) for n in range(6)]
+
+
+def test_generate_cards_reports_failed_chunks():
+    text = "\n\n".join(f"Fact {n} " + "filler " * 100 for n in range(4))
+    results = list(generate_cards(FakeClient(fail_on="Fact 2"), text, max_tokens=300, overlap_tokens=0))
+    errors = [error for *_, error in results if error]
+    assert errors == ["HTTP 500: boom"]
+
+
+def test_generate_cards_with_an_attached_document():
+    client = FakeClient()
+    files = [{"uri": "files/1", "mime_type": "application/pdf"}]
+    results = list(generate_cards(client, "", files=files, pages=25, pages_per_chunk=10))
+    assert len(results) == 3
+    assert all(call_files == files for _, call_files, _ in client.calls)
+    assert {template for *_, template in client.calls} == {"doc_to_cards"}
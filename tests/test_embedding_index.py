@@ -0,0 +1,44 @@
+﻿from utils.embedding_index import EmbeddingIndex
+from utils.gemini_client import GeminiClient
+from utils.result_cache import ResultCache, make_cache_key
+
+
+def _vector(*values, dim=4):
+    return list(values) + [0.0] * (dim - len(values))
+
+
+def test_search_ranks_by_cosine_and_honours_exclude(tmp_path):
+    index = EmbeddingIndex(tmp_path, dim=4)
+    index.upsert([
+        (1, "cat", _vector(1.0)),
+        (2, "kitten", _vector(0.9, 0.1)),
+        (3, "car", _vector(0.0, 1.0)),
+    ])
+    assert [note_id for note_id, _ in index.search(_vector(1.0), k=2)] == [1, 2]
+    assert [note_id for note_id, _ in index.search(_vector(1.0), k=2, exclude={1})] == [2, 3]
+    index.close()
+
+
+class RecordingRetriever:
+    client = None
+
+    def __init__(self):
+        self.calls = []
+
+    def retrieve_texts(self, query, k=5, exclude=()):
+        self.calls.append((query, k, tuple(exclude)))
+        return []
+
+
+def test_grounded_generation_leaves_out_the_edited_note(tmp_path):
+    cache = ResultCache(tmp_path / "cache.sqlite3")
+    model = "gemini-2.5-flash"
+    cache.put(make_cache_key(model, "Explain", 0.7, 1024), model, "cached answer")
+    retriever = RecordingRetriever()
+    client = GeminiClient("key", result_cache=cache, retriever=retriever)
+
+    text, error = client.generate_text("Explain", model=model, ground=True, top_k=3, exclude_notes=(42,))
+
+    assert (text, error) == ("cached answer", None)
+    assert retriever.calls == [("Explain", 3, (42,))]
+    cache.close()
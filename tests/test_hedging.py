@@ -0,0 +1,149 @@
+﻿import itertools
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import metrics, vendor
+from utils.hedging import CancelToken, HedgeCancelled, HedgePolicy, current_token, get_hedge_policy
+
+
+def _policy(delay=0.05, **kwargs):
+    policy = HedgePolicy(**kwargs)
+    policy.delay = lambda endpoint: delay
+    return policy
+
+
+def _answers(*behaviours):
+    """fn whose n-th call sleeps and then returns or raises the n-th behaviour"""
+    counter = itertools.count()
+    tokens = []
+
+    def fn():
+        seconds, result = behaviours[next(counter)]
+        tokens.append(current_token())
+        time.sleep(seconds)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    fn.tokens = tokens
+    return fn
+
+
+def test_without_enough_samples_the_call_is_not_hedged():
+    policy = _policy(delay=None)
+    assert policy.call(_answers((0, "only"))) == "only"
+    assert policy.status()["hedged"] == 0
+
+
+def test_a_fast_answer_is_not_hedged():
+    policy = _policy()
+    with metrics.track("generateContent") as timing:
+        assert policy.call(_answers((0, "first"), (0, "second"))) == "first"
+    assert policy.status()["hedged"] == 0
+    assert "hedge" not in timing.tags
+
+
+def test_a_slow_request_is_hedged_and_the_loser_cancelled():
+    policy = _policy()
+    fn = _answers((1.0, "slow"), (0, "hedge"))
+    start = time.perf_counter()
+    with metrics.track("generateContent") as timing:
+        assert policy.call(fn) == "hedge"
+    assert time.perf_counter() - start < 0.5
+    assert fn.tokens[0].cancelled and not fn.tokens[1].cancelled
+    assert timing.tags["hedge"] == "won"
+    status = policy.status()
+    assert (status["hedged"], status["hedge_won"]) == (1, 1)
+
+
+def test_an_error_waits_for_the_other_attempt():
+    fn = _answers((0.1, ValueError("first failed")), (0.15, "hedge"))
+    assert _policy().call(fn) == "hedge"
+    fn = _answers((0.1, "not good"), (0.15, "good"))
+    assert _policy().call(fn, accept=lambda result: result == "good") == "good"
+    fn = _answers((0.1, ValueError("first failed")), (0.15, ValueError("both failed")))
+    with pytest.raises(ValueError, match="first failed"):
+        _policy().call(fn)
+
+
+def test_hedges_are_limited_by_the_budget():
+    policy = _policy(budget=0.0)
+    assert policy.call(_answers((0.1, "a"), (0, "b"))) == "b"
+    assert policy.call(_answers((0.1, "a"), (0, "b"))) == "a"
+    assert policy.status()["over_budget"] == 1
+
+
+def test_cancel_token():
+    token = CancelToken()
+    ours, theirs = socket.socketpair()
+    connection = type("Connection", (), {"sock": ours})()
+    token.attach(connection)
+    token.cancel()
+    assert theirs.recv(1) == b""
+    with pytest.raises(HedgeCancelled):
+        token.attach(connection)
+    ours.close()
+    theirs.close()
+
+
+def test_get_hedge_policy_is_opt_in():
+    assert get_hedge_policy({}) is None
+    assert get_hedge_policy({"hedging": {"enabled": False}}) is None
+    assert isinstance(get_hedge_policy({"hedging": {"enabled": True}}), HedgePolicy)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = itertools.count()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if next(self.requests) == 0:
+            time.sleep(2)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+def test_the_losing_http_request_is_aborted():
+    from utils.http_timing import TimedHTTPAdapter
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = vendor.load("requests").Session()
+    session.mount("http://", TimedHTTPAdapter(pool_maxsize=4))
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/m:generateContent"
+    policy = _policy(delay=0.1)
+    losers = []
+
+    def fn():
+        try:
+            return session.get(url, timeout=5)
+        except Exception as e:
+            losers.append(e)
+            raise
+
+    try:
+        start = time.perf_counter()
+        with metrics.track("generateContent") as timing:
+            assert policy.call(fn).text == "ok"
+        assert time.perf_counter() - start < 1
+        for _ in range(100):
+            if losers:
+                break
+            time.sleep(0.01)
+        # The first request's connection was shut down instead of waiting 2 s
+        assert losers and time.perf_counter() - start < 1
+        assert timing.http_requests == 2
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
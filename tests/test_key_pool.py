@@ -0,0 +1,72 @@
+﻿from types import SimpleNamespace
+
+from utils.key_pool import KeyPool, retry_after
+
+
+def _retired(pool, name):
+    return next(k for k in pool.status() if k["name"] == name)
+
+
+def test_requests_spread_over_the_keys():
+    pool = KeyPool(["a", "b"])
+    first, _ = pool.acquire()
+    second, _ = pool.acquire()
+    assert {first, second} == {"a", "b"}
+
+
+def test_429_retires_the_key_for_every_endpoint():
+    pool = KeyPool(["a", "b"])
+    key, _ = pool.acquire(exclude=["b"], endpoint="tts")
+    assert pool.release(key, 429, wait=12, endpoint="tts")
+    for endpoint in ("tts", "generate", None):
+        assert pool.acquire(endpoint=endpoint)[0] == "b"
+    key, wait = pool.acquire(exclude=["b"], endpoint="generate")
+    assert key is None and 0 < wait <= 12
+
+
+def test_429_cooldown_doubles_until_a_success():
+    pool = KeyPool(["a"], cooldown=30, max_cooldown=100)
+
+    def answer(status):
+        pool.keys[0].retired_until = 0  # skip the wait
+        key, _ = pool.acquire()
+        pool.release(key, status)
+        return _retired(pool, "key 1")
+
+    for expected in (30, 60, 100):
+        assert abs(answer(429)["retired_for_s"] - expected) < 1
+    answer(200)
+    status = answer(429)
+    assert abs(status["retired_for_s"] - 30) < 1
+    assert status["in_flight"] == 0
+
+
+def test_403_retires_the_key_only_for_that_endpoint():
+    pool = KeyPool(["a", "b"], denied_cooldown=900)
+    key, _ = pool.acquire(exclude=["b"], endpoint="tts")
+    assert pool.release(key, 403, endpoint="tts")
+    assert pool.acquire(exclude=["b"], endpoint="generate")[0] == "a"
+    key, wait = pool.acquire(exclude=["b"], endpoint="tts")
+    assert key is None and wait > 800
+    status = _retired(pool, "key 1")
+    assert status["retired_for_s"] == 0
+    assert set(status["denied_for_s"]) == {"tts"}
+
+
+def test_other_outcomes_do_not_retire():
+    pool = KeyPool(["a", "b"])
+    for status in (None, 500, 200):
+        key, _ = pool.acquire(exclude=["b"])
+        assert not pool.release(key, status)
+    assert not pool.release("unknown", 429)
+    status = _retired(pool, "key 1")
+    assert status["in_flight"] == 0
+    assert status["retired_for_s"] == 0 and status["throttled"] == 0
+    assert pool.acquire(exclude=["b"])[0] == "a"
+
+
+def test_retry_after():
+    assert retry_after(SimpleNamespace(headers={"Retry-After": "7"}, text="")) == 7
+    body = '{"error": {"details": [{"@type": "RetryInfo", "retryDelay": "2.5s"}]}}'
+    assert retry_after(SimpleNamespace(headers={}, text=body)) == 2.5
+    assert retry_after(SimpleNamespace(headers={}, text="")) is None
@@ -0,0 +1,68 @@
+﻿import threading
+import time
+
+import pytest
+
+from utils import vendor
+
+pytest.importorskip("pandas")
+llm_function = vendor.load("google.generativeai.notebook.lib.llm_function")
+model_lib = vendor.load("google.generativeai.notebook.lib.model")
+
+WORDS = ["one", "two", "three", "four", "five", "six"]
+
+
+class SlowModel(model_lib.AbstractModel):
+    """Echoes its input; earlier inputs take longer, so they finish last"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def call_model(self, model_input, model_args=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01 * (len(WORDS) - WORDS.index(model_input.split()[-1])))
+        with self._lock:
+            self.active -= 1
+        return model_lib.ModelResults(model_input=model_input, text_results=[model_input.upper()])
+
+
+def _fn(model, max_concurrency):
+    return llm_function.LLMFunctionImpl(
+        model=model, prompts=["say {word}", "shout {word}"], max_concurrency=max_concurrency
+    )
+
+
+def _rows(outputs):
+    return [(entry.prompt_num, entry.input_num, entry.model_input) for entry in outputs]
+
+
+def test_parallel_results_keep_the_serial_order():
+    serial_model, parallel_model = SlowModel(), SlowModel()
+    serial = _fn(serial_model, 1)({"word": WORDS})
+    parallel = _fn(parallel_model, 4)({"word": WORDS})
+
+    assert _rows(parallel) == _rows(serial)
+    assert _rows(parallel)[:2] == [(0, 0, "say one"), (0, 1, "say two")]
+    assert serial_model.peak == 1
+    assert 1 < parallel_model.peak <= 4
+
+
+def test_compare_shares_one_bounded_pool():
+    model = SlowModel()
+    compare = llm_function.LLMCompareFunction(
+        lhs_name_and_fn=("lhs", _fn(model, 4)),
+        rhs_name_and_fn=("rhs", _fn(model, 4)),
+        max_concurrency=3,
+    )
+    outputs = compare({"word": WORDS})
+    assert len(outputs) == 2 * len(WORDS)
+    assert 1 < model.peak <= 3
+
+
+def test_max_concurrency_must_be_positive():
+    with pytest.raises(ValueError):
+        _fn(SlowModel(), 0)
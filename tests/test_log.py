@@ -0,0 +1,44 @@
+﻿import gc
+import logging
+import weakref
+
+from utils import log
+
+
+class Body:
+    """Stands in for a large response body passed as a log argument"""
+
+    def __str__(self):
+        return "x" * 5000
+
+
+def test_ring_buffer_keeps_formatted_lines_only():
+    handler = log.RingBufferHandler(capacity=10, max_chars=100)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger = logging.getLogger("gemini_tts.test_ring")
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        body = Body()
+        ref = weakref.ref(body)
+        logger.warning("Response: %s", body)
+        logger.debug("details")
+        del body
+        gc.collect()
+        assert ref() is None
+
+        warning, debug = handler.lines()
+        assert warning.startswith("WARNING Response: xxx") and "4918 more characters" in warning
+        assert debug == "DEBUG details"
+        assert handler.lines(level=logging.INFO) == [warning]
+        assert handler.lines(limit=1) == [debug]
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_get_logger_attaches_nothing():
+    logger = log.get_logger("gemini_tts.utils.something")
+    assert logger.name == "gemini_tts.something"
+    if log.ring_buffer() is None:
+        assert not logging.getLogger(log.LOGGER_NAME).handlers
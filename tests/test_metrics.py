@@ -0,0 +1,114 @@
+﻿import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import metrics, vendor
+from utils.metrics import RequestTiming, endpoint_tags
+
+
+@pytest.fixture
+def recorded():
+    timings = []
+    metrics.registry.add_listener(timings.append)
+    yield timings
+    metrics.registry.remove_listener(timings.append)
+
+
+def test_nested_calls_get_their_own_timing(recorded):
+    with metrics.track("generateContent", model="m", template=None) as outer:
+        with metrics.track("embedContent") as inner:
+            assert metrics.current() is inner
+        assert metrics.current() is outer
+    assert metrics.current() is None
+    assert [t.endpoint for t in recorded] == ["embedContent", "generateContent"]
+    assert outer.tags == {"model": "m"}
+    assert outer.total >= inner.total
+
+
+def test_errors_are_recorded_and_raised(recorded):
+    with pytest.raises(ValueError):
+        with metrics.track("tts"):
+            raise ValueError("bad")
+    assert recorded[0].error == "ValueError: bad"
+    assert not recorded[0].ok
+
+
+def test_time_waiting_for_a_worker_is_queue_wait(recorded):
+    def job():
+        with metrics.track("job"):
+            pass
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(time.sleep, 0.05)
+        metrics.submit(executor, job).result()
+    assert recorded[0].phases["queue_wait"] >= 0.04
+
+
+def test_merge_and_as_dict():
+    timing = RequestTiming("tts")
+    attempt = RequestTiming("tts")
+    attempt.add("ttfb", 0.2)
+    attempt.status = 200
+    attempt.http_requests = 1
+    timing.add("ttfb", 0.1)
+    timing.merge(attempt)
+    timing.total = 0.5
+    data = timing.as_dict()
+    assert data["phases_ms"] == {"ttfb": pytest.approx(300)}
+    assert (data["status"], data["http_requests"], data["total_ms"]) == (200, 1, 500)
+
+
+def test_endpoint_tags():
+    base = "https://generativelanguage.googleapis.com"
+    assert endpoint_tags(f"{base}/v1beta/models/gemini-2.5-flash:generateContent") == (
+        "generateContent", {"model": "gemini-2.5-flash"})
+    assert endpoint_tags(f"{base}/upload/v1beta/files") == ("files", {})
+    assert endpoint_tags(f"{base}/v1beta/files/abc") == ("files", {})
+    assert endpoint_tags("https://texttospeech.googleapis.com/v1/text:synthesize") == ("synthesize", {})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(0.05)
+        body = b"x" * 100000
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_the_transport_times_each_phase(recorded):
+    from utils.http_timing import TimedHTTPAdapter
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = vendor.load("requests").Session()
+    session.mount("http://", TimedHTTPAdapter())
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/m:generateContent"
+    try:
+        with metrics.track("generateContent") as timing:
+            assert len(session.post(url, data=b"{}").content) == 100000
+        session.post(url, data=b"{}")
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
+
+    assert timing.status == 200
+    assert timing.phases["ttfb"] >= 0.04
+    assert {"dns", "connect", "download"} <= set(timing.phases)
+    assert (timing.request_bytes, timing.response_bytes) == (2, 100000)
+    assert (timing.http_requests, timing.new_connections) == (1, 1)
+    # An untracked request gets a timing of its own, on the pooled connection
+    untracked = recorded[-1]
+    assert (untracked.endpoint, untracked.tags) == ("generateContent", {"model": "m"})
+    assert untracked.new_connections == 0 and "connect" not in untracked.phases
@@ -0,0 +1,102 @@
+﻿import json
+import sqlite3
+import zipfile
+
+import pytest
+
+from utils.note_files import FIELD_SEPARATOR, ApkgNotes, CsvNotes, _sort_field_idx, field_checksum
+
+FRONT = '<b>Hello</b>&nbsp;<img src="a.png">'
+MODEL_ID = 1700000000000
+# NotetypeConfig with kind 0, sort_field_idx 1 and css "css"
+CONFIG = bytes([0x08, 0x00, 0x10, 0x01, 0x1A, 0x03]) + b"css"
+
+
+def _collection(path, schema):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY, guid TEXT, mid INTEGER, mod INTEGER, usn INTEGER,"
+                 " tags TEXT, flds TEXT, sfld TEXT, csum INTEGER, flags INTEGER, data TEXT)")
+    if schema == "legacy":
+        model = {"flds": [{"name": "Back", "ord": 1}, {"name": "Front", "ord": 0}], "sortf": 1}
+        conn.execute("CREATE TABLE col (models TEXT)")
+        conn.execute("INSERT INTO col VALUES (?)", (json.dumps({str(MODEL_ID): model}),))
+    else:
+        conn.execute("CREATE TABLE fields (ntid INTEGER, ord INTEGER, name TEXT)")
+        conn.executemany("INSERT INTO fields VALUES (?, ?, ?)", [(MODEL_ID, 0, "Front"), (MODEL_ID, 1, "Back")])
+        conn.execute("CREATE TABLE notetypes (id INTEGER, config BLOB)")
+        conn.execute("INSERT INTO notetypes VALUES (?, ?)", (MODEL_ID, CONFIG))
+    notes = [(1, FRONT + FIELD_SEPARATOR), (2, "Filled" + FIELD_SEPARATOR + "done"), (3, FIELD_SEPARATOR)]
+    conn.executemany(
+        "INSERT INTO notes VALUES (?, 'g', ?, 0, 5, '', ?, '', 0, 0, '')",
+        [(note_id, MODEL_ID, flds) for note_id, flds in notes],
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(params=["legacy", "new"])
+def apkg(request, tmp_path):
+    name = "collection.anki2" if request.param == "legacy" else "collection.anki21"
+    _collection(tmp_path / name, request.param)
+    path = tmp_path / "deck.apkg"
+    with zipfile.ZipFile(path, "w") as z:
+        z.write(tmp_path / name, name)
+        z.writestr("0", b"png")
+        z.writestr("media", json.dumps({"0": "a.png"}))
+    return path
+
+
+def test_sort_field_idx():
+    assert _sort_field_idx(CONFIG) == 1
+    assert _sort_field_idx(b"") == 0
+    assert _sort_field_idx(b"\x1a\x03css") == 0
+
+
+def test_field_checksum_matches_anki():
+    assert field_checksum(FRONT) == 1608498781
+    assert field_checksum("Hello") == field_checksum("<i>Hello</i>")
+
+
+def test_apkg_round_trip(apkg, tmp_path):
+    notes = ApkgNotes(apkg, tmp_path / "work")
+    assert notes.columns == ["Back", "Front"]
+    assert list(notes.items("Front", "Back")) == [(1, FRONT)]
+    assert [note_id for note_id, _ in notes.items("Front", "Back", overwrite=True)] == [1, 2]
+
+    audio = tmp_path / "hello.mp3"
+    audio.write_bytes(b"mp3")
+    notes.add_media(audio)
+    out = tmp_path / "out.apkg"
+    assert notes.write(out, {1: "Back &amp; more"}, "Back") == 1
+
+    with zipfile.ZipFile(out) as z:
+        assert json.loads(z.read("media")) == {"0": "a.png", "1": "hello.mp3"}
+        assert z.read("1") == b"mp3"
+        z.extract(notes.collection_name, tmp_path / "check")
+    conn = sqlite3.connect(str(tmp_path / "check" / notes.collection_name))
+    flds, sfld, csum, usn = conn.execute("SELECT flds, sfld, csum, usn FROM notes WHERE id = 1").fetchone()
+    untouched = conn.execute("SELECT usn FROM notes WHERE id = 2").fetchone()
+    conn.close()
+    assert flds == FRONT + FIELD_SEPARATOR + "Back &amp; more"
+    # The sort field is Back (index 1) in both schemas
+    assert sfld == "Back & more"
+    assert csum == 1608498781
+    assert usn == -1
+    assert untouched == (5,)
+
+
+def test_apkg_needs_both_fields(apkg, tmp_path):
+    with pytest.raises(ValueError):
+        ApkgNotes(apkg, tmp_path / "work").check_fields("Front", "Audio")
+
+
+def test_csv_round_trip(tmp_path):
+    source = tmp_path / "words.tsv"
+    source.write_text("Front\tBack\nhello\t\nbye\tset\n", encoding="utf-8")
+    notes = CsvNotes(source)
+    items = list(notes.items("Front", "Back"))
+    assert [text for _, text in items] == ["hello"]
+
+    out = tmp_path / "out.csv"
+    notes.write(out, {items[0][0]: "HELLO"}, "Back")
+    assert out.read_text(encoding="utf-8").splitlines() == ["Front,Back", "hello,HELLO", "bye,set"]
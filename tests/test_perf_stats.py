@@ -0,0 +1,91 @@
+﻿import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils import perf_stats
+from utils.metrics import RequestTiming
+from utils.perf_stats import Histogram, PerfStats
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(perf_stats, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def _timing(endpoint, seconds, status=200, characters=0):
+    timing = RequestTiming(endpoint)
+    timing.total = seconds
+    timing.status = status
+    timing.characters = characters
+    return timing
+
+
+def test_percentiles_are_within_the_bucket_error():
+    histogram = Histogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+    assert histogram.percentile(50) == pytest.approx(0.5, rel=0.1)
+    assert histogram.percentile(99) == pytest.approx(0.99, rel=0.1)
+    assert Histogram().percentile(50) is None
+    # Out-of-range values land in the end buckets
+    histogram.record(0)
+    histogram.record(10 ** 6)
+    assert histogram.total == 1002
+
+
+def test_snapshot_rates_and_counts(clock):
+    stats = PerfStats(window=60, slots=12)
+    clock.now += 30
+    for _ in range(8):
+        stats.record(_timing("tts", 0.2, characters=100))
+    stats.record(_timing("tts", 0.2, status=429))
+    stats.record(_timing("generateContent", 1.0, status=500))
+
+    snapshot = stats.snapshot()
+    tts = snapshot["endpoints"]["tts"]
+    assert snapshot["window_seconds"] == 30
+    assert tts["requests"] == 9
+    assert tts["rps"] == pytest.approx(0.3)
+    assert tts["p50_ms"] == pytest.approx(200, rel=0.1)
+    assert tts["throttle_rate"] == pytest.approx(1 / 9, abs=1e-4)
+    assert tts["chars_per_s"] == pytest.approx(800 / 30, abs=0.1)
+    assert snapshot["overall"]["requests"] == 10
+    assert snapshot["endpoints"]["generateContent"]["error_rate"] == 1
+
+
+def test_old_requests_leave_the_window_but_not_the_lifetime(clock):
+    stats = PerfStats(window=60, slots=12)
+    stats.record(_timing("tts", 0.1))
+    clock.now += 61
+    stats.record(_timing("tts", 2.0))
+    snapshot = stats.snapshot()
+    assert snapshot["endpoints"]["tts"]["requests"] == 1
+    assert snapshot["lifetime"]["endpoints"]["tts"]["requests"] == 2
+
+    clock.now += 120
+    assert stats.snapshot()["endpoints"] == {}
+    # percentile() falls back to the lifetime histogram
+    assert stats.percentile("tts", 50) == pytest.approx(0.1, rel=0.1)
+    assert stats.percentile("tts", 50, min_samples=3) is None
+    assert stats.percentile("other", 50) is None
+
+
+def test_export_json(clock, tmp_path):
+    stats = PerfStats()
+    stats.record(_timing("tts", 0.1))
+    path = stats.export_json({"limiters": []}, path=tmp_path / "perf.json")
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data["endpoints"]["tts"]["requests"] == 1
+    assert data["limiters"] == []
+    assert isinstance(data["recent"], list)
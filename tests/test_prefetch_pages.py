@@ -0,0 +1,70 @@
+﻿import threading
+from types import SimpleNamespace
+
+import pytest
+
+from utils import vendor
+
+prefetch_pages = vendor.load("google.generativeai.utils").prefetch_pages
+
+
+class Pager:
+    """A GAPIC-style pager over fixed pages that records which ones were fetched"""
+
+    def __init__(self, pages, fail_at=None):
+        self._pages = pages
+        self.fail_at = fail_at
+        self.fetched = []
+        self.fetched_event = threading.Event()
+
+    @property
+    def pages(self):
+        for number, items in enumerate(self._pages):
+            if number == self.fail_at:
+                raise RuntimeError("page failed")
+            self.fetched.append(number)
+            self.fetched_event.set()
+            yield SimpleNamespace(files=items)
+
+
+def _wait_for(pager, count):
+    for _ in range(100):
+        if len(pager.fetched) >= count:
+            return True
+        pager.fetched_event.wait(0.01)
+        pager.fetched_event.clear()
+    return False
+
+
+def test_items_come_in_page_order():
+    pager = Pager([[1, 2], [], [3], [4, 5]])
+    assert list(prefetch_pages(pager, "files")) == [1, 2, 3, 4, 5]
+
+
+def test_the_next_page_is_fetched_while_the_caller_is_on_this_one():
+    pager = Pager([[1], [2], [3], [4]])
+    items = prefetch_pages(pager, "files")
+    assert next(items) == 1
+    # Page 1 is fetched (and page 2 waits for queue space) before the caller asks
+    assert _wait_for(pager, 2)
+    assert pager.fetched[:2] == [0, 1]
+    assert list(items) == [2, 3, 4]
+
+
+def test_errors_reach_the_caller_after_the_pages_before_them():
+    items = prefetch_pages(Pager([[1], [2], [3]], fail_at=2), "files")
+    assert next(items) == 1
+    assert next(items) == 2
+    with pytest.raises(RuntimeError, match="page failed"):
+        next(items)
+
+
+def test_abandoning_the_iteration_stops_fetching():
+    pager = Pager([[n] for n in range(20)])
+    items = prefetch_pages(pager, "files")
+    assert next(items) == 0
+    items.close()
+    fetched = len(pager.fetched)
+    _wait_for(pager, 20)
+    # The worker stops after at most the page it was trying to hand over
+    assert len(pager.fetched) <= fetched + 1
@@ -0,0 +1,80 @@
+﻿import sqlite3
+import time
+
+from utils.result_cache import ResultCache, make_cache_key
+
+
+def test_key_is_stable_and_covers_the_request():
+    key = make_cache_key("gemini-2.5-flash", "Hello", 0.7, 1000)
+    assert key == make_cache_key("gemini-2.5-flash", "Hello", 0.7, 1000)
+    assert key != make_cache_key("gemini-2.5-flash", "Hello", 0.2, 1000)
+    assert key != make_cache_key("gemini-2.5-pro", "Hello", 0.7, 1000)
+    assert key != make_cache_key("gemini-2.5-flash", "Hello", 0.7, 1000, system_instruction="Be brief")
+    assert key != make_cache_key("gemini-2.5-flash", "Hello", 0.7, 1000, response_schema={"type": "STRING"})
+
+
+def test_key_ignores_file_order():
+    a, b = {"uri": "files/a"}, {"uri": "files/b"}
+    key = make_cache_key("m", "p", 0.7, 100, files=[a, b])
+    assert key == make_cache_key("m", "p", 0.7, 100, files=[b, a])
+    assert key != make_cache_key("m", "p", 0.7, 100, files=[a])
+    assert key != make_cache_key("m", "p", 0.7, 100)
+
+
+def test_results_survive_a_new_instance(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    cache = ResultCache(db)
+    assert cache.get("k") is None
+    cache.put("k", "m", "answer")
+    assert cache.get("k") == "answer"
+    cache.close()
+
+    reopened = ResultCache(db)
+    assert reopened.get("k") == "answer"
+    assert reopened.stats()["hits"] == 1
+    reopened.close()
+
+
+def _age(db, key, days):
+    conn = sqlite3.connect(str(db))
+    conn.execute("UPDATE results SET created = ? WHERE key = ?", (time.time() - days * 86400, key))
+    conn.commit()
+    conn.close()
+
+
+def test_persisted_results_expire_after_max_age(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    cache = ResultCache(db, max_age_days=30)
+    cache.put("old", "m", "stale")
+    cache.put("new", "m", "fresh")
+    cache.close()
+    _age(db, "old", 31)
+
+    reopened = ResultCache(db, max_age_days=30)
+    assert reopened.get("old") is None
+    assert reopened.get("new") == "fresh"
+    assert reopened.purge_expired() == 1
+    assert reopened.purge_expired() == 0
+    reopened.close()
+
+
+def test_memory_entries_expire_after_memory_ttl(tmp_path):
+    db = tmp_path / "cache.sqlite3"
+    cache = ResultCache(db, memory_ttl=0.05, max_age_days=30)
+    cache.put("k", "m", "text")
+    _age(db, "k", 31)
+    # Still answered from memory although the persisted copy has expired
+    assert cache.get("k") == "text"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    cache.close()
+
+
+def test_bypass_templates():
+    cache = ResultCache(bypass_templates=["random fact"])
+    assert cache.is_bypassed("random fact")
+    assert not cache.is_bypassed(None)
+    cache.set_bypass("random fact", False)
+    cache.set_bypass("joke")
+    assert not cache.is_bypassed("random fact")
+    assert cache.is_bypassed("joke")
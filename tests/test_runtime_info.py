@@ -0,0 +1,16 @@
+﻿import importlib.machinery
+
+from utils import runtime_info
+
+
+def test_extensions_need_this_interpreters_abi_tag(tmp_path, monkeypatch):
+    monkeypatch.setattr(importlib.machinery, "EXTENSION_SUFFIXES", [".cp311-win_amd64.pyd", ".pyd"])
+    for name in ("_message.cp39-win_amd64.pyd", "md.cp311-win_amd64.pyd", "plain.pyd", "other.abi3.so"):
+        (tmp_path / name).write_bytes(b"")
+
+    assert runtime_info.vendored_extensions(tmp_path) == [
+        ("_message.cp39-win_amd64.pyd", False),
+        ("md.cp311-win_amd64.pyd", True),
+        ("other.abi3.so", False),
+        ("plain.pyd", True),
+    ]
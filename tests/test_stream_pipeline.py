@@ -0,0 +1,94 @@
+﻿import csv
+import threading
+
+from utils.stream_pipeline import StreamPipeline
+
+
+class Upper:
+    """Fills Back with Front in capitals; stops its pipeline at stop_at"""
+
+    def __init__(self, stop_at=None):
+        self.stop_at = stop_at
+        self.pipeline = None
+        self.seen = []
+        self._lock = threading.Lock()
+
+    def __call__(self, client, text):
+        if text == self.stop_at:
+            self.pipeline.stop()
+            return None, "HTTP 503: unavailable", False
+        with self._lock:
+            self.seen.append(text)
+        return text.upper(), None, False
+
+
+def _pipeline(task, **options):
+    pipeline = StreamPipeline(None, task, "Front", "Back", backoff=0, **options)
+    task.pipeline = pipeline
+    return pipeline
+
+
+def _write_input(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Front", "Back"])
+        writer.writerows(rows)
+
+
+def _read_output(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [tuple(row) for row in csv.reader(f)]
+
+
+def test_fills_rows_in_order(tmp_path):
+    source, output = tmp_path / "in.csv", tmp_path / "out.csv"
+    _write_input(source, [(f"word{i}", "") for i in range(50)] + [("kept", "already"), ("", "")])
+    task = Upper()
+
+    stats = _pipeline(task, workers=4, window=8).run(source, output)
+
+    assert _read_output(output) == [("Front", "Back")] + [(f"word{i}", f"WORD{i}") for i in range(50)] + \
+        [("kept", "already"), ("", "")]
+    assert stats["done"] == 50 and stats["skipped"] == 2 and stats["failed"] == 0
+    assert not (tmp_path / "out.csv.part").exists()
+    assert not (tmp_path / "out.csv.part.json").exists()
+
+
+def test_tsv_output_from_csv_input(tmp_path):
+    source, output = tmp_path / "in.csv", tmp_path / "out.tsv"
+    _write_input(source, [("a", ""), ("b", "")])
+    _pipeline(Upper()).run(source, output)
+    assert output.read_text(encoding="utf-8").splitlines() == ["Front\tBack", "a\tA", "b\tB"]
+
+
+def test_resumes_from_the_checkpoint(tmp_path):
+    source, output = tmp_path / "in.csv", tmp_path / "out.csv"
+    rows = [(f"word{i}", "") for i in range(20)]
+    _write_input(source, rows)
+
+    first = Upper(stop_at="word10")
+    _pipeline(first, workers=1, window=1, checkpoint_rows=3).run(source, output)
+    assert not output.exists()
+    part = tmp_path / "out.csv.part"
+    assert part.exists() and (tmp_path / "out.csv.part.json").exists()
+    # A row half written after the checkpoint is cut off on resume
+    with open(part, "a", encoding="utf-8") as f:
+        f.write("word10,partial")
+
+    second = Upper()
+    _pipeline(second, workers=2).run(source, output)
+
+    assert sorted(second.seen) == sorted(f"word{i}" for i in range(10, 20))
+    assert _read_output(output) == [("Front", "Back")] + [(front, front.upper()) for front, _ in rows]
+    assert not part.exists()
+
+
+def test_without_resume_starts_over(tmp_path):
+    source, output = tmp_path / "in.csv", tmp_path / "out.csv"
+    _write_input(source, [(f"word{i}", "") for i in range(5)])
+    _pipeline(Upper(stop_at="word3"), workers=1, window=1).run(source, output)
+
+    again = Upper()
+    _pipeline(again).run(source, output, resume=False)
+    assert len(again.seen) == 5
+    assert len(_read_output(output)) == 6
@@ -0,0 +1,103 @@
+﻿import os
+import threading
+import time
+
+import pytest
+
+from utils.upload_cache import UploadCache, _to_epoch
+
+
+class FakeUploads:
+    """upload_fn that hands out numbered remote files expiring in `ttl` seconds"""
+
+    def __init__(self, ttl=48 * 3600):
+        self.ttl = ttl
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, path, mime_type, display_name, api_key):
+        with self._lock:
+            self.calls.append((display_name, mime_type, api_key))
+            number = len(self.calls)
+        time.sleep(0.01)
+        return {"name": f"files/{number}", "uri": f"https://files/{number}", "mime_type": mime_type,
+                "expiration_time": time.time() + self.ttl}
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "notes.pdf"
+    path.write_bytes(b"%PDF-1.4 content")
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = UploadCache(FakeUploads(), db_path=tmp_path / "uploads.sqlite3")
+    yield cache
+    cache.close()
+
+
+def test_identical_files_are_uploaded_once_per_key(cache, document, tmp_path):
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(document.read_bytes())
+
+    first = cache.upload(document, "key-a")
+    assert cache.upload(copy, "key-a") == first
+    assert first["mime_type"] == "application/pdf"
+    # Another key's project cannot see the file
+    assert cache.upload(document, "key-b")["name"] != first["name"]
+    assert (cache.uploads, cache.hits) == (2, 1)
+
+
+def test_concurrent_callers_share_one_upload(cache, document):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.upload(document, "key")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache.upload_fn.calls) == 1
+    assert len({entry["name"] for entry in results}) == 1
+
+
+def test_uploads_close_to_expiry_are_refreshed(tmp_path, document):
+    cache = UploadCache(FakeUploads(ttl=600), db_path=tmp_path / "uploads.sqlite3", refresh_margin=3600)
+    assert cache.upload(document, "key")["name"] == "files/1"
+    assert cache.upload(document, "key")["name"] == "files/2"
+    cache.close()
+
+
+def test_changed_files_are_uploaded_again(cache, document):
+    cache.upload(document, "key")
+    document.write_bytes(b"%PDF-1.4 other content")
+    os.utime(document, (time.time() + 10, time.time() + 10))
+    assert cache.upload(document, "key")["name"] == "files/2"
+
+
+def test_forget(cache, document):
+    cache.upload(document, "key-a")
+    cache.upload(document, "key-b")
+    cache.forget(document, "key-a")
+    assert cache.upload(document, "key-a")["name"] == "files/3"
+    assert cache.upload(document, "key-b")["name"] == "files/2"
+    cache.forget(document)
+    assert cache.upload(document, "key-b")["name"] == "files/4"
+
+
+def test_entries_survive_a_new_instance(tmp_path, document):
+    db = tmp_path / "uploads.sqlite3"
+    first = UploadCache(FakeUploads(), db_path=db)
+    entry = first.upload(document, "key")
+    first.close()
+    second = UploadCache(FakeUploads(), db_path=db)
+    assert second.upload(document, "key") == entry
+    assert second.upload_fn.calls == []
+    second.close()
+
+
+def test_rest_expiry_timestamps():
+    assert _to_epoch("1970-01-01T00:01:40.123456789Z") == pytest.approx(100.123456)
+    assert _to_epoch("1970-01-01T00:01:40Z") == 100
+    assert _to_epoch(None) is None
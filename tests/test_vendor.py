@@ -0,0 +1,36 @@
+﻿import sys
+
+from utils import vendor
+
+
+def _real_names():
+    top_level = vendor.install().top_level
+    return sorted(name for name in sys.modules if name.split(".")[0] in top_level
+                  or name.startswith("requests."))
+
+
+def test_vendored_modules_stay_under_the_prefix():
+    before = _real_names()
+    requests = vendor.load("requests")
+    cachetools = vendor.load("cachetools")
+
+    assert requests.__name__ == f"{vendor.PREFIX}.requests"
+    assert cachetools.__name__ == f"{vendor.PREFIX}.cachetools"
+    # requests' own absolute imports were mapped too
+    assert requests.adapters.HTTPAdapter.__module__ == f"{vendor.PREFIX}.requests.adapters"
+    assert requests.packages.urllib3 is sys.modules[f"{vendor.PREFIX}.urllib3"]
+    assert _real_names() == before
+
+
+def test_resources_of_vendored_packages_are_found():
+    where = vendor.load("certifi").where()
+    assert where.startswith(str(vendor.LIB_DIR))
+
+
+def test_vendored_import_module_is_mapped():
+    finder = vendor.install()
+    proxy = finder._proxy("importlib")
+    assert proxy.import_module("idna") is vendor.load("idna")
+    assert proxy.import_module("json") is sys.modules["json"]
+    assert finder.private_name("google.protobuf") == f"{vendor.PREFIX}.google.protobuf"
+    assert finder.private_name("os.path") == "os.path"
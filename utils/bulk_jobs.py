@@ -0,0 +1,445 @@
+﻿"""Headless bulk TTS and text generation over many notes, with resume.
+
+BulkRunner feeds (item_id, text) pairs from any iterable to a worker pool,
+keeping at most a small window of requests in flight so memory does not grow
+with the size of the job. Results are handed to a sink in batches and then
+marked done in a JobStore; after a crash or stop, running the same job again
+skips everything already marked done. A batch lost in a crash is redone, so
+sinks must tolerate seeing an item twice (writing a field is idempotent).
+
+Retryable failures (429, 5xx, connection errors) are retried with
+exponential backoff and jitter. With a limiter (utils/concurrency.py) the
+number of requests in flight adapts to throttling and latency, up to the
+limiter's maximum, instead of being fixed at workers. With profile=True the
+run is profiled (see utils/profiling.py). Nothing here depends on Anki.
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+addon_dir = Path(__file__).parent.parent
+DEFAULT_DB_PATH = addon_dir / "user_files" / "bulk_jobs.sqlite3"
+DEFAULT_AUDIO_CACHE_DIR = addon_dir / "user_files" / "tts_cache"
+
+# Throttling, server errors, and transport failures (GeminiClient reports
+# requests' ConnectionError and Timeout as "Connection error: ...")
+_RETRYABLE = ("HTTP 429", "HTTP 500", "HTTP 502", "HTTP 503", "HTTP 504", "Connection error")
+
+
+def is_retryable(error):
+    """True for throttling, server errors and connection failures"""
+    return bool(error) and str(error).startswith(_RETRYABLE)
+
+
+def call_with_retries(attempt, max_retries=5, backoff=1.0, max_backoff=30.0, stop_event=None, on_retry=None):
+    """Call attempt() -> (output, error, cached) until it succeeds or fails for good.
+
+    Retryable errors are retried up to max_retries times with exponential
+    backoff and jitter; setting stop_event ends the wait early. Returns
+    (output, error, cached, attempts).
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            output, error, cached = attempt()
+        except Exception as e:
+            output, error, cached = None, f"{type(e).__name__}: {e}", False
+        if not error or attempts > max_retries or not is_retryable(error):
+            return output, error, cached, attempts
+        if on_retry is not None:
+            on_retry()
+        delay = min(max_backoff, backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        if stop_event is not None and stop_event.wait(delay):
+            return None, error, False, attempts
+        if stop_event is None:
+            time.sleep(delay)
+
+
+class JobStore:
+    """Persistent per-item progress of bulk jobs (SQLite)"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            # WAL + NORMAL: a crash loses at most the last commit, never corrupts
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                " job_id TEXT NOT NULL,"
+                " item_id INTEGER NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL,"
+                " error TEXT,"
+                " PRIMARY KEY (job_id, item_id))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def start_job(self, job_id, kind, params=None):
+        """Create the job, or reopen it for resuming"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created, updated) VALUES (?, ?, ?, 'running', ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET status = 'running', updated = excluded.updated",
+                (job_id, kind, json.dumps(params or {}, sort_keys=True), now, now),
+            )
+            conn.commit()
+
+    def finish_job(self, job_id, status):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (status, time.time(), job_id))
+            conn.commit()
+
+    def job(self, job_id):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT kind, params, status, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, params, status, created, updated = row
+        return {"id": job_id, "kind": kind, "params": json.loads(params), "status": status,
+                "created": created, "updated": updated}
+
+    def done_ids(self, job_id):
+        """Item ids already completed for this job"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT item_id FROM items WHERE job_id = ? AND status = 'done'", (job_id,)
+            )
+            return {row[0] for row in rows}
+
+    def record(self, job_id, results):
+        """Store a batch of (item_id, status, attempts, error) in one transaction"""
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO items (job_id, item_id, status, attempts, error) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, item_id, status, attempts, error) for item_id, status, attempts, error in results],
+            )
+            conn.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+            conn.commit()
+
+    def counts(self, job_id):
+        """Return {status: count} for the job's items"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+            )
+            return dict(rows.fetchall())
+
+    def delete_job(self, job_id):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class TtsTask:
+    """Synthesize each text to an MP3 in media_dir; output is the file name.
+
+    File names are derived from voice and text, so repeated texts (in this or
+    an earlier job) reuse the existing file instead of calling the API. With
+    cache_dir, new files are also kept there and looked up from there, so
+    jobs writing to different media folders share one audio cache.
+    """
+
+    kind = "tts"
+
+    def __init__(self, media_dir, voice_name="en-US-Wavenet-D", cache_dir=None):
+        self.media_dir = Path(media_dir)
+        self.voice_name = voice_name
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.media_dir.mkdir(parents=True, exist_ok=True)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def params(self):
+        return {"voice": self.voice_name}
+
+    def file_name(self, text):
+        digest = hashlib.sha1(f"{self.voice_name}\x1f{text}".encode("utf-8")).hexdigest()[:20]
+        return f"gemini_tts_{digest}.mp3"
+
+    def lookup(self, text):
+        """File name if the audio already exists here or in the cache, else None"""
+        name = self.file_name(text)
+        path = self.media_dir / name
+        if path.exists():
+            return name
+        if self.cache_dir is not None and (self.cache_dir / name).exists():
+            _link_or_copy(self.cache_dir / name, path)
+            return name
+        return None
+
+    def __call__(self, client, text):
+        """Return (output, error, cached)"""
+        name = self.lookup(text)
+        if name is not None:
+            return name, None, True
+        name = self.file_name(text)
+        path = self.media_dir / name
+        cached = self.cache_dir / name if self.cache_dir is not None else None
+        # Write to a temporary name so a crash never leaves a truncated file
+        partial = path.with_suffix(f".{threading.get_ident()}.part")
+        audio, error = client.generate_tts_audio(text, voice_name=self.voice_name, out_path=str(partial))
+        if error:
+            if partial.exists():
+                partial.unlink()
+            return None, error, False
+        os.replace(partial, path)
+        if cached is not None:
+            _link_or_copy(path, cached)
+        return name, None, False
+
+
+def _link_or_copy(source, target):
+    """Hard-link source to target (copy across file systems), atomically"""
+    partial = target.with_suffix(f".{threading.get_ident()}.part")
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copyfile(source, partial)
+    os.replace(partial, target)
+
+
+class GenerateTask:
+    """Run a prompt template over each text; output is the generated text"""
+
+    kind = "generate"
+
+    def __init__(self, template="{text}", model="gemini-2.5-flash", temperature=0.7,
+                 max_tokens=1024, system_instruction=None):
+        self.template = template
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.system_instruction = system_instruction
+
+    def params(self):
+        return {"template": self.template, "model": self.model, "temperature": self.temperature,
+                "max_tokens": self.max_tokens}
+
+    def __call__(self, client, text):
+        return client.generate_text(
+            self.template.format(text=text),
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            system_instruction=self.system_instruction,
+            template="bulk",
+            return_cached=True,
+        )
+
+
+class BulkStats:
+    """Counters and per-stage busy time of one run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.read = 0
+        self.skipped = 0
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.cached = 0
+        self.stage_seconds = {"read": 0.0, "request": 0.0, "write": 0.0}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def timed(self, stage, fn, *args):
+        """Call fn(*args), adding its duration to the stage"""
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.add_stage(stage, time.perf_counter() - started)
+
+    def as_dict(self):
+        wall = (self.finished or time.perf_counter()) - self.started
+        processed = self.done + self.failed
+        return {
+            "wall_s": round(wall, 3),
+            "read": self.read,
+            "skipped": self.skipped,
+            "done": self.done,
+            "failed": self.failed,
+            "retries": self.retries,
+            "cached": self.cached,
+            "items_per_s": round(processed / wall, 2) if wall else None,
+            "stage_seconds": {k: round(v, 3) for k, v in self.stage_seconds.items()},
+        }
+
+
+class BulkRunner:
+    """Runs a task over many items with bounded concurrency, retries and resume"""
+
+    def __init__(self, client, task, job_id, store=None, workers=8, max_retries=5,
+                 backoff=1.0, max_backoff=30.0, flush_size=200, flush_interval=2.0, profile=False,
+                 limiter=None):
+        self.client = client
+        self.task = task
+        self.job_id = job_id
+        self.store = store or JobStore()
+        self.limiter = limiter
+        self.workers = limiter.max_limit if limiter is not None else max(1, workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.profile = profile
+        self.stats = BulkStats()
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        """Finish the requests in flight, save progress and return from run()"""
+        self.stop_event.set()
+
+    def _attempt(self, text):
+        if self.limiter is None:
+            return self.stats.timed("request", self.task, self.client, text)
+        return self.limiter.attempt(
+            lambda: self.stats.timed("request", self.task, self.client, text), self.stop_event
+        )
+
+    def _process(self, item_id, text):
+        output, error, cached, attempts = call_with_retries(
+            lambda: self._attempt(text),
+            self.max_retries, self.backoff, self.max_backoff, self.stop_event, self.stats.add_retry,
+        )
+        return item_id, output, error, attempts, cached
+
+    def run(self, items, sink=None, progress=None):
+        """Process items; returns the stats dict.
+
+        items yields (item_id, text) with integer ids. sink(results), if given,
+        receives lists of (item_id, output) for successful items before they
+        are marked done. progress(stats) is called after every flush. When
+        profiling, the stats dict also has the written files under "profile".
+        """
+        if not self.profile:
+            return self._run(items, sink, progress)
+        from .profiling import JobProfiler
+
+        profiler = JobProfiler(f"bulk-{self.task.kind}-{self.job_id}")
+        with profiler:
+            result = self._run(items, sink, progress)
+        result["profile"] = {k: str(v) for k, v in profiler.paths.items()}
+        return result
+
+    def _run(self, items, sink, progress):
+        self.store.start_job(self.job_id, self.task.kind, self.task.params())
+        done_ids = self.store.done_ids(self.job_id)
+        window = self.workers * 2
+        source = iter(items)
+        exhausted = False
+        pending = set()
+        outputs = []
+        records = []
+        last_flush = time.perf_counter()
+
+        def flush():
+            started = time.perf_counter()
+            if outputs and sink is not None:
+                sink(list(outputs))
+            if records:
+                self.store.record(self.job_id, records)
+            outputs.clear()
+            records.clear()
+            self.stats.add_stage("write", time.perf_counter() - started)
+            if progress is not None:
+                progress(self.stats)
+
+        log.info("Bulk job %s (%s) starting, %d items already done", self.job_id, self.task.kind, len(done_ids))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                started = time.perf_counter()
+                while not exhausted and len(pending) < window and not self.stop_event.is_set():
+                    try:
+                        item_id, text = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    self.stats.read += 1
+                    if item_id in done_ids:
+                        self.stats.skipped += 1
+                        continue
+                    pending.add(metrics.submit(executor, self._process, item_id, text))
+                self.stats.add_stage("read", time.perf_counter() - started)
+                if not pending:
+                    break
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item_id, output, error, attempts, cached = future.result()
+                    if error:
+                        self.stats.failed += 1
+                        records.append((item_id, "failed", attempts, str(error)[:500]))
+                        log.warning("Bulk item %s failed after %d attempts: %.200s", item_id, attempts, error)
+                    else:
+                        self.stats.done += 1
+                        self.stats.cached += cached
+                        outputs.append((item_id, output))
+                        records.append((item_id, "done", attempts, None))
+                if len(records) >= self.flush_size or time.perf_counter() - last_flush >= self.flush_interval:
+                    flush()
+                    last_flush = time.perf_counter()
+            flush()
+
+        self.stats.finished = time.perf_counter()
+        status = "stopped" if self.stop_event.is_set() and not exhausted else "finished"
+        self.store.finish_job(self.job_id, status)
+        result = self.stats.as_dict()
+        if self.limiter is not None:
+            result["concurrency"] = self.limiter.status()
+        log.info("Bulk job %s %s: %s", self.job_id, status, result)
+        return result
@@ -0,0 +1,240 @@
+﻿"""Record/replay transport for offline, repeatable client runs.
+
+CassetteAdapter is a requests transport adapter. In "record" mode it passes
+requests to the real adapter and appends each request/response pair to a
+cassette file; in "replay" mode it answers from the cassette without touching
+the network, either with the recorded timing (speed=1.0, or scaled) or at
+full speed (speed=0). Replay matches requests exactly by default; with
+match="route" a request whose exact body was never recorded gets the
+recorded responses for the same method and path in turn, which lets a
+benchmark send its own prompts and still get real-shaped responses.
+
+Cassettes are JSON lines, gzip-compressed when the name ends in .gz. API keys
+are never written: the x-goog-api-key header and key= query parameter are
+dropped, any other occurrence of the key is replaced, and only a hash of the
+request body is kept for matching.
+
+    session = requests.Session()
+    session.mount("https://", CassetteAdapter("run.jsonl.gz", "record", inner=session.get_adapter("https://")))
+    client = GeminiClient(api_key, session=session)
+
+Setting GEMINI_TTS_CASSETTE (and optionally GEMINI_TTS_CASSETTE_MODE,
+_SPEED and _MATCH) makes get_session() install it on the shared session.
+"""
+
+import io
+import json
+import gzip
+import time
+import base64
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from . import metrics, vendor
+
+_requests = vendor.load("requests")
+BaseAdapter = _requests.adapters.BaseAdapter
+RequestsConnectionError = _requests.exceptions.ConnectionError
+Response = _requests.models.Response
+CaseInsensitiveDict = _requests.structures.CaseInsensitiveDict
+
+REDACTED = "REDACTED"
+
+# Response headers worth keeping; the rest only bloat the cassette
+_KEPT_HEADERS = ("content-type", "retry-after", "x-goog-upload-url", "x-goog-upload-status")
+
+
+class CassetteMiss(RequestsConnectionError):
+    """Replay found no recorded response for a request"""
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _secrets(request):
+    secrets = []
+    header = request.headers.get("x-goog-api-key")
+    if header:
+        secrets.append(header)
+    for name, value in parse_qsl(urlsplit(request.url).query):
+        if name == "key" and value:
+            secrets.append(value)
+    return secrets
+
+
+def _scrub(data, secrets):
+    for secret in secrets:
+        data = data.replace(secret, REDACTED)
+    return data
+
+
+def _redact_path(url, secrets):
+    """Path and query without the key; the host is left out so a cassette
+    recorded against the mock server replays against the real URLs"""
+    parts = urlsplit(url)
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if k != "key"])
+    return _scrub(urlunsplit(("", "", parts.path, query, "")), secrets)
+
+
+def _body_bytes(request):
+    body = request.body
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    if isinstance(body, bytes):
+        return body
+    # File uploads are streamed; match them by size only
+    return f"<stream {request.headers.get('Content-Length', '?')} bytes>".encode("ascii")
+
+
+def request_key(request):
+    """Return (route, key): method and redacted path, plus a redacted body hash"""
+    secrets = _secrets(request)
+    body = _body_bytes(request)
+    for secret in secrets:
+        body = body.replace(secret.encode("utf-8"), REDACTED.encode("ascii"))
+    route = f"{request.method} {_redact_path(request.url, secrets)}"
+    return route, f"{route} {hashlib.sha256(body).hexdigest()[:32]}"
+
+
+class CassetteAdapter(BaseAdapter):
+    """Records to or replays from a cassette file (see module docstring)"""
+
+    def __init__(self, path, mode="replay", inner=None, speed=0.0, match="exact"):
+        super().__init__()
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if match not in ("exact", "route"):
+            raise ValueError(f"Unknown cassette match: {match}")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording needs the real adapter as inner")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.speed = speed
+        self.match = match
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._routes = {}
+        self._positions = {}
+        self._file = None
+        if mode == "replay":
+            self._load()
+        else:
+            self._file = _open(path, "a")
+
+    def _load(self):
+        with _open(self.path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+                    self._routes.setdefault(entry["route"], []).append(entry)
+
+    def __len__(self):
+        return sum(len(v) for v in self._entries.values())
+
+    def send(self, request, stream=False, **kwargs):
+        if self.mode == "record":
+            return self._record(request, stream, **kwargs)
+        return self._replay(request)
+
+    def _record(self, request, stream, **kwargs):
+        route, key = request_key(request)
+        secrets = _secrets(request)
+        start = time.perf_counter()
+        response = self.inner.send(request, stream=False, **kwargs)
+        body = response.content
+        elapsed = time.perf_counter() - start
+
+        try:
+            text = body.decode("utf-8")
+            encoded = {"text": _scrub(text, secrets)}
+        except UnicodeDecodeError:
+            encoded = {"base64": base64.b64encode(body).decode("ascii")}
+        entry = {
+            "route": route,
+            "key": key,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: _scrub(v, secrets) for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS},
+            "elapsed": round(elapsed, 6),
+            "request_bytes": len(_body_bytes(request)),
+            **encoded,
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._file.flush()
+        return response
+
+    def _next_entry(self, route, key):
+        """Recorded responses for a key are returned in order, the last one
+        repeating; in route mode, unknown bodies cycle through the route's"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries:
+                position = self._positions.get(key, 0)
+                self._positions[key] = position + 1
+                return entries[min(position, len(entries) - 1)]
+            entries = self._routes.get(route) if self.match == "route" else None
+            if entries:
+                position = self._positions.get(route, 0)
+                self._positions[route] = position + 1
+                return entries[position % len(entries)]
+            return None
+
+    def _replay(self, request):
+        route, key = request_key(request)
+        entry = self._next_entry(route, key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for {key}", request=request)
+
+        delay = entry["elapsed"] * self.speed
+        if delay > 0:
+            time.sleep(delay)
+        if "base64" in entry:
+            body = base64.b64decode(entry["base64"])
+        else:
+            body = entry["text"].encode("utf-8")
+
+        response = Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+
+        timing = metrics.current()
+        if timing is not None:
+            timing.http_requests += 1
+            timing.status = response.status_code
+            timing.request_bytes += entry.get("request_bytes", 0)
+            timing.response_bytes += len(body)
+            timing.add("ttfb", delay)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.inner is not None:
+            self.inner.close()
+
+
+def install(session, path, mode="replay", speed=0.0, match="exact"):
+    """Mount a CassetteAdapter for http(s) on session; returns it"""
+    inner = session.get_adapter("https://") if mode == "record" else None
+    adapter = CassetteAdapter(path, mode, inner=inner, speed=speed, match=match)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
@@ -0,0 +1,170 @@
+﻿"""Adaptive concurrency limits (AIMD) for bulk requests.
+
+Instead of a fixed worker count, an AimdLimiter decides how many requests
+to one endpoint may be in flight:
+
+- additive increase: each successful request adds 1/limit, so the limit
+  grows by about one per round trip while latency stays near its baseline
+  and nothing is throttled
+- multiplicative decrease: a 429 or 503, or recent latency rising above
+  latency_tolerance times the baseline, multiplies the limit by decrease
+  (at most once per round trip: answers to requests sent before the last
+  decrease do not count again)
+
+The limit therefore follows whatever the service allows at the moment.
+Limiters are shared per endpoint ("tts", "generate") within a process and
+configured in config.json:
+
+    "adaptive_concurrency": {"enabled": true,
+                             "tts": {"initial": 8, "min": 1, "max": 64},
+                             "generate": {"initial": 4, "min": 1, "max": 32}}
+
+limiters() reports their state for the Performance tab and the command line.
+"""
+
+import time
+import threading
+from collections import Counter
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+THROTTLE_ERRORS = ("HTTP 429", "HTTP 503")
+DEFAULTS = {
+    "tts": {"initial": 8, "min": 1, "max": 64},
+    "generate": {"initial": 4, "min": 1, "max": 32},
+}
+
+
+class AimdLimiter:
+    """Concurrency limit for one endpoint, adjusted from each request's outcome"""
+
+    def __init__(self, name, initial=4, min_limit=1, max_limit=64, increase=1.0, decrease=0.5,
+                 latency_tolerance=2.0, warmup=10):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.warmup = warmup
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.baseline = None  # slow moving average of latency
+        self.recent = None  # fast moving average of latency
+        self.samples = 0
+        self.counts = Counter()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self, stop_event=None):
+        """Wait for a free slot; returns a token for release(), or None if stop_event was set"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                self._cond.wait(0.5)
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, token, latency=None, throttled=False):
+        """Give the slot back. latency is None for answers that say nothing about
+        the service (cache hits, errors that are not throttling)"""
+        with self._cond:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            if throttled:
+                self._back_off(token, "throttled")
+            elif latency is not None:
+                self._add_sample(latency)
+                if self.samples >= self.warmup and self.recent > self.latency_tolerance * self.baseline:
+                    self._back_off(token, "latency")
+                elif in_flight * 2 >= self.limit:
+                    # Only grow while the limit is actually in use
+                    self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+            self._cond.notify_all()
+
+    def _add_sample(self, latency):
+        self.samples += 1
+        if self.baseline is None:
+            self.baseline = self.recent = latency
+            return
+        self.baseline += 0.02 * (latency - self.baseline)
+        self.recent += 0.2 * (latency - self.recent)
+
+    def _back_off(self, token, reason):
+        if token < self._last_decrease:
+            return
+        before = self.limit
+        self._limit = max(self.min_limit, self._limit * self.decrease)
+        self._last_decrease = time.monotonic()
+        self.counts[reason] += 1
+        log.info("Concurrency for %s lowered %d -> %d (%s)", self.name, before, self.limit, reason)
+
+    def attempt(self, fn, stop_event=None):
+        """Run fn() -> (output, error, cached) in a slot and learn from its outcome"""
+        token = self.acquire(stop_event)
+        if token is None:
+            return None, "Stopped", False
+        started = time.perf_counter()
+        throttled = False
+        latency = None
+        try:
+            output, error, cached = fn()
+            throttled = bool(error) and str(error).startswith(THROTTLE_ERRORS)
+            if not error and not cached:
+                latency = time.perf_counter() - started
+            return output, error, cached
+        finally:
+            self.release(token, latency, throttled)
+
+    def status(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "baseline_ms": round(self.baseline * 1000) if self.baseline is not None else None,
+                "recent_ms": round(self.recent * 1000) if self.recent is not None else None,
+                "decreases": dict(self.counts),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint, config=None, max_limit=None):
+    """The shared limiter for endpoint ("tts" or "generate"), or None if disabled in config.
+
+    max_limit (e.g. a --workers option) overrides the configured maximum.
+    """
+    settings = (config or {}).get("adaptive_concurrency") or {}
+    if not settings.get("enabled", True):
+        return None
+    options = {**DEFAULTS.get(endpoint, {}), **(settings.get(endpoint) or {})}
+    if max_limit:
+        options["max"] = max_limit
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            limiter = _limiters[endpoint] = AimdLimiter(
+                endpoint, initial=options.get("initial", 4), min_limit=options.get("min", 1),
+                max_limit=options.get("max", 64),
+            )
+        elif max_limit:
+            limiter.max_limit = max(limiter.min_limit, max_limit)
+        return limiter
+
+
+def limiters():
+    """{endpoint: status} of the limiters in use in this process"""
+    with _limiters_lock:
+        current = dict(_limiters)
+    return {name: limiter.status() for name, limiter in sorted(current.items())}
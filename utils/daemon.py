@@ -0,0 +1,446 @@
+﻿"""Optional localhost daemon sharing one client, cache, connection pool and
+quota between Anki profiles, the command line and scripts.
+
+    python -m gemini_tts.cli serve
+
+The daemon owns the API key, the pooled session, the result cache and the
+audio cache (user_files/tts_cache/). Identical requests that arrive while one
+is already running wait for that one instead of going upstream again
+(single-flight), and upstream calls pass a token bucket per operation, so
+all processes together stay within the configured requests per minute.
+
+While running it writes user_files/daemon.json with its URL and a random
+token. With "use_daemon": true in config.json, get_daemon() reads that file,
+and GeminiClient(daemon=...) then sends generate_text and generate_tts_audio
+through the daemon, falling back to the API directly if the daemon cannot be
+reached. A request that was sent but not answered (a timeout, or the
+connection dropped) is reported as an error instead: the daemon may still be running it, so sending
+it upstream as well could pay for it twice.
+
+HTTP API (localhost only, X-Gemini-TTS-Token header required):
+    GET  /health
+    GET  /stats
+    POST /generate_text  {"prompt", "model", "temperature", "max_tokens", "response_schema",
+                          "system_instruction", "template", "use_cache"} -> {"text"} or {"error"}
+    POST /generate_tts   {"text", "voice_name"} -> audio/mpeg, or {"error"}
+"""
+
+import os
+import hmac
+import json
+import time
+import secrets
+import threading
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+addon_dir = Path(__file__).parent.parent
+INFO_PATH = addon_dir / "user_files" / "daemon.json"
+DEFAULT_PORT = 8766
+TOKEN_HEADER = "X-Gemini-TTS-Token"
+
+
+class DaemonUnavailable(ConnectionError):
+    """The daemon could not be reached; call the API directly instead"""
+
+
+class DaemonError(Exception):
+    """The request reached the daemon but got no usable answer (e.g. a timeout)"""
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; callers wait their turn in arrival order"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0 if per_minute else 0.0
+        self.capacity = burst or max(1.0, self.rate * 2)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """Take a token, sleeping until one is free; returns the seconds waited,
+        or None (taking nothing) if that would be longer than max_wait"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            # Reserve the token now; later callers queue behind it
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SingleFlight:
+    """Runs fn once per key at a time; concurrent callers share its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True for callers that waited on another's call"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class DaemonService:
+    """What the daemon does for each request, independent of HTTP"""
+
+    def __init__(self, client, audio_dir=None, limits=None, max_wait=120.0):
+        from .bulk_jobs import DEFAULT_AUDIO_CACHE_DIR
+
+        self.client = client
+        self.audio_dir = Path(audio_dir or DEFAULT_AUDIO_CACHE_DIR)
+        limits = limits or {}
+        self.limiters = {name: TokenBucket(limits.get(name, 0)) for name in ("generate", "tts")}
+        self.max_wait = max_wait
+        self.flight = SingleFlight()
+        self.counters = Counter()
+        self._counters_lock = threading.Lock()
+        self._tts_tasks = {}
+        self.started = time.time()
+
+    def count(self, name, n=1):
+        with self._counters_lock:
+            self.counters[name] += n
+
+    def _limit(self, kind):
+        waited = self.limiters[kind].acquire(self.max_wait)
+        if waited is None:
+            self.count(f"{kind}_rate_limited")
+            return False
+        if waited:
+            self.count(f"{kind}_rate_wait_ms", int(waited * 1000))
+        return True
+
+    def generate_text(self, prompt, model="gemini-2.5-flash", temperature=0.7, max_tokens=1024,
+                      response_schema=None, system_instruction=None, template=None, use_cache=True):
+        """Returns (text, error, cached) like GeminiClient.generate_text(return_cached=True)"""
+        from .result_cache import make_cache_key
+
+        self.count("generate_requests")
+        cache = self.client.result_cache
+        if cache is not None and (not use_cache or cache.is_bypassed(template)):
+            cache = None
+        key = make_cache_key(model, prompt, temperature, max_tokens, response_schema, system_instruction, None)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                self.count("generate_cache_hits")
+                return cached, None, True
+
+        def call():
+            if not self._limit("generate"):
+                return None, "HTTP 429: daemon rate limit (waited too long for a slot)", False
+            self.count("generate_upstream")
+            text, error = self.client.generate_text(
+                prompt, model=model, temperature=temperature, max_tokens=max_tokens,
+                response_schema=response_schema, system_instruction=system_instruction,
+                template=template, use_cache=False,
+            )
+            if text and cache is not None:
+                cache.put(key, model, text)
+            return text, error, False
+
+        if not use_cache:
+            return call()
+        result, shared = self.flight.do(("generate", key), call)
+        if shared:
+            self.count("generate_coalesced")
+        return result
+
+    def _tts_task(self, voice_name):
+        from .bulk_jobs import TtsTask
+
+        task = self._tts_tasks.get(voice_name)
+        if task is None:
+            task = self._tts_tasks[voice_name] = TtsTask(self.audio_dir, voice_name)
+        return task
+
+    def generate_tts(self, text, voice_name="en-US-Wavenet-D"):
+        """Returns (path of the MP3 in the audio cache, error)"""
+        self.count("tts_requests")
+        task = self._tts_task(voice_name)
+        name = task.lookup(text)
+        if name is not None:
+            self.count("tts_cache_hits")
+            return task.media_dir / name, None
+
+        def call():
+            if not self._limit("tts"):
+                return None, "HTTP 429: daemon rate limit (waited too long for a slot)"
+            self.count("tts_upstream")
+            output, error, _ = task(self.client, text)
+            return output, error
+
+        (name, error), shared = self.flight.do(("tts", task.file_name(text)), call)
+        if shared:
+            self.count("tts_coalesced")
+        return (task.media_dir / name if name else None), error
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        stats = {"pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1), "counters": counters}
+        if self.client.key_pool is not None:
+            stats["keys"] = self.client.key_pool.status()
+        return stats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        log.debug("daemon %s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), self.server.token):
+            return True
+        self._send(403, {"error": "Bad or missing daemon token"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        service = self.server.service
+        if self.path == "/health":
+            return self._send(200, {"ok": True, "pid": os.getpid()})
+        if self.path == "/stats":
+            return self._send(200, service.stats())
+        return self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        service = self.server.service
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "Invalid JSON"})
+
+        try:
+            if self.path == "/generate_text":
+                text, error, cached = service.generate_text(**request)
+                return self._send(200, {"text": text, "error": error, "cached": cached})
+            if self.path == "/generate_tts":
+                path, error = service.generate_tts(**request)
+                if error:
+                    return self._send(200, {"error": error})
+                with open(path, "rb") as f:
+                    return self._send(200, f.read(), "audio/mpeg")
+        except TypeError as e:
+            return self._send(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            log.exception("Daemon request %s failed", self.path)
+            return self._send(200, {"error": f"Daemon error: {e}"})
+        return self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # listen() backlog; must be set before the socket is bound. Several bulk
+    # jobs connecting at once overflow the default of 5
+    request_queue_size = 128
+
+
+class DaemonServer:
+    """The daemon's HTTP server; serve_forever() publishes it in daemon.json"""
+
+    def __init__(self, service, host="127.0.0.1", port=DEFAULT_PORT, info_path=INFO_PATH):
+        self.service = service
+        self.info_path = Path(info_path)
+        self.httpd = _HTTPServer((host, port), _Handler)
+        self.httpd.service = service
+        self.httpd.token = secrets.token_urlsafe(24)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _publish(self):
+        self.info_path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.info_path.with_suffix(".part")
+        # Only this user may read the token
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "token": self.httpd.token, "pid": os.getpid()}, f)
+        os.replace(partial, self.info_path)
+
+    def _unpublish(self):
+        try:
+            with open(self.info_path, encoding="utf-8") as f:
+                if json.load(f).get("pid") != os.getpid():
+                    return
+            self.info_path.unlink()
+        except (OSError, ValueError):
+            pass
+
+    def serve_forever(self):
+        self._publish()
+        log.info("Daemon listening on %s", self.url)
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self._unpublish()
+            self.httpd.server_close()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+
+class DaemonClient:
+    """GeminiClient-shaped calls answered by a running daemon"""
+
+    def __init__(self, url, token, session=None, timeout=300):
+        from .gemini_client import get_session
+
+        self.url = url.rstrip("/")
+        self.headers = {TOKEN_HEADER: token}
+        self.session = session or get_session()
+        self.timeout = timeout
+
+    def _post(self, path, payload):
+        """The daemon's response. Raises DaemonUnavailable only if no connection
+        was made, so the daemon cannot have seen the request; anything that
+        fails after it was sent raises DaemonError"""
+        from . import vendor
+
+        exceptions = vendor.load("requests.exceptions")
+        urllib3_exceptions = vendor.load("urllib3.exceptions")
+
+        try:
+            return self.session.post(f"{self.url}{path}", json=payload, headers=self.headers, timeout=self.timeout)
+        except exceptions.ConnectTimeout as e:
+            raise DaemonUnavailable(str(e)) from e
+        except exceptions.ConnectionError as e:
+            # Refused: requests wraps urllib3's NewConnectionError in a MaxRetryError
+            reason = getattr(e.args[0], "reason", None) if e.args else None
+            if isinstance(reason, urllib3_exceptions.NewConnectionError):
+                raise DaemonUnavailable(str(e)) from e
+            raise DaemonError(str(e)) from e
+        except exceptions.Timeout as e:
+            raise DaemonError(f"daemon did not answer within {self.timeout} s") from e
+        except exceptions.RequestException as e:
+            raise DaemonError(str(e)) from e
+
+    def health(self, timeout=1.0):
+        try:
+            response = self.session.get(f"{self.url}/health", headers=self.headers, timeout=timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    def stats(self):
+        return self.session.get(f"{self.url}/stats", headers=self.headers, timeout=5).json()
+
+    def generate_text(self, prompt, model="gemini-2.5-flash", temperature=0.7, max_tokens=1024,
+                      response_schema=None, system_instruction=None, template=None, use_cache=True,
+                      return_cached=False):
+        try:
+            with metrics.track("daemon", op="generate_text", model=model, template=template):
+                response = self._post("/generate_text", {
+                    "prompt": prompt, "model": model, "temperature": temperature, "max_tokens": max_tokens,
+                    "response_schema": response_schema, "system_instruction": system_instruction,
+                    "template": template, "use_cache": use_cache,
+                })
+        except DaemonError as e:
+            log.error("Daemon request failed: %s", e)
+            result = {"error": f"Connection error: {e}"}
+        else:
+            if response.status_code != 200:
+                raise DaemonUnavailable(f"HTTP {response.status_code}: {response.text[:200]}")
+            result = response.json()
+        text, error, cached = result.get("text"), result.get("error"), bool(result.get("cached"))
+        return (text, error, cached) if return_cached else (text, error)
+
+    def generate_tts_audio(self, text, voice_name="en-US-Wavenet-D", out_path=None):
+        with metrics.track("daemon", op="generate_tts", voice=voice_name) as timing:
+            timing.characters = len(text)
+            try:
+                response = self._post("/generate_tts", {"text": text, "voice_name": voice_name})
+            except DaemonError as e:
+                log.error("Daemon request failed: %s", e)
+                return None, f"Connection error: {e}"
+            if response.status_code != 200:
+                raise DaemonUnavailable(f"HTTP {response.status_code}: {response.text[:200]}")
+            if not response.headers.get("Content-Type", "").startswith("audio/"):
+                return None, response.json().get("error")
+            audio = response.content
+            if out_path:
+                with timing.phase("file_write"):
+                    with open(out_path, "wb") as f:
+                        f.write(audio)
+        return audio, None
+
+
+_found = None
+_found_at = 0.0
+_found_lock = threading.Lock()
+
+
+def get_daemon(config=None, info_path=INFO_PATH, recheck=30.0):
+    """A DaemonClient if a daemon is running and config enables it, else None.
+
+    The answer is reused for recheck seconds, so this is cheap to call for
+    every new GeminiClient.
+    """
+    global _found, _found_at
+    if config is not None and not config.get("use_daemon", False):
+        return None
+    with _found_lock:
+        if time.monotonic() - _found_at < recheck:
+            return _found
+        _found, _found_at = None, time.monotonic()
+        try:
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        client = DaemonClient(info["url"], info["token"])
+        if client.health():
+            log.info("Using the Gemini TTS daemon at %s (pid %s)", info["url"], info.get("pid"))
+            _found = client
+        return _found
@@ -0,0 +1,210 @@
+﻿import re
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import metrics
+
+# Rough average for English prose; good enough to size chunks well below the model limit.
+CHARS_PER_TOKEN = 4
+
+CARD_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "front": {"type": "STRING"},
+            "back": {"type": "STRING"},
+        },
+        "required": ["front", "back"],
+    },
+}
+
+CARD_INSTRUCTION = (
+    "You write Anki flashcards. From the document excerpt, extract the key facts "
+    "and concepts as atomic question/answer cards. Each front asks exactly one "
+    "thing; each back is short. Skip content that is cut off at the start or end "
+    "of the excerpt. Return an empty list if nothing is worth a card."
+)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PDF_COUNT_RE = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+# pdf_page_count reads the file in blocks; the overlap catches a dictionary split between two
+_PDF_BLOCK = 1024 * 1024
+_PDF_OVERLAP = 4096
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for chunk budgeting"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_text(text, max_tokens=3000, overlap_tokens=200):
+    """Split text into chunks of at most max_tokens, overlapping by overlap_tokens.
+
+    Paragraph boundaries are preferred; paragraphs longer than the budget are
+    split on sentence ends, and as a last resort on whitespace.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if sentence:
+                pieces.append(sentence)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        chunks.append(current)
+        tail = current[-overlap_chars:] if overlap_chars else ""
+        space = tail.find(" ")
+        tail = tail[space + 1:] if space >= 0 else tail
+        current = f"{tail}\n\n{piece}" if tail and len(tail) + len(piece) + 2 <= max_chars else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pdf_page_count(path):
+    """Page count from the PDF's page tree, or None if it cannot be found cheaply.
+
+    The root /Pages node holds the largest /Count. The file is scanned in
+    1 MiB blocks, so a large PDF is never held in memory. PDFs that keep their
+    page tree in compressed object streams are not parsed; callers then treat
+    the document as a single chunk.
+    """
+    best = None
+    tail = b""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_PDF_BLOCK), b""):
+            data = tail + block
+            for a, b in _PDF_COUNT_RE.findall(data):
+                count = int(a or b)
+                best = count if best is None or count > best else best
+            tail = data[-_PDF_OVERLAP:]
+    return best
+
+
+def page_prompts(pages, pages_per_chunk=10):
+    """One map prompt per page range of an attached document (whole document if pages is None)"""
+    if not pages:
+        return ["Make flashcards from the attached document."]
+    return [
+        f"Make flashcards from pages {start}-{min(start + pages_per_chunk - 1, pages)} "
+        f"of the attached document only."
+        for start in range(1, pages + 1, pages_per_chunk)
+    ]
+
+
+def parse_cards(text):
+    """Parse the model's JSON answer into a list of {"front", "back"} dicts"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return []
+    cards = []
+    for item in data if isinstance(data, list) else []:
+        if not isinstance(item, dict):
+            continue
+        front = str(item.get("front", "")).strip()
+        back = str(item.get("back", "")).strip()
+        if front and back:
+            cards.append({"front": front, "back": back})
+    return cards
+
+
+def _card_words(card):
+    return frozenset(w.lower() for w in _WORD_RE.findall(card["front"]))
+
+
+class CardDeduper:
+    """Reduce step: drops cards whose front repeats one already kept.
+
+    Fronts are compared as word sets, so reworded duplicates from overlapping
+    chunks ("What is X?" / "What is X") are caught. The first card wins, since
+    it may already have been added to the collection.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.cards = []
+        self._words = []
+
+    def add(self, card):
+        """Return True if card is new, False if it duplicates a kept card"""
+        words = _card_words(card)
+        for seen in self._words:
+            union = len(words | seen)
+            if union and len(words & seen) / union >= self.threshold:
+                return False
+        self.cards.append(card)
+        self._words.append(words)
+        return True
+
+
+def generate_cards(client, text, model="gemini-2.5-flash", max_tokens=3000,
+                   overlap_tokens=200, workers=4, instruction=CARD_INSTRUCTION, limiter=None,
+                   files=None, pages=None, pages_per_chunk=10):
+    """Map-reduce a long document into flashcards.
+
+    Each chunk is sent as its own generate_text call (map), with up to workers
+    calls in flight, fewer while a limiter (utils.concurrency.AimdLimiter) has
+    backed off. Results are deduplicated as they arrive (reduce).
+
+    With files (uploaded Files API entries, e.g. a PDF from UploadCache) the
+    document is attached to every call instead of being sent as text, and the
+    chunks are page ranges of pages_per_chunk pages (see page_prompts).
+
+    Yields (chunk_index, chunk_count, new_cards, error) as each chunk finishes,
+    so callers can add notes while later chunks are still running.
+    """
+    if files:
+        chunks = page_prompts(pages, pages_per_chunk)
+    else:
+        chunks = chunk_text(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    deduper = CardDeduper()
+
+    def call(chunk):
+        return client.generate_text(
+            chunk,
+            model=model,
+            temperature=0.2,
+            max_tokens=8192,
+            response_schema=CARD_SCHEMA,
+            system_instruction=instruction,
+            template="doc_to_cards",
+            files=files,
+            return_cached=True,
+        )
+
+    def run(chunk):
+        # Cache hits still say nothing about the service's latency or capacity
+        result, error, _ = limiter.attempt(lambda: call(chunk)) if limiter is not None else call(chunk)
+        return result, error
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {metrics.submit(executor, run, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result, error = future.result()
+            except Exception as e:
+                result, error = None, str(e)
+            new_cards = [c for c in parse_cards(result) if deduper.add(c)] if result else []
+            yield index, len(chunks), new_cards, error
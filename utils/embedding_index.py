@@ -0,0 +1,392 @@
+﻿import re
+import html
+import math
+import mmap
+import operator
+import sqlite3
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+
+from .log import get_logger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+addon_dir = Path(__file__).parent.parent
+DEFAULT_INDEX_DIR = addon_dir / "user_files" / "embeddings"
+
+EMBEDDING_DIM = 768
+FIELD_SEPARATOR = "\x1f"
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SOUND_RE = re.compile(r"\[sound:[^\]]*\]")
+_SPACE_RE = re.compile(r"\s+")
+
+log = get_logger(__name__)
+
+# Dot product for the fallback search when numpy is missing (math.sumprod is Python 3.12+)
+_dot = getattr(math, "sumprod", None) or (lambda a, b: sum(map(operator.mul, a, b)))
+
+
+def note_text(flds):
+    """Turn a raw notes.flds value into plain text suitable for embedding"""
+    text = flds.replace(FIELD_SEPARATOR, "\n")
+    text = _SOUND_RE.sub(" ", text)
+    text = _TAG_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", html.unescape(text)).strip()
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class EmbeddingIndex:
+    """Local vector index over note texts.
+
+    Unit-length float32 vectors are stored row by row in a flat file that is
+    memory-mapped for search; a small SQLite table maps rows to note ids and
+    records a content hash so unchanged notes are never re-embedded.
+
+    Search is one matrix-vector product with numpy. Without numpy every row
+    is scored by a dot product over a slice of the mapped file (no copies),
+    which costs about 50 ms per 1000 notes at 768 dimensions on Python 3.11,
+    i.e. 2-3 s for a 50k-note collection; math.sumprod (Python 3.12+) is used
+    when available and is several times faster.
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, dim=EMBEDDING_DIM):
+        self.index_dir = Path(index_dir)
+        self.dim = dim
+        self.vectors_path = self.index_dir / "vectors.f32"
+        self._row_bytes = dim * 4
+        self._lock = threading.Lock()
+        self._conn = None
+        self._matrix = None
+        self._mapped = None
+        self._matrix_rows = -1
+        self._row_note_ids = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            self.vectors_path.touch(exist_ok=True)
+            self._conn = sqlite3.connect(str(self.index_dir / "index.sqlite3"), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " row INTEGER PRIMARY KEY,"
+                " note_id INTEGER UNIQUE,"
+                " hash TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+        return self._conn
+
+    # -----------------------------
+    # BOOKKEEPING
+    # -----------------------------
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+            conn.commit()
+
+    def stale_notes(self, notes):
+        """Filter (note_id, text) pairs down to those whose text is not indexed yet"""
+        with self._lock:
+            conn = self._connect()
+            stale = []
+            for note_id, text in notes:
+                digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                row = conn.execute("SELECT hash FROM rows WHERE note_id = ?", (note_id,)).fetchone()
+                if row is None or row[0] != digest:
+                    stale.append((note_id, text))
+            return stale
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM rows WHERE note_id IS NOT NULL"
+            ).fetchone()[0]
+
+    # -----------------------------
+    # WRITES
+    # -----------------------------
+    def upsert(self, items):
+        """Store (note_id, text, vector) triples, reusing a note's row when it exists"""
+        with self._lock:
+            conn = self._connect()
+            with open(self.vectors_path, "r+b") as f:
+                f.seek(0, 2)
+                next_row = f.tell() // self._row_bytes
+                for note_id, text, vector in items:
+                    if len(vector) != self.dim:
+                        raise ValueError(f"Expected {self.dim}-dim embedding, got {len(vector)}")
+                    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                    existing = conn.execute(
+                        "SELECT row FROM rows WHERE note_id = ?", (note_id,)
+                    ).fetchone()
+                    if existing is not None:
+                        row = existing[0]
+                        conn.execute("UPDATE rows SET hash = ? WHERE row = ?", (digest, row))
+                    else:
+                        row = next_row
+                        next_row += 1
+                        conn.execute(
+                            "INSERT INTO rows (row, note_id, hash) VALUES (?, ?, ?)",
+                            (row, note_id, digest),
+                        )
+                    f.seek(row * self._row_bytes)
+                    f.write(array("f", _normalize(vector)).tobytes())
+            conn.commit()
+            self._matrix_rows = -1
+
+    def remove(self, note_ids):
+        """Forget notes; their rows are zeroed and never returned by search"""
+        with self._lock:
+            conn = self._connect()
+            with open(self.vectors_path, "r+b") as f:
+                for note_id in note_ids:
+                    existing = conn.execute(
+                        "SELECT row FROM rows WHERE note_id = ?", (note_id,)
+                    ).fetchone()
+                    if existing is None:
+                        continue
+                    f.seek(existing[0] * self._row_bytes)
+                    f.write(bytes(self._row_bytes))
+                    conn.execute("UPDATE rows SET note_id = NULL WHERE row = ?", (existing[0],))
+            conn.commit()
+            self._matrix_rows = -1
+
+    # -----------------------------
+    # SEARCH
+    # -----------------------------
+    def _load(self):
+        """(Re)map the vector file if rows were added or removed since the last search"""
+        conn = self._connect()
+        total_rows = self.vectors_path.stat().st_size // self._row_bytes
+        if total_rows == self._matrix_rows:
+            return
+        note_ids = [None] * total_rows
+        for row, note_id in conn.execute("SELECT row, note_id FROM rows"):
+            if row < total_rows:
+                note_ids[row] = note_id
+        self._row_note_ids = note_ids
+        self._unmap()
+        if total_rows and numpy is not None:
+            self._matrix = numpy.memmap(
+                self.vectors_path, dtype=numpy.float32, mode="r", shape=(total_rows, self.dim)
+            )
+        elif total_rows:
+            with open(self.vectors_path, "rb") as f:
+                self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._matrix = memoryview(self._mapped).cast("f")
+        self._matrix_rows = total_rows
+
+    def _unmap(self):
+        """Drop the current mapping; the fallback's mmap is closed right away"""
+        if self._mapped is not None:
+            self._matrix.release()
+            self._mapped.close()
+            self._mapped = None
+        self._matrix = None
+        self._matrix_rows = -1
+
+    def search(self, query_vector, k=5, exclude=()):
+        """Return up to k (note_id, score) pairs ranked by cosine similarity"""
+        query = _normalize(query_vector)
+        with self._lock:
+            self._load()
+            if self._matrix is None:
+                return []
+            note_ids = self._row_note_ids
+            if numpy is not None:
+                scores = self._matrix @ numpy.asarray(query, dtype=numpy.float32)
+                want = min(len(scores), k + len(exclude) + 1)
+                top = numpy.argpartition(-scores, want - 1)[:want]
+                ranked = [(int(i), float(scores[i])) for i in top]
+            else:
+                dim = self.dim
+                matrix = self._matrix
+                ranked = [
+                    (i, _dot(query, matrix[i * dim:(i + 1) * dim]))
+                    for i in range(self._matrix_rows)
+                    if note_ids[i] is not None
+                ]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        results = []
+        for row, score in ranked:
+            note_id = note_ids[row]
+            if note_id is None or note_id in exclude:
+                continue
+            results.append((note_id, score))
+            if len(results) == k:
+                break
+        return results
+
+    def close(self):
+        with self._lock:
+            self._unmap()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CollectionRetriever:
+    """Keeps an EmbeddingIndex in sync with an Anki collection and serves top-k lookups.
+
+    get_db returns the collection's db handle; client is any object with an
+    embed_texts method (normally the GeminiClient using this retriever).
+    """
+
+    def __init__(self, index, get_db, client=None, batch_size=100):
+        self.index = index
+        self.get_db = get_db
+        self.client = client
+        self.batch_size = batch_size
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._syncing = False
+        self._resync = False
+
+    def mark_dirty(self, note_id):
+        """Queue a note for re-embedding on the next sync"""
+        with self._dirty_lock:
+            self._dirty.add(note_id)
+
+    def sync(self):
+        """Embed new, edited and queued notes.
+
+        Only notes modified since the last sync are embedded. notes.mod has no
+        index, so finding them is a scan of the notes table; that is cheap next
+        to embedding but not free, so run this off the UI thread
+        (sync_in_background).
+        """
+        db = self.get_db()
+        since = int(self.index.get_meta("last_mod", 0))
+        with self._dirty_lock:
+            queued, self._dirty = self._dirty, set()
+
+        rows = db.all("SELECT id, mod, flds FROM notes WHERE mod > ?", since)
+        if queued:
+            ids = ",".join(str(int(nid)) for nid in queued)
+            rows += db.all(f"SELECT id, mod, flds FROM notes WHERE id IN ({ids})")
+
+        latest = since
+        candidates = {}
+        for note_id, mod, flds in rows:
+            latest = max(latest, mod)
+            text = note_text(flds)
+            if text:
+                candidates[note_id] = text
+
+        if queued:
+            existing_ids = set(db.list(f"SELECT id FROM notes WHERE id IN ({ids})"))
+            removed = [nid for nid in queued if nid not in existing_ids]
+            if removed:
+                self.index.remove(removed)
+
+        stale = self.index.stale_notes(candidates.items())
+        embedded = 0
+        for start in range(0, len(stale), self.batch_size):
+            batch = stale[start:start + self.batch_size]
+            vectors, error = self.client.embed_texts([text for _, text in batch])
+            if error:
+                # Re-queue the rest so the next sync retries them.
+                for note_id, _ in stale[start:]:
+                    self.mark_dirty(note_id)
+                return embedded, error
+            self.index.upsert(
+                (note_id, text, vector) for (note_id, text), vector in zip(batch, vectors)
+            )
+            embedded += len(batch)
+
+        self.index.set_meta("last_mod", latest)
+        return embedded, None
+
+    def sync_in_background(self, run_in_background):
+        """Start sync() with run_in_background(fn, on_done) unless one is running.
+
+        A request made while a sync is running schedules one more sync after
+        it, so changes queued in the meantime are not left waiting. Returns
+        True if a sync was started.
+        """
+        with self._dirty_lock:
+            if self._syncing:
+                self._resync = True
+                return False
+            self._syncing = True
+            self._resync = False
+
+        def on_done(future):
+            try:
+                embedded, error = future.result()
+            except Exception as e:
+                embedded, error = 0, str(e)
+            if error:
+                log.error("Index sync failed: %s", error)
+            elif embedded:
+                log.info("Index sync embedded %d notes", embedded)
+            with self._dirty_lock:
+                self._syncing = False
+                again = self._resync and not error
+            if again:
+                self.sync_in_background(run_in_background)
+
+        run_in_background(self.sync, on_done)
+        return True
+
+    def retrieve(self, query, k=5, exclude=()):
+        """Return [(note_id, score)] for the k notes most similar to query"""
+        vectors, error = self.client.embed_texts([query], task_type="RETRIEVAL_QUERY")
+        if error or not vectors:
+            return []
+        return self.index.search(vectors[0], k=k, exclude=exclude)
+
+    def retrieve_texts(self, query, k=5, exclude=()):
+        """Return the plain texts of the k notes most similar to query"""
+        hits = self.retrieve(query, k=k, exclude=exclude)
+        if not hits:
+            return []
+        db = self.get_db()
+        texts = []
+        for note_id, _score in hits:
+            flds = db.scalar("SELECT flds FROM notes WHERE id = ?", note_id)
+            if flds:
+                texts.append(note_text(flds))
+        return texts
+
+
+def build_grounding_instruction(snippets):
+    """Format retrieved note texts as a system instruction for generate_text"""
+    lines = [
+        "Use the following notes from the user's flashcard collection as context.",
+        "Stay consistent with them, and say so if they disagree with the request.",
+        "",
+    ]
+    for i, snippet in enumerate(snippets, 1):
+        lines.append(f"[Note {i}] {snippet}")
+    return "\n".join(lines)
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_collection_retriever(profile_name, get_db):
+    """Return the shared retriever for an Anki profile, creating its index on first use"""
+    with _retrievers_lock:
+        retriever = _retrievers.get(profile_name)
+        if retriever is None:
+            index = EmbeddingIndex(DEFAULT_INDEX_DIR / profile_name)
+            retriever = _retrievers[profile_name] = CollectionRetriever(index, get_db)
+        return retriever
@@ -1,41 +1,169 @@
-﻿import sys
-import os
-from pathlib import Path
-
-# Add lib to path
-addon_dir = Path(__file__).parent.parent
-lib_path = addon_dir / "lib"
-if str(lib_path) not in sys.path:
-    sys.path.insert(0, str(lib_path))
-
-print(f"GeminiTTS Debug: Attempting to import requests for HTTP API.")
-
-try:
-    import requests
-    import json
-    print("GeminiTTS Debug: requests imported successfully!")
-except Exception as e:
-    print(f"GeminiTTS Error: Failed to import requests: {e}")
-    requests = None
+﻿import os
+import threading
+
+from . import metrics, vendor
+from .key_pool import KeysExhausted, retry_after
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# Imported on first client construction, not when this module is imported
+requests = None
+_requests_error = None
+
+def _load_requests():
+    """Import the vendored requests on first use; returns the module or None"""
+    global requests, _requests_error
+    if requests is not None or _requests_error is not None:
+        return requests
+
+    log.debug("Importing requests for the HTTP API")
+    try:
+        requests = vendor.load("requests")
+        log.debug("requests %s imported from %s", requests.__version__, requests.__file__)
+    except Exception as e:
+        log.error("Failed to import requests: %s", e)
+        _requests_error = e
+    return requests
+
+_session = None
+_session_lock = threading.Lock()
+
+def _usage_tokens(result):
+    return (result.get("usageMetadata") or {}).get("totalTokenCount", 0)
+
+def get_session(pool_size=32):
+    """Return the process-wide pooled requests.Session (keep-alive across calls)
+
+    Requests go through TimedHTTPAdapter, which reports per-phase timings to
+    metrics.registry. If GEMINI_TTS_CASSETTE is set, a cassette adapter
+    records to or replays from that file instead (see utils.cassette).
+    """
+    global _session
+    with _session_lock:
+        if _session is None and _load_requests() is not None:
+            session = requests.Session()
+            try:
+                from .http_timing import TimedHTTPAdapter as adapter_class
+            except Exception as e:
+                log.warning("Request timing unavailable: %s", e)
+                adapter_class = requests.adapters.HTTPAdapter
+            adapter = adapter_class(
+                pool_connections=4, pool_maxsize=pool_size
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            cassette_path = os.environ.get("GEMINI_TTS_CASSETTE")
+            if cassette_path:
+                from . import cassette
+
+                mode = os.environ.get("GEMINI_TTS_CASSETTE_MODE", "replay")
+                speed = float(os.environ.get("GEMINI_TTS_CASSETTE_SPEED", "0"))
+                match = os.environ.get("GEMINI_TTS_CASSETTE_MATCH", "exact")
+                cassette.install(session, cassette_path, mode=mode, speed=speed, match=match)
+                log.info("Using cassette %s (%s, speed %s)", cassette_path, mode, speed)
+            _session = session
+
+            # Start aggregating timings before the first request goes out
+            from .perf_stats import get_perf_stats
+
+            get_perf_stats()
+        return _session
 
 class GeminiClient:
-    def __init__(self, api_key):
-        print(f"GeminiTTS Debug: GeminiClient.__init__ called. API key present: {bool(api_key)}")
+    def __init__(self, api_key, result_cache=None, retriever=None, session=None, daemon=None, key_pool=None,
+                 hedge=None):
+        log.debug("GeminiClient created, API key present: %s", bool(api_key))
         self.api_key = api_key
+        # utils.key_pool.KeyPool: text and TTS requests are spread over several keys
+        self.key_pool = key_pool
+        # utils.hedging.HedgePolicy: slow requests get a duplicate, the first answer wins
+        self.hedge = hedge
+        self.result_cache = result_cache
+        # utils.daemon.DaemonClient: text and TTS calls go through the shared daemon
+        self.daemon = daemon
+        self.retriever = retriever
+        if retriever is not None:
+            retriever.client = self
         self.base_url = "https://generativelanguage.googleapis.com/v1beta"
-        self.configured = bool(api_key and requests)
+        self.tts_url = "https://texttospeech.googleapis.com/v1/text:synthesize"
+        self.configured = bool(api_key) and _load_requests() is not None
+        self.session = (session or get_session()) if self.configured else None
         
         if self.configured:
-            print("GeminiTTS Debug: Gemini HTTP client configured successfully")
+            log.debug("Gemini HTTP client configured")
         else:
-            print("GeminiTTS Error: Gemini client not initialized - missing API key or requests")
+            log.error("Gemini client not initialized - missing API key or requests")
+
+    def _via_daemon(self, method, *args, **kwargs):
+        """Forward a call to the daemon; None if it is gone (then call the API directly).
+
+        A request the daemon accepted but did not answer comes back as an
+        error, not None, since the daemon may still be sending it upstream.
+        """
+        from .daemon import DaemonUnavailable
+
+        try:
+            return getattr(self.daemon, method)(*args, **kwargs)
+        except DaemonUnavailable as e:
+            log.warning("Daemon unavailable, calling the API directly: %s", e)
+            self.daemon = None
+            return None
+
+    def _post(self, url, payload, timeout=60, pooled=True):
+        """POST with the API key, or with the pool's key with the most headroom.
+
+        A key answering 429 or 403 is retired and the request moves on to the
+        next key; raises KeysExhausted when no key is available. With
+        self.hedge, a request slower than the endpoint's p95 is sent again.
+        """
+        if self.hedge is not None:
+            return self.hedge.call(
+                lambda: self._send(url, payload, timeout, pooled),
+                accept=lambda response: response.status_code < 500 and response.status_code != 429,
+            )
+        return self._send(url, payload, timeout, pooled)
+
+    def _send(self, url, payload, timeout, pooled):
+        if self.key_pool is None or not pooled:
+            headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+            return self.session.post(url, headers=headers, json=payload, timeout=timeout)
+
+        # A 403 retires a key only for this endpoint (e.g. TTS not enabled for its project)
+        endpoint, _ = metrics.endpoint_tags(url)
+        tried = set()
+        response = throttled = None
+        while True:
+            key, wait = self.key_pool.acquire(exclude=tried, endpoint=endpoint)
+            if key is None:
+                # A 429 is worth retrying later, a 403 is not
+                if throttled is not None or response is not None:
+                    return throttled or response
+                raise KeysExhausted(
+                    f"HTTP 429: all {len(self.key_pool)} API keys are retired; the next is back in {wait:.0f} s"
+                )
+            tried.add(key)
+            status = None
+            try:
+                headers = {"Content-Type": "application/json", "x-goog-api-key": key}
+                response = self.session.post(url, headers=headers, json=payload, timeout=timeout)
+                status = response.status_code
+            finally:
+                self.key_pool.release(
+                    key, status, retry_after(response) if status == 429 else None, endpoint=endpoint
+                )
+            if status == 429:
+                throttled = response
+            elif status != 403:
+                return response
     
     def test_connection(self):
         """Test if API key works using HTTP API"""
-        print("GeminiTTS Debug: test_connection called (HTTP API).")
+        log.debug("test_connection called")
         
         if not self.configured:
-            print("GeminiTTS Error: test_connection - Client not initialized.")
+            log.error("test_connection: client not initialized")
             return False, "Client not initialized"
         
         try:
@@ -56,91 +184,181 @@ class GeminiClient:
                 }
             }
             
-            print("GeminiTTS Debug: Making HTTP request to Gemini API...")
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            log.debug("Sending test request to the Gemini API")
+            response = self.session.post(url, headers=headers, json=payload, timeout=30)
             
-            print(f"GeminiTTS Debug: HTTP response status: {response.status_code}")
+            log.debug("Test request returned HTTP %s", response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
-                print("GeminiTTS Debug: test_connection - API call successful")
+                log.debug("test_connection succeeded")
                 return True, "Connection successful"
             else:
                 error_msg = f"HTTP {response.status_code}: {response.text}"
-                print(f"GeminiTTS Error: API call failed: {error_msg}")
+                log.error("Test request failed: HTTP %s: %.500s", response.status_code, response.text)
                 return False, f"API call failed: {error_msg}"
                 
         except Exception as e:
-            print(f"GeminiTTS Error: test_connection failed: {e}")
+            log.error("test_connection failed: %s", e)
             return False, f"Connection failed: {str(e)}"
     
-    def generate_text(self, prompt, model="gemini-2.5-flash-preview-05-20"):
-        """Generate text using HTTP API"""
-        print("GeminiTTS Debug: generate_text called (HTTP API).")
+    def generate_text(self, prompt, model="gemini-2.5-flash-preview-05-20", temperature=0.7,
+                      max_tokens=1024, response_schema=None, system_instruction=None,
+                      template=None, use_cache=True, ground=False, top_k=5, files=None,
+                      return_cached=False, exclude_notes=()):
+        """Generate text using HTTP API
+
+        Results are served from self.result_cache when one is set, unless
+        use_cache is False or the cache bypasses the given template. With
+        ground=True the top_k most similar notes from self.retriever are
+        added to the system instruction as context, leaving out the ids in
+        exclude_notes (e.g. the note being edited). files is a list of
+        uploaded Files API entries ({"uri", "mime_type"}), e.g. from UploadCache.
+
+        Returns (text, error), or (text, error, cached) with return_cached=True,
+        where cached says the text came from a result cache and not the API.
+        Transport failures are reported as "Connection error: ...".
+        """
+        log.debug("generate_text called for model %s", model)
+
+        def done(text, error, cached=False):
+            return (text, error, cached) if return_cached else (text, error)
         
         if not self.configured:
-            return None, "Client not initialized"
+            return done(None, "Client not initialized")
+        
+        if ground and self.retriever is not None:
+            from .embedding_index import build_grounding_instruction
+
+            snippets = self.retriever.retrieve_texts(prompt, k=top_k, exclude=exclude_notes)
+            if snippets:
+                grounding = build_grounding_instruction(snippets)
+                system_instruction = (
+                    f"{grounding}\n\n{system_instruction}" if system_instruction else grounding
+                )
+        
+        # Uploaded files belong to this key's Files API storage, so those go direct
+        if self.daemon is not None and not files:
+            result = self._via_daemon(
+                "generate_text", prompt, model=model, temperature=temperature, max_tokens=max_tokens,
+                response_schema=response_schema, system_instruction=system_instruction,
+                template=template, use_cache=use_cache, return_cached=True,
+            )
+            if result is not None:
+                return done(*result)
+        
+        cache_key = None
+        if self.result_cache is not None and use_cache and not self.result_cache.is_bypassed(template):
+            from .result_cache import make_cache_key
+
+            cache_key = make_cache_key(
+                model, prompt, temperature, max_tokens, response_schema, system_instruction, files
+            )
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                log.debug("generate_text served from result cache")
+                return done(cached, None, True)
         
         try:
             url = f"{self.base_url}/models/{model}:generateContent"
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": self.api_key
-            }
             
             payload = {
                 "contents": [{
                     "parts": [{"text": prompt}]
                 }],
                 "generationConfig": {
-                    "temperature": 0.7,
-                    "maxOutputTokens": 1024
+                    "temperature": temperature,
+                    "maxOutputTokens": max_tokens
                 }
             }
+            for f in files or ():
+                payload["contents"][0]["parts"].insert(
+                    0, {"fileData": {"mimeType": f["mime_type"], "fileUri": f["uri"]}}
+                )
+            if system_instruction:
+                payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+            if response_schema:
+                payload["generationConfig"]["responseMimeType"] = "application/json"
+                payload["generationConfig"]["responseSchema"] = response_schema
             
-            print("GeminiTTS Debug: Making text generation request...")
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            log.debug("Sending text generation request")
+            with metrics.track("generateContent", model=model, template=template) as timing:
+                timing.characters = len(prompt)
+                # Uploaded files belong to the main key's Files API storage
+                response = self._post(url, payload, pooled=not files)
+                if response.status_code == 200:
+                    with timing.phase("json_decode"):
+                        result = response.json()
+                    timing.tokens = _usage_tokens(result)
             
             if response.status_code == 200:
-                result = response.json()
-                
                 # Extract text from response
                 if 'candidates' in result and len(result['candidates']) > 0:
                     candidate = result['candidates'][0]
                     if 'content' in candidate and 'parts' in candidate['content']:
                         text = candidate['content']['parts'][0].get('text', '')
                         if text:
-                            print("GeminiTTS Debug: Text generation successful")
-                            return text, None
+                            log.debug("Text generation succeeded")
+                            if cache_key is not None:
+                                self.result_cache.put(cache_key, model, text)
+                            return done(text, None)
                 
-                return None, "No text generated"
+                return done(None, "No text generated")
             else:
                 error_msg = f"HTTP {response.status_code}: {response.text}"
-                print(f"GeminiTTS Error: Text generation failed: {error_msg}")
-                return None, error_msg
+                log.error("Text generation failed: HTTP %s: %.500s", response.status_code, response.text)
+                return done(None, error_msg)
                 
+        except KeysExhausted as e:
+            log.warning("%s", e)
+            return done(None, str(e))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            log.error("generate_text failed: %s", e)
+            return done(None, f"Connection error: {str(e)}")
         except Exception as e:
-            print(f"GeminiTTS Error: generate_text failed: {e}")
-            return None, f"Text generation failed: {str(e)}"
+            log.error("generate_text failed: %s", e)
+            return done(None, f"Text generation failed: {str(e)}")
     
+    def embed_texts(self, texts, model="text-embedding-004", task_type="RETRIEVAL_DOCUMENT"):
+        """Embed a list of texts using HTTP API (batched by GeminiRestClient)"""
+        log.debug("embed_texts called for %d texts", len(texts))
+
+        if not self.configured:
+            return None, "Client not initialized"
+
+        from .rest_client import GeminiRestClient
+
+        vectors, error = GeminiRestClient(self.api_key, session=self.session).batch_embed_contents(
+            texts, model=model, task_type=task_type
+        )
+        if error:
+            log.error("Embedding failed: %.500s", error)
+            return None, f"Embedding failed: {error}"
+        return vectors, None
+
     def generate_tts_request(self, text):
         """Prepare TTS request (placeholder for future implementation)"""
         return f"TTS request prepared for: {text[:50]}..."
 
-    def generate_tts_audio(self, text, voice_name="en-US-Wavenet-D"):
-        """Generate TTS audio using Google Cloud Text-to-Speech API"""
-        print("GeminiTTS Debug: generate_tts_audio called (Google Cloud TTS).")
+    def generate_tts_audio(self, text, voice_name="en-US-Wavenet-D", out_path=None):
+        """Generate TTS audio using Google Cloud Text-to-Speech API
+
+        With out_path the MP3 is also written there, so the write is part of
+        the request's timing.
+        """
+        log.debug("generate_tts_audio called for voice %s", voice_name)
 
         if not self.configured:
             return None, "Client not initialized"
 
+        if self.daemon is not None:
+            result = self._via_daemon("generate_tts_audio", text, voice_name=voice_name, out_path=out_path)
+            if result is not None:
+                return result
+
         try:
-            # Google Cloud TTS API endpoint
-            url = "https://texttospeech.googleapis.com/v1/text:synthesize"
-            headers = {
-                "Content-Type": "application/json",
-                "X-Goog-Api-Key": self.api_key  # Same API key works for both services
-            }
+            # Google Cloud TTS API endpoint (same API key as Gemini)
+            url = self.tts_url
 
             payload = {
                 "input": {"text": text},
@@ -153,25 +371,42 @@ class GeminiClient:
                 }
             }
 
-            print("GeminiTTS Debug: Making TTS request to Google Cloud...")
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            log.debug("Sending TTS request to Google Cloud")
+            audio_data = None
+            with metrics.track("synthesize", voice=voice_name) as timing:
+                timing.characters = len(text)
+                response = self._post(url, payload)
+                if response.status_code == 200:
+                    with timing.phase("json_decode"):
+                        result = response.json()
 
-            if response.status_code == 200:
-                result = response.json()
+                    # Extract base64 audio data
+                    if 'audioContent' in result:
+                        import base64
+                        with timing.phase("b64_decode"):
+                            audio_data = base64.b64decode(result['audioContent'])
+                        if out_path:
+                            with timing.phase("file_write"):
+                                with open(out_path, "wb") as f:
+                                    f.write(audio_data)
 
-                # Extract base64 audio data
-                if 'audioContent' in result:
-                    import base64
-                    audio_data = base64.b64decode(result['audioContent'])
-                    print("GeminiTTS Debug: TTS generation successful")
+            if response.status_code == 200:
+                if audio_data is not None:
+                    log.debug("TTS generation succeeded")
                     return audio_data, None
                 else:
                     return None, "No audio content in response"
             else:
                 error_msg = f"HTTP {response.status_code}: {response.text}"
-                print(f"GeminiTTS Error: TTS generation failed: {error_msg}")
+                log.error("TTS generation failed: HTTP %s: %.500s", response.status_code, response.text)
                 return None, error_msg
 
+        except KeysExhausted as e:
+            log.warning("%s", e)
+            return None, str(e)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            log.error("generate_tts_audio failed: %s", e)
+            return None, f"Connection error: {str(e)}"
         except Exception as e:
-            print(f"GeminiTTS Error: generate_tts_audio failed: {e}")
+            log.error("generate_tts_audio failed: %s", e)
             return None, f"TTS generation failed: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,210 @@
+﻿"""Hedged requests for interactive calls (the dialog's text generation and TTS).
+
+If a request has not been answered after the running p95 latency of its
+endpoint (from utils.perf_stats), a duplicate is sent and whichever answers
+first is used; the other one is cancelled. Its connection is shut down if it
+is still waiting for the response headers, or it is never sent if it had not
+started yet. Extra requests are limited by a budget: each request earns
+`budget` of a hedge (10% by default), with at most `burst` saved up.
+
+Hedging is off by default, since every hedge is an extra billed request.
+Turn it on in config.json:
+
+    "hedging": {"enabled": true, "percentile": 95, "budget": 0.1, "min_samples": 20}
+
+GeminiClient(hedge=get_hedge_policy(config)) hedges its HTTP requests; bulk
+jobs do not use it, since they are limited by throughput, not by the tail.
+"""
+
+import queue
+import socket
+import threading
+
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_local = threading.local()
+
+
+class HedgeCancelled(Exception):
+    """The attempt lost to a faster one"""
+
+
+class CancelToken:
+    """Lets another thread abort the request running under this token"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        """The request is about to use connection (called by the transport)"""
+        with self._lock:
+            if self.cancelled:
+                raise HedgeCancelled("hedged request cancelled before it was sent")
+            self._connections.add(connection)
+
+    def detach(self):
+        """Response headers are in; from here on the attempt runs to completion"""
+        with self._lock:
+            self._connections.clear()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            try:
+                if sock is not None:
+                    sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def current_token():
+    """CancelToken of the hedged attempt running on this thread, or None"""
+    return getattr(_local, "token", None)
+
+
+class _Attempt:
+    def __init__(self, fn, endpoint, finished, hedge):
+        self.fn = fn
+        self.finished = finished
+        self.hedge = hedge
+        self.token = CancelToken()
+        self.timing = metrics.RequestTiming(endpoint or "hedged")
+        self.result = None
+        self.error = None
+        threading.Thread(target=self._run, name="gemini-hedge", daemon=True).start()
+
+    def _run(self):
+        _local.token = self.token
+        try:
+            with metrics.use(self.timing):
+                self.result = self.fn()
+        except BaseException as e:
+            self.error = e
+        finally:
+            _local.token = None
+            self.finished.put(self)
+
+
+class HedgePolicy:
+    """When to send a duplicate request, and how many duplicates may be sent"""
+
+    def __init__(self, percentile=95, budget=0.1, burst=3.0, min_samples=20, min_delay=0.05):
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.tokens = 1.0
+        self.counts = {"requests": 0, "hedged": 0, "hedge_won": 0, "over_budget": 0}
+        self._lock = threading.Lock()
+
+    def delay(self, endpoint):
+        """Seconds to wait before hedging a request to endpoint, or None (too few samples)"""
+        from .perf_stats import get_perf_stats
+
+        if endpoint is None:
+            return None
+        seconds = get_perf_stats().percentile(endpoint, self.percentile, self.min_samples)
+        return max(self.min_delay, seconds) if seconds is not None else None
+
+    def _spend(self):
+        with self._lock:
+            if self.tokens < 1:
+                self.counts["over_budget"] += 1
+                return False
+            self.tokens -= 1
+            self.counts["hedged"] += 1
+            return True
+
+    def call(self, fn, accept=None):
+        """Return fn() (a response), hedged as described in the module docstring.
+
+        accept(result) says whether an answer is good enough to stop waiting
+        for the other attempt (by default any answer without an exception).
+        """
+        outer = metrics.current()
+        endpoint = outer.endpoint if outer is not None else None
+        with self._lock:
+            self.counts["requests"] += 1
+            self.tokens = min(self.burst, self.tokens + self.budget)
+        delay = self.delay(endpoint)
+        if delay is None:
+            return fn()
+
+        finished = queue.Queue()
+        attempts = [_Attempt(fn, endpoint, finished, hedge=False)]
+        try:
+            winner = finished.get(timeout=delay)
+        except queue.Empty:
+            winner = None
+            if self._spend():
+                log.debug("No answer from %s after %.0f ms, sending a hedged request", endpoint, delay * 1000)
+                attempts.append(_Attempt(fn, endpoint, finished, hedge=True))
+        if winner is None:
+            winner = finished.get()
+        if len(attempts) > 1 and not self._good(winner, accept):
+            # The first answer is an error; the other attempt may still succeed
+            second = finished.get()
+            if self._good(second, accept):
+                winner = second
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.token.cancel()
+                if outer is not None:
+                    outer.http_requests += attempt.timing.http_requests
+                    outer.new_connections += attempt.timing.new_connections
+        if outer is not None:
+            outer.merge(winner.timing)
+            if len(attempts) > 1:
+                outer.tags["hedge"] = "won" if winner.hedge else "lost"
+        if winner.hedge:
+            with self._lock:
+                self.counts["hedge_won"] += 1
+        if winner.error is not None:
+            raise winner.error
+        return winner.result
+
+    @staticmethod
+    def _good(attempt, accept):
+        if attempt.error is not None:
+            return False
+        return accept is None or accept(attempt.result)
+
+    def status(self):
+        with self._lock:
+            return {**self.counts, "budget_left": round(self.tokens, 2)}
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_hedge_policy(config=None):
+    """The process-wide HedgePolicy (one shared budget), or None unless enabled in config"""
+    global _policy
+    settings = (config or {}).get("hedging") or {}
+    if not settings.get("enabled", False):
+        return None
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgePolicy(
+                percentile=settings.get("percentile", 95),
+                budget=settings.get("budget", 0.1),
+                min_samples=settings.get("min_samples", 20),
+            )
+        return _policy
+
+
+def hedge_status():
+    """Counters of the shared policy, or None if nothing was hedged in this process"""
+    return _policy.status() if _policy is not None else None
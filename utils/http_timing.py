@@ -0,0 +1,146 @@
+﻿"""requests transport that times each phase of an HTTP exchange.
+
+TimedHTTPAdapter plugs connection classes into urllib3 that time name
+resolution, the TCP connect and the TLS handshake of every new connection,
+and sends every request with stream=True so the time to the response headers
+(time to first byte) and the body download are measured separately. The
+phases are added to the RequestTiming current on the calling thread (see
+metrics.track); requests made outside a tracked call get a timing of their own.
+Requests made for a hedged call register their connection with its
+CancelToken until the response headers arrive, so the losing attempt can be
+aborted (see hedging.py).
+
+Only imported by get_session(), after requests has been loaded.
+"""
+
+import socket
+import time
+
+from . import hedging, metrics, vendor
+
+HTTPAdapter = vendor.load("requests.adapters").HTTPAdapter
+_urllib3 = vendor.load("urllib3")
+HTTPConnection = _urllib3.connection.HTTPConnection
+HTTPSConnection = _urllib3.connection.HTTPSConnection
+HTTPConnectionPool = _urllib3.connectionpool.HTTPConnectionPool
+HTTPSConnectionPool = _urllib3.connectionpool.HTTPSConnectionPool
+ConnectTimeoutError = _urllib3.exceptions.ConnectTimeoutError
+
+_CONNECTION_PHASES = ("dns", "connect", "tls")
+
+
+def _connection_seconds(timing):
+    return sum(timing.phases.get(name, 0.0) for name in _CONNECTION_PHASES)
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        timing = metrics.current()
+        if timing is None:
+            return super()._new_conn()
+
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            timing.add("dns", time.perf_counter() - start)
+            # Let urllib3 resolve again and raise its own error
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        timing.add("dns", resolved - start)
+        timing.new_connections += 1
+
+        # Connect by address so the connect phase excludes resolution. host
+        # (and with it the TLS server name) is restored before the handshake.
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+            timing.add("connect", time.perf_counter() - resolved)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        timing = metrics.current()
+        if timing is None:
+            return super().connect()
+        before = _connection_seconds(timing)
+        start = time.perf_counter()
+        super().connect()
+        # Whatever connect() spent beyond _new_conn is the TLS handshake
+        spent = time.perf_counter() - start
+        timing.add("tls", spent - (_connection_seconds(timing) - before))
+
+
+class _CancellablePoolMixin:
+    def _make_request(self, conn, *args, **kwargs):
+        token = hedging.current_token()
+        if token is not None:
+            token.attach(conn)
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class TimedHTTPConnectionPool(_CancellablePoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(_CancellablePoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter reporting DNS/connect/TLS/TTFB/download times to metrics"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, **kwargs):
+        timing = metrics.current()
+        if timing is not None:
+            return self._timed_send(timing, request, stream, **kwargs)
+        endpoint, tags = metrics.endpoint_tags(request.url)
+        with metrics.track(endpoint, **tags) as timing:
+            return self._timed_send(timing, request, stream, **kwargs)
+
+    def _timed_send(self, timing, request, stream, **kwargs):
+        timing.http_requests += 1
+        timing.request_bytes += int(request.headers.get("Content-Length") or 0)
+        before = _connection_seconds(timing)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, stream=True, **kwargs)
+        except Exception as e:
+            timing.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            # The connection goes back to the pool after the body is read, so
+            # it must not be shut down by a cancel from here on
+            token = hedging.current_token()
+            if token is not None:
+                token.detach()
+        headers_at = time.perf_counter()
+        timing.add("ttfb", headers_at - start - (_connection_seconds(timing) - before))
+        timing.status = response.status_code
+
+        if not stream:
+            # Session.send would read the body next anyway; do it here to time it
+            body = response.content
+            timing.add("download", time.perf_counter() - headers_at)
+            timing.response_bytes += len(body)
+        return response
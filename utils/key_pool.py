@@ -0,0 +1,176 @@
+﻿"""Several API keys (e.g. from different projects) used as one larger quota.
+
+config.json:
+
+    "api_keys": ["AIza...", {"key": "AIza...", "name": "team-b", "requests_per_minute": 300}]
+
+These are used alongside "api_key". Each request goes to the available key
+with the most headroom: the fewest requests in flight, then the fewest sent
+in the last minute. A key with a requests_per_minute is only used past that
+limit when every other key is at its limit too.
+
+A key answering 429 is retired for its Retry-After (or a cooldown that
+doubles while it keeps being throttled). A 403 (permission denied, e.g. an
+API not enabled for that project) retires it for longer, but only for the
+endpoint that answered, since a project may allow text generation and not
+TTS. GeminiClient then retries the request on the next key right away.
+"""
+
+import re
+import time
+import threading
+from collections import deque
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_RETRY_DELAY_RE = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"')
+
+
+class KeysExhausted(Exception):
+    """Every key in the pool is retired at the moment"""
+
+
+def retry_after(response):
+    """Seconds the server asked us to wait (Retry-After header or RetryInfo), or None"""
+    value = response.headers.get("Retry-After", "")
+    if value.strip().isdigit():
+        return float(value)
+    match = _RETRY_DELAY_RE.search(response.text or "")
+    return float(match.group(1)) if match else None
+
+
+class _Key:
+    def __init__(self, key, name, requests_per_minute=0):
+        self.key = key
+        self.name = name
+        self.requests_per_minute = requests_per_minute or 0
+        self.sent = deque()  # monotonic times of requests in the last minute
+        self.in_flight = 0
+        self.retired_until = 0.0
+        self.denied_until = {}  # endpoint -> monotonic time its 403 retirement ends
+        self.throttled = 0  # consecutive 429s
+        self.counts = {"requests": 0, "throttled": 0, "denied": 0}
+
+    def back_at(self, endpoint):
+        """When the key can be used for endpoint again (monotonic time)"""
+        return max(self.retired_until, self.denied_until.get(endpoint, 0.0))
+
+    def headroom(self, now):
+        while self.sent and now - self.sent[0] >= 60:
+            self.sent.popleft()
+        under_limit = not self.requests_per_minute or len(self.sent) < self.requests_per_minute
+        return under_limit, -self.in_flight, -len(self.sent)
+
+
+class KeyPool:
+    """Chooses an API key per request and tracks each key's quota state"""
+
+    def __init__(self, keys, cooldown=30.0, max_cooldown=600.0, denied_cooldown=900.0):
+        """keys: API key strings or {"key", "name", "requests_per_minute"} dicts"""
+        self.keys = []
+        for i, entry in enumerate(keys):
+            if isinstance(entry, str):
+                entry = {"key": entry}
+            self.keys.append(_Key(entry["key"], entry.get("name") or f"key {i + 1}",
+                                  entry.get("requests_per_minute", 0)))
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.denied_cooldown = denied_cooldown
+        self._by_key = {k.key: k for k in self.keys}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self, exclude=(), endpoint=None):
+        """(key, None) for the key with the most headroom for endpoint, or (None,
+        seconds until one comes back) when every key not in exclude is retired"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [k for k in self.keys if k.key not in exclude]
+            available = [k for k in candidates if k.back_at(endpoint) <= now]
+            if not available:
+                waiting = [k.back_at(endpoint) - now for k in candidates]
+                return None, max(0.0, min(waiting, default=0.0))
+            best = max(available, key=lambda k: k.headroom(now))
+            best.sent.append(now)
+            best.in_flight += 1
+            best.counts["requests"] += 1
+            return best.key, None
+
+    def release(self, key, status, wait=None, endpoint=None):
+        """Record the outcome of a request made with key to endpoint; returns True
+        if the key was retired (for every endpoint after a 429, for endpoint after a 403)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._by_key.get(key)
+            if entry is None:
+                return False
+            entry.in_flight -= 1
+            if status is None:  # no response (connection error)
+                return False
+            if status == 429:
+                entry.throttled += 1
+                entry.counts["throttled"] += 1
+                if wait is None:
+                    wait = min(self.max_cooldown, self.cooldown * 2 ** (entry.throttled - 1))
+                entry.retired_until = now + wait
+            elif status == 403:
+                entry.counts["denied"] += 1
+                wait = self.denied_cooldown
+                entry.denied_until[endpoint] = now + wait
+            else:
+                entry.throttled = 0
+                return False
+        log.warning("API key %s retired%s for %.0f s after HTTP %s",
+                    entry.name, f" for {endpoint}" if status == 403 and endpoint else "", wait, status)
+        return True
+
+    def status(self):
+        """Per-key counters and state, for the performance view and daemon stats"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": k.name,
+                    "in_flight": k.in_flight,
+                    "last_minute": len(k.sent),
+                    "requests_per_minute": k.requests_per_minute,
+                    "retired_for_s": round(max(0.0, k.retired_until - now), 1),
+                    "denied_for_s": {
+                        endpoint: round(until - now, 1) for endpoint, until in k.denied_until.items() if until > now
+                    },
+                    **k.counts,
+                }
+                for k in self.keys
+            ]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_key_pool(config, api_key=None):
+    """The shared KeyPool for api_key plus config["api_keys"], or None for a single key.
+
+    Pools are shared per set of keys, so every client in the process sees
+    the same retirements.
+    """
+    entries = []
+    seen = set()
+    for entry in [api_key or (config or {}).get("api_key"), *((config or {}).get("api_keys") or ())]:
+        key = entry.get("key") if isinstance(entry, dict) else entry
+        if key and key not in seen:
+            seen.add(key)
+            entries.append(entry)
+    if len(entries) < 2:
+        return None
+    with _pools_lock:
+        pool_id = tuple(sorted(seen))
+        pool = _pools.get(pool_id)
+        if pool is None:
+            pool = _pools[pool_id] = KeyPool(entries)
+            log.info("Using %d API keys", len(pool))
+        return pool
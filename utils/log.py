@@ -0,0 +1,116 @@
+﻿"""Logging for the add-on.
+
+All modules log below the "gemini_tts" logger, which writes to a size-capped
+rotating file in user_files/, keeps the latest records in memory for the
+dialog's Log tab, and echoes warnings and errors to stderr. Log calls pass
+arguments separately ("%s") so nothing is formatted for disabled levels.
+
+Handlers are only attached by setup(): the add-on calls it once the main
+window is up (see setup_logging in __init__.py), the command line when it
+starts. Until then records go to the root logger like any library's.
+"""
+
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+
+LOGGER_NAME = "gemini_tts"
+LOG_DIR = Path(__file__).parent.parent / "user_files"
+LOG_FILE = LOG_DIR / "gemini_tts.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+RING_SIZE = 1000
+# Longest line kept in the ring buffer; the file gets the whole record
+RING_LINE_CHARS = 2000
+
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_setup_lock = threading.Lock()
+_ring = None
+_console = None
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last capacity records as (level, formatted line).
+
+    Records are formatted when they arrive, so the buffer does not keep their
+    args (prompts, response bodies) alive; long lines are cut to max_chars.
+    """
+
+    def __init__(self, capacity=RING_SIZE, max_chars=RING_LINE_CHARS):
+        super().__init__()
+        self.max_chars = max_chars
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(line) > self.max_chars:
+            line = line[:self.max_chars] + f"… ({len(line) - self.max_chars} more characters)"
+        self.records.append((record.levelno, line))
+
+    def lines(self, limit=None, level=logging.NOTSET):
+        """Formatted records at or above level, oldest first"""
+        lines = [line for levelno, line in list(self.records) if levelno >= level]
+        if limit:
+            lines = lines[-limit:]
+        return lines
+
+    def clear(self):
+        self.records.clear()
+
+
+def setup(level=None):
+    """Attach the add-on's handlers once; level (name or number) may be changed later"""
+    global _ring, _console
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _ring is None:
+            formatter = logging.Formatter(FORMAT)
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+
+            _ring = RingBufferHandler()
+            _ring.setFormatter(formatter)
+            logger.addHandler(_ring)
+
+            _console = logging.StreamHandler()
+            _console.setLevel(logging.WARNING)
+            _console.setFormatter(formatter)
+            logger.addHandler(_console)
+
+            try:
+                from logging.handlers import RotatingFileHandler
+
+                LOG_DIR.mkdir(parents=True, exist_ok=True)
+                file_handler = RotatingFileHandler(
+                    LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                    encoding="utf-8", delay=True,
+                )
+                file_handler.setFormatter(formatter)
+                logger.addHandler(file_handler)
+            except OSError as e:
+                logger.warning("Log file unavailable: %s", e)
+        if level is not None:
+            logger.setLevel(level.upper() if isinstance(level, str) else level)
+    return logger
+
+
+def set_console_level(level):
+    """Change what is echoed to stderr (WARNING by default)"""
+    setup()
+    _console.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def get_logger(name):
+    """Logger for a module, e.g. get_logger(__name__) -> gemini_tts.gemini_client"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name.rsplit('.', 1)[-1]}")
+
+
+def ring_buffer():
+    """The in-memory handler behind the dialog's Log tab, or None before setup()"""
+    return _ring
@@ -0,0 +1,231 @@
+﻿"""In-process registry of per-request timings.
+
+Every client call runs inside track(), which makes a RequestTiming current
+for the calling thread. The timed transport (http_timing.py) adds the DNS,
+connect, TLS, time-to-first-byte and download phases to it; the client adds
+decode and file-write phases around its own work. When the call finishes the
+timing goes to the registry, which keeps the most recent ones and passes each
+to its listeners.
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# In the order they happen during a call
+PHASES = (
+    "queue_wait", "dns", "connect", "tls", "ttfb", "download",
+    "json_decode", "b64_decode", "file_write",
+)
+
+_local = threading.local()
+
+
+class RequestTiming:
+    """Phase durations (seconds), sizes and tags of one client call"""
+
+    __slots__ = (
+        "endpoint", "tags", "phases", "started", "total", "status", "error",
+        "request_bytes", "response_bytes", "http_requests", "new_connections",
+        "characters", "tokens",
+    )
+
+    def __init__(self, endpoint, tags=None):
+        self.endpoint = endpoint
+        self.tags = {k: v for k, v in (tags or {}).items() if v is not None}
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.total = None
+        self.status = None
+        self.error = None
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.http_requests = 0
+        self.new_connections = 0
+        self.characters = 0
+        self.tokens = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + max(0.0, seconds)
+
+    def merge(self, other):
+        """Add the phases and transfer counts of a timing made on another thread"""
+        for name, seconds in other.phases.items():
+            self.add(name, seconds)
+        if other.status is not None:
+            self.status = other.status
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        self.http_requests += other.http_requests
+        self.new_connections += other.new_connections
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as the given phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @property
+    def ok(self):
+        return self.error is None and (self.status is None or 200 <= self.status < 300)
+
+    def as_dict(self):
+        return {
+            "endpoint": self.endpoint,
+            "tags": dict(self.tags),
+            "status": self.status,
+            "error": self.error,
+            "total_ms": round((self.total or 0.0) * 1000, 3),
+            "phases_ms": {name: round(self.phases[name] * 1000, 3) for name in PHASES if name in self.phases},
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "http_requests": self.http_requests,
+            "new_connections": self.new_connections,
+            "characters": self.characters,
+            "tokens": self.tokens,
+        }
+
+    def __str__(self):
+        return self.summary()
+
+    def summary(self):
+        """One-line breakdown for debug output"""
+        phases = " ".join(
+            f"{name}={self.phases[name] * 1000:.1f}" for name in PHASES if name in self.phases
+        )
+        return (
+            f"{self.endpoint} {self.tags} status={self.status} total={(self.total or 0.0) * 1000:.1f}ms "
+            f"[{phases}] sent={self.request_bytes}B received={self.response_bytes}B"
+        )
+
+
+class MetricsRegistry:
+    """Keeps the most recent timings and fans each new one out to listeners"""
+
+    def __init__(self, history=1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """listener(timing) is called on the recording thread for every timing"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def record(self, timing):
+        with self._lock:
+            self._recent.append(timing)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(timing)
+            except Exception as e:
+                log.error("Metrics listener failed: %s", e)
+
+    def recent(self, limit=None):
+        """Return the latest timings, oldest first"""
+        with self._lock:
+            items = list(self._recent)
+        return items[-limit:] if limit else items
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+
+
+registry = MetricsRegistry()
+
+
+def current():
+    """The RequestTiming of the call running on this thread, or None"""
+    return getattr(_local, "timing", None)
+
+
+@contextmanager
+def use(timing):
+    """Make timing current on this thread without recording it (e.g. one
+    attempt of a hedged call, merged into the call's timing afterwards)"""
+    outer = current()
+    _local.timing = timing
+    try:
+        yield timing
+    finally:
+        _local.timing = outer
+
+
+@contextmanager
+def track(endpoint, **tags):
+    """Time one client call; yields its RequestTiming and records it on exit.
+
+    Calls may nest (e.g. a grounded generate_text embeds the prompt first);
+    each gets its own timing and the outer one becomes current again after.
+    """
+    outer = current()
+    timing = RequestTiming(endpoint, tags)
+    queued_since = getattr(_local, "queued_since", None)
+    if queued_since is not None:
+        _local.queued_since = None
+        timing.add("queue_wait", timing.started - queued_since)
+    _local.timing = timing
+    try:
+        yield timing
+    except Exception as e:
+        timing.error = timing.error or f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        timing.total = time.perf_counter() - timing.started
+        _local.timing = outer
+        # str(timing) only runs if debug logging is on
+        log.debug("%s", timing)
+        registry.record(timing)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit() that reports the time spent waiting for a worker.
+
+    The wait is charged as queue_wait to the first call the job makes.
+    """
+    queued_since = time.perf_counter()
+
+    def run():
+        _local.queued_since = queued_since
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.queued_since = None
+
+    return executor.submit(run)
+
+
+def endpoint_tags(url):
+    """Return (endpoint, tags) for an API URL or path.
+
+    ".../models/gemini-2.5-flash:generateContent" -> ("generateContent", {"model": "gemini-2.5-flash"})
+    ".../v1beta/files/abc" -> ("files", {})
+    """
+    path = urlsplit(url).path.strip("/")
+    parts = [p for p in path.split("/") if p and p != "upload" and not p.startswith("v1")]
+    if not parts:
+        return "unknown", {}
+    last = parts[-1]
+    if ":" in last:
+        resource, method = last.split(":", 1)
+        if len(parts) > 1 and parts[-2] in ("models", "tunedModels"):
+            return method, {"model": resource}
+        return method, {}
+    return parts[0], {}
@@ -0,0 +1,312 @@
+﻿"""Notes from files outside Anki: CSV/TSV tables and exported .apkg decks.
+
+Both readers stream (item_id, text) pairs for BulkRunner and later write an
+updated copy of the input with one field filled from the job's outputs.
+Outputs are kept in an OutputStore next to the output file while the job
+runs, so an interrupted job can be resumed and still write every result.
+
+.apkg files must be exported with "Support older Anki versions" (a
+collection.anki2 or .anki21 inside); the zstd-compressed .anki21b format
+needs Anki itself.
+"""
+
+import re
+import csv
+import html
+import json
+import time
+import hashlib
+import shutil
+import sqlite3
+import zipfile
+import threading
+from pathlib import Path
+
+FIELD_SEPARATOR = "\x1f"
+
+# As in Anki's strip_html_preserving_media_filenames (rslib/src/text.rs)
+_MEDIA_TAG_RE = re.compile(r"""<(?:img|audio|source|object)\b[^>]*?\b(?:src|data)\s*=\s*["']?([^"'>\s]+)[^>]*>""",
+                           re.IGNORECASE | re.DOTALL)
+_HTML_RE = re.compile(r"<!--.*?-->|<.*?>", re.DOTALL)
+
+
+def strip_html_keeping_media(text):
+    """Field text as Anki stores it for sorting and duplicate checks (notes.sfld/csum)"""
+    text = _MEDIA_TAG_RE.sub(r" \1 ", text)
+    text = _HTML_RE.sub("", text)
+    return html.unescape(text.replace("&nbsp;", " "))
+
+
+def field_checksum(first_field):
+    """notes.csum: the first 32 bits of the SHA-1 of the stripped first field"""
+    digest = hashlib.sha1(strip_html_keeping_media(first_field).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def _sort_field_idx(config):
+    """sort_field_idx (field 2) from a serialized NotetypeConfig protobuf; 0 if absent"""
+    pos = 0
+    try:
+        while pos < len(config):
+            key, pos = _varint(config, pos)
+            number, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                value, pos = _varint(config, pos)
+                if number == 2:
+                    return value
+            elif wire_type == 2:
+                length, pos = _varint(config, pos)
+                pos += length
+            elif wire_type == 1:
+                pos += 8
+            elif wire_type == 5:
+                pos += 4
+            else:
+                break
+    except IndexError:
+        pass
+    return 0
+
+
+class OutputStore:
+    """item_id -> output, persisted in a small SQLite file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS outputs (item_id INTEGER PRIMARY KEY, output TEXT)")
+        self._conn.commit()
+
+    def put_many(self, results):
+        """BulkRunner sink: store a batch of (item_id, output)"""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO outputs VALUES (?, ?)", results)
+            self._conn.commit()
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._conn.execute("SELECT output FROM outputs WHERE item_id = ?", (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def values(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT output FROM outputs")]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outputs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def delete(self):
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
+
+def dialect(path, delimiter=None):
+    """The delimiter to use for path: the given one, else tab for .tsv/.tab/.txt and comma otherwise"""
+    if delimiter:
+        return delimiter
+    return "\t" if Path(path).suffix.lower() in (".tsv", ".tab", ".txt") else ","
+
+
+class CsvNotes:
+    """A CSV/TSV file with a header row; item ids are 1-based row numbers"""
+
+    media_files = ()
+
+    def __init__(self, path, delimiter=None):
+        self.path = Path(path)
+        self.delimiter = dialect(path, delimiter)
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            self.columns = next(csv.reader(f, delimiter=self.delimiter), [])
+
+    def _rows(self):
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f, delimiter=self.delimiter)
+            for row_no, row in enumerate(reader, start=1):
+                yield row_no, row
+
+    def check_fields(self, field, target):
+        if field not in self.columns:
+            raise ValueError(f"No column {field!r} in {self.path.name} (columns: {', '.join(self.columns)})")
+
+    def items(self, field, target, overwrite=False):
+        """Yield (row number, text) for rows with text and, unless overwrite, no target value yet"""
+        for row_no, row in self._rows():
+            text = (row.get(field) or "").strip()
+            if text and (overwrite or not (row.get(target) or "").strip()):
+                yield row_no, text
+
+    def write(self, out_path, outputs, target, render=str):
+        """Write the table with target set from outputs.get(row number); returns rows updated"""
+        columns = self.columns if target in self.columns else [*self.columns, target]
+        updated = 0
+        with open(out_path, "w", newline="", encoding="utf-8") as f:
+            # The output's own extension decides its format (e.g. .tsv in, .csv out)
+            writer = csv.DictWriter(f, fieldnames=columns, delimiter=dialect(out_path), extrasaction="ignore")
+            writer.writeheader()
+            for row_no, row in self._rows():
+                output = outputs.get(row_no)
+                if output is not None:
+                    row[target] = render(output)
+                    updated += 1
+                writer.writerow(row)
+        return updated
+
+
+class ApkgNotes:
+    """Notes of an exported deck; the collection is unpacked into workdir"""
+
+    def __init__(self, path, workdir):
+        self.path = Path(path)
+        self.workdir = Path(workdir)
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(self.path) as z:
+            names = set(z.namelist())
+            if "collection.anki21" in names:
+                self.collection_name = "collection.anki21"
+            elif "collection.anki21b" in names:
+                raise ValueError(
+                    f"{self.path.name} uses the new compressed format; "
+                    "export it again with 'Support older Anki versions' checked"
+                )
+            elif "collection.anki2" in names:
+                self.collection_name = "collection.anki2"
+            else:
+                raise ValueError(f"{self.path.name} has no collection inside")
+            self.collection = self.workdir / self.collection_name
+            if not self.collection.exists():
+                z.extract(self.collection_name, self.workdir)
+            media = z.read("media") if "media" in names else b"{}"
+        try:
+            self.media = json.loads(media or b"{}")
+        except ValueError:
+            raise ValueError(f"{self.path.name} has a media list this version cannot read")
+        self.media_files = []
+        self.field_names, self.sort_fields = self._field_names()
+
+    def _connect(self):
+        return sqlite3.connect(str(self.collection))
+
+    def _field_names(self):
+        """({notetype id: [field names in order]}, {notetype id: sort field index})"""
+        conn = self._connect()
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            names = {}
+            sort_fields = {}
+            if "fields" in tables:
+                for ntid, _, name in conn.execute("SELECT ntid, ord, name FROM fields ORDER BY ntid, ord"):
+                    names.setdefault(ntid, []).append(name)
+                for ntid, config in conn.execute("SELECT id, config FROM notetypes"):
+                    sort_fields[ntid] = _sort_field_idx(config or b"")
+            else:
+                models = json.loads(conn.execute("SELECT models FROM col").fetchone()[0])
+                for mid, model in models.items():
+                    fields = sorted(model["flds"], key=lambda f: f["ord"])
+                    names[int(mid)] = [f["name"] for f in fields]
+                    sort_fields[int(mid)] = model.get("sortf", 0)
+            return names, sort_fields
+        finally:
+            conn.close()
+
+    @property
+    def columns(self):
+        return sorted({name for names in self.field_names.values() for name in names})
+
+    def check_fields(self, field, target):
+        if not any(field in names and target in names for names in self.field_names.values()):
+            raise ValueError(f"No note type in {self.path.name} has both {field!r} and {target!r} fields")
+
+    def items(self, field, target, overwrite=False):
+        """Yield (note id, text) for notes of note types with both fields"""
+        conn = self._connect()
+        try:
+            for note_id, mid, flds in conn.execute("SELECT id, mid, flds FROM notes ORDER BY id"):
+                names = self.field_names.get(mid, ())
+                if field not in names or target not in names:
+                    continue
+                values = flds.split(FIELD_SEPARATOR)
+                text = values[names.index(field)].strip()
+                if text and (overwrite or not values[names.index(target)].strip()):
+                    yield note_id, text
+        finally:
+            conn.close()
+
+    def add_media(self, path):
+        """Include a media file (e.g. generated audio) in the written package"""
+        self.media_files.append(Path(path))
+
+    def write(self, out_path, outputs, target, render=str):
+        """Write a new .apkg with target set from outputs.get(note id); returns notes updated"""
+        conn = self._connect()
+        updated = 0
+        try:
+            now = int(time.time())
+            changes = []
+            for note_id, mid, flds in conn.execute("SELECT id, mid, flds FROM notes ORDER BY id").fetchall():
+                names = self.field_names.get(mid, ())
+                output = outputs.get(note_id) if target in names else None
+                if output is None:
+                    continue
+                values = flds.split(FIELD_SEPARATOR)
+                values[names.index(target)] = render(output)
+                sort_idx = self.sort_fields.get(mid, 0)
+                sort_field = strip_html_keeping_media(values[sort_idx if sort_idx < len(values) else 0])
+                changes.append((FIELD_SEPARATOR.join(values), sort_field, field_checksum(values[0]), now, note_id))
+            # sfld/csum must match the fields, or Anki's sorting and duplicate checks go stale.
+            # usn -1 marks the notes as changed for Anki's importer and sync.
+            conn.executemany(
+                "UPDATE notes SET flds = ?, sfld = ?, csum = ?, mod = ?, usn = -1 WHERE id = ?", changes
+            )
+            conn.commit()
+            updated = len(changes)
+        finally:
+            conn.close()
+
+        media = dict(self.media)
+        known = set(media.values())
+        next_index = max((int(k) for k in media), default=-1) + 1
+        partial = Path(f"{out_path}.part")
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED) as z:
+            for info in source.infolist():
+                if info.filename in (self.collection_name, "media"):
+                    continue
+                with source.open(info) as src, z.open(info, "w") as dst:
+                    shutil.copyfileobj(src, dst)
+            z.write(self.collection, self.collection_name)
+            for path in self.media_files:
+                if path.name in known:
+                    continue
+                # Audio is already compressed
+                z.write(path, str(next_index), compress_type=zipfile.ZIP_STORED)
+                media[str(next_index)] = path.name
+                known.add(path.name)
+                next_index += 1
+            z.writestr("media", json.dumps(media))
+        partial.replace(out_path)
+        return updated
+
+
+def open_notes(path, workdir, delimiter=None):
+    """CsvNotes or ApkgNotes depending on the file extension"""
+    if Path(path).suffix.lower() == ".apkg":
+        return ApkgNotes(path, workdir)
+    return CsvNotes(path, delimiter)
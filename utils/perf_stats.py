@@ -0,0 +1,237 @@
+﻿"""Rolling latency and throughput statistics built from metrics timings.
+
+Latencies go into fixed log-spaced bucket histograms, so recording is O(1)
+and memory stays constant however many requests are made. The rolling
+window is a ring of time slots; a slot is cleared when the ring comes back
+around to it, so old requests drop out without being stored individually.
+"""
+
+import json
+import math
+import time
+import threading
+from pathlib import Path
+
+from . import metrics
+
+STATS_DIR = Path(__file__).parent.parent / "user_files"
+
+# Buckets grow by 20% from 1 ms; reporting each bucket's geometric midpoint
+# keeps percentiles within about 10%. 75 buckets reach about 14 minutes.
+_MIN_SECONDS = 0.001
+_GROWTH = 1.2
+_BUCKETS = 75
+_LOG_GROWTH = math.log(_GROWTH)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.total = 0
+
+    @staticmethod
+    def bucket(seconds):
+        if seconds <= _MIN_SECONDS:
+            return 0
+        return min(_BUCKETS - 1, int(math.log(seconds / _MIN_SECONDS) / _LOG_GROWTH) + 1)
+
+    @staticmethod
+    def midpoint(index):
+        if index == 0:
+            return _MIN_SECONDS
+        return _MIN_SECONDS * _GROWTH ** (index - 0.5)
+
+    def record(self, seconds):
+        self.counts[self.bucket(seconds)] += 1
+        self.total += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+
+    def percentile(self, p):
+        """Midpoint (seconds) of the bucket holding the p-th percentile, or None"""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.midpoint(i)
+        return self.midpoint(_BUCKETS - 1)
+
+
+class Counters:
+    """Request counts, volumes and latency histogram for one endpoint"""
+
+    __slots__ = ("requests", "errors", "throttled", "characters", "tokens", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.characters = 0
+        self.tokens = 0
+        self.latency = Histogram()
+
+    def record(self, timing):
+        self.requests += 1
+        if not timing.ok:
+            self.errors += 1
+        if timing.status == 429:
+            self.throttled += 1
+        self.characters += timing.characters
+        self.tokens += timing.tokens
+        self.latency.record(timing.total or 0.0)
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.throttled += other.throttled
+        self.characters += other.characters
+        self.tokens += other.tokens
+        self.latency.merge(other.latency)
+
+    def summary(self, seconds):
+        def ms(p):
+            value = self.latency.percentile(p)
+            return None if value is None else round(value * 1000, 1)
+
+        seconds = max(seconds, 1e-9)
+        requests = max(self.requests, 1)
+        return {
+            "requests": self.requests,
+            "rps": round(self.requests / seconds, 3),
+            "p50_ms": ms(50),
+            "p90_ms": ms(90),
+            "p99_ms": ms(99),
+            "error_rate": round(self.errors / requests, 4),
+            "throttle_rate": round(self.throttled / requests, 4),
+            "chars_per_s": round(self.characters / seconds, 1),
+            "tokens_per_s": round(self.tokens / seconds, 1),
+        }
+
+
+class PerfStats:
+    """Rolling per-endpoint statistics over the last window seconds"""
+
+    def __init__(self, window=60, slots=12):
+        self.window = window
+        self.slot_seconds = window / slots
+        self._lock = threading.Lock()
+        self._slots = [(None, {}) for _ in range(slots)]
+        self._lifetime = {}
+        self._started = time.time()
+
+    def _slot_index(self, now):
+        return int(now // self.slot_seconds)
+
+    def record(self, timing):
+        """metrics.registry listener"""
+        now = time.time()
+        index = self._slot_index(now)
+        position = index % len(self._slots)
+        with self._lock:
+            slot_index, endpoints = self._slots[position]
+            if slot_index != index:
+                endpoints = {}
+                self._slots[position] = (index, endpoints)
+            for table in (endpoints, self._lifetime):
+                counters = table.get(timing.endpoint)
+                if counters is None:
+                    counters = table[timing.endpoint] = Counters()
+                counters.record(timing)
+
+    def reset(self):
+        with self._lock:
+            self._slots = [(None, {}) for _ in self._slots]
+            self._lifetime = {}
+            self._started = time.time()
+
+    def percentile(self, endpoint, p, min_samples=1, now=None):
+        """Latency (seconds) at the p-th percentile for endpoint over the window,
+        or since the start if the window has fewer than min_samples; None if
+        there are not enough samples either way"""
+        now = time.time() if now is None else now
+        oldest = self._slot_index(now) - len(self._slots) + 1
+        window = Histogram()
+        with self._lock:
+            for slot_index, endpoints in self._slots:
+                if slot_index is not None and slot_index >= oldest and endpoint in endpoints:
+                    window.merge(endpoints[endpoint].latency)
+            lifetime = self._lifetime.get(endpoint)
+            for histogram in (window, lifetime.latency if lifetime is not None else None):
+                if histogram is not None and histogram.total >= min_samples:
+                    return histogram.percentile(p)
+        return None
+
+    def snapshot(self, now=None):
+        """Aggregate the live slots; returns a JSON-serializable dict"""
+        now = time.time() if now is None else now
+        current = self._slot_index(now)
+        oldest = current - len(self._slots) + 1
+        merged = {}
+        with self._lock:
+            for slot_index, endpoints in self._slots:
+                if slot_index is None or slot_index < oldest:
+                    continue
+                for endpoint, counters in endpoints.items():
+                    merged.setdefault(endpoint, Counters()).merge(counters)
+            lifetime = {}
+            for endpoint, counters in self._lifetime.items():
+                lifetime.setdefault(endpoint, Counters()).merge(counters)
+            started = self._started
+
+        # The newest slot is only partly elapsed
+        seconds = min(self.window, max(now - started, self.slot_seconds))
+        overall = Counters()
+        for counters in merged.values():
+            overall.merge(counters)
+        lifetime_overall = Counters()
+        for counters in lifetime.values():
+            lifetime_overall.merge(counters)
+        lifetime_seconds = max(now - started, 1e-9)
+        return {
+            "time": now,
+            "window_seconds": round(seconds, 1),
+            "overall": overall.summary(seconds),
+            "endpoints": {name: c.summary(seconds) for name, c in sorted(merged.items())},
+            "lifetime": {
+                "seconds": round(lifetime_seconds, 1),
+                "overall": lifetime_overall.summary(lifetime_seconds),
+                "endpoints": {name: c.summary(lifetime_seconds) for name, c in sorted(lifetime.items())},
+            },
+        }
+
+    def export_json(self, extra=None, path=None):
+        """Write a snapshot (plus the recent raw timings) to user_files; returns the path"""
+        data = self.snapshot()
+        data["recent"] = [t.as_dict() for t in metrics.registry.recent(200)]
+        if extra:
+            data.update(extra)
+        if path is None:
+            STATS_DIR.mkdir(parents=True, exist_ok=True)
+            path = STATS_DIR / time.strftime("performance-%Y%m%d-%H%M%S.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        return path
+
+
+_perf_stats = None
+_perf_stats_lock = threading.Lock()
+
+
+def get_perf_stats():
+    """Return the shared PerfStats, registering it with metrics.registry on first use"""
+    global _perf_stats
+    with _perf_stats_lock:
+        if _perf_stats is None:
+            _perf_stats = PerfStats()
+            metrics.registry.add_listener(_perf_stats.record)
+        return _perf_stats
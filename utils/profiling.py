@@ -0,0 +1,195 @@
+﻿"""Opt-in profiling of long-running jobs.
+
+JobProfiler wraps a block of work (usually a bulk job) and writes to
+user_files/profiles/:
+
+- <name>.pstats          cProfile data merged over every thread started
+                         inside the block (open with pstats or snakeviz)
+- <name>-alloc.txt       tracemalloc top allocations at each interval and
+                         the growth between the first and last snapshot
+- <name>.collapsed       sampled stacks of all threads in the collapsed
+                         format read by flamegraph.pl and speedscope
+
+    with JobProfiler("bulk-tts") as profiler:
+        runner.run(items)
+    profiler.paths  # the files written
+
+cProfile and tracemalloc slow the job down noticeably; this is meant for
+diagnosing a run, not for leaving on.
+"""
+
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from collections import Counter
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+addon_dir = Path(__file__).parent.parent
+PROFILES_DIR = addon_dir / "user_files" / "profiles"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _thread_group(name):
+    """Pool threads are merged into one root ("ThreadPoolExecutor-0_3" -> "ThreadPoolExecutor-0")"""
+    return re.sub(r"_\d+$", "", name)
+
+
+class JobProfiler:
+    """Context manager running cProfile, tracemalloc and a stack sampler"""
+
+    def __init__(self, name, out_dir=PROFILES_DIR, snapshot_interval=10.0, sample_interval=0.01,
+                 top=30, traceback_frames=10):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.name = f"{name}-{stamp}"
+        self.out_dir = Path(out_dir)
+        self.snapshot_interval = snapshot_interval
+        self.sample_interval = sample_interval
+        self.top = top
+        self.traceback_frames = traceback_frames
+        self.paths = {}
+        self._profiles = []
+        self._profiles_lock = threading.Lock()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._threads = []
+        self._main_profile = None
+        self._first_snapshot = None
+        self._alloc_file = None
+        self._started = None
+        self._started_tracemalloc = False
+
+    # --- cProfile in every thread ---
+    def _new_profile(self):
+        profile = cProfile.Profile()
+        with self._profiles_lock:
+            self._profiles.append(profile)
+        return profile
+
+    def _thread_hook(self, frame, event, arg):
+        # Runs first thing in each new thread: swap this hook for a real profiler
+        sys.setprofile(None)
+        self._new_profile().enable()
+
+    # --- background samplers ---
+    def _sample_stacks(self):
+        names = {}
+        while not self._stop.wait(self.sample_interval):
+            own = {thread.ident for thread in self._threads}
+            for ident, frame in sys._current_frames().items():
+                if ident in own:
+                    continue
+                if ident not in names:
+                    names.update((t.ident, _thread_group(t.name)) for t in threading.enumerate())
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def _snapshot_allocations(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        if self._first_snapshot is None:
+            self._first_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        f = self._alloc_file
+        f.write(f"=== t={time.perf_counter() - self._started:.1f}s traced {current / 1e6:.1f} MB, "
+                f"peak {peak / 1e6:.1f} MB ===\n")
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            f.write(f"{stat}\n")
+        f.write("\n")
+        f.flush()
+        return snapshot
+
+    # --- lifecycle ---
+    def start(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._started = time.perf_counter()
+        self.paths = {
+            "pstats": self.out_dir / f"{self.name}.pstats",
+            "allocations": self.out_dir / f"{self.name}-alloc.txt",
+            "collapsed": self.out_dir / f"{self.name}.collapsed",
+        }
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.traceback_frames)
+            self._started_tracemalloc = True
+        self._alloc_file = open(self.paths["allocations"], "w", encoding="utf-8")
+        self._write_snapshot()
+
+        self._threads = [
+            threading.Thread(target=self._sample_stacks, name="profiler-stacks", daemon=True),
+            threading.Thread(target=self._snapshot_allocations, name="profiler-alloc", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        # Samplers start first so they are not profiled themselves
+        threading.setprofile(self._thread_hook)
+        self._main_profile = self._new_profile()
+        self._main_profile.enable()
+        log.info("Profiling %s into %s", self.name, self.out_dir)
+        return self
+
+    def stop(self):
+        self._main_profile.disable()
+        threading.setprofile(None)
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+        last = self._write_snapshot()
+        self._alloc_file.write("=== growth since the first snapshot ===\n")
+        for stat in last.compare_to(self._first_snapshot, "lineno")[: self.top]:
+            self._alloc_file.write(f"{stat}\n")
+        self._alloc_file.close()
+        self._first_snapshot = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        with self._profiles_lock:
+            profiles = list(self._profiles)
+        # Worker threads still alive (idle pool threads) keep their profiler
+        # enabled; their collected data is complete once the work is done
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:  # a thread that never ran any Python code
+                continue
+        if stats is not None:
+            stats.dump_stats(str(self.paths["pstats"]))
+
+        with open(self.paths["collapsed"], "w", encoding="utf-8") as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        log.info("Profile of %s written (%d threads, %d stack samples, %.1f s)", self.name, len(profiles),
+                 sum(self._stacks.values()), time.perf_counter() - self._started)
+        return {k: str(v) for k, v in self.paths.items()}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
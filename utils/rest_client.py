@@ -0,0 +1,213 @@
+﻿import os
+
+from . import metrics
+from .gemini_client import get_session
+
+BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+
+# batchEmbedContents accepts at most this many requests per call.
+MAX_EMBED_BATCH = 100
+
+
+def _model_name(model):
+    return model if model.startswith(("models/", "tunedModels/")) else f"models/{model}"
+
+
+def _text_contents(text):
+    return [{"role": "user", "parts": [{"text": text}]}]
+
+
+class GeminiRestClient:
+    """Plain JSON-over-HTTP client for the Gemini API endpoints beyond generateContent.
+
+    Covers embeddings, cachedContents, files (resumable upload), models and
+    countTokens without importing google.generativeai, proto-plus or
+    protobuf: requests and responses are the REST API's own JSON dicts, sent
+    over the shared pooled session.
+
+    Every method returns (result, error) like GeminiClient.
+    """
+
+    def __init__(self, api_key, base_url=BASE_URL, session=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.session = session or get_session()
+        self.configured = bool(api_key and self.session is not None)
+
+    def _call(self, method, path, payload=None, params=None, timeout=60):
+        if not self.configured:
+            return None, "Client not initialized"
+        endpoint, tags = metrics.endpoint_tags(path)
+        try:
+            with metrics.track(endpoint, **tags) as timing:
+                response = self.session.request(
+                    method,
+                    f"{self.base_url}/{path}",
+                    headers={"x-goog-api-key": self.api_key},
+                    json=payload,
+                    params=params,
+                    timeout=timeout,
+                )
+                if response.status_code == 200:
+                    with timing.phase("json_decode"):
+                        return (response.json() if response.content else {}), None
+            return None, f"HTTP {response.status_code}: {response.text}"
+        except Exception as e:
+            return None, f"Request failed: {str(e)}"
+
+    def _list(self, path, field, page_size, params=None):
+        items = []
+        params = dict(params or {}, pageSize=page_size)
+        while True:
+            data, error = self._call("GET", path, params=params)
+            if error:
+                return None, error
+            items.extend(data.get(field, []))
+            token = data.get("nextPageToken")
+            if not token:
+                return items, None
+            params["pageToken"] = token
+
+    # -----------------------------
+    # EMBEDDINGS
+    # -----------------------------
+    def embed_content(self, text, model="text-embedding-004", task_type="RETRIEVAL_DOCUMENT",
+                      title=None, output_dimensionality=None):
+        """Embed a single text; returns (values, error)"""
+        payload = {"content": {"parts": [{"text": text}]}, "taskType": task_type}
+        if title:
+            payload["title"] = title
+        if output_dimensionality:
+            payload["outputDimensionality"] = output_dimensionality
+        data, error = self._call("POST", f"{_model_name(model)}:embedContent", payload)
+        if error:
+            return None, error
+        return data.get("embedding", {}).get("values", []), None
+
+    def batch_embed_contents(self, texts, model="text-embedding-004", task_type="RETRIEVAL_DOCUMENT",
+                             output_dimensionality=None):
+        """Embed many texts, MAX_EMBED_BATCH per request; returns (list of values, error)"""
+        name = _model_name(model)
+        vectors = []
+        for start in range(0, len(texts), MAX_EMBED_BATCH):
+            batch = texts[start:start + MAX_EMBED_BATCH]
+            batch_requests = []
+            for text in batch:
+                request = {"model": name, "content": {"parts": [{"text": text}]}, "taskType": task_type}
+                if output_dimensionality:
+                    request["outputDimensionality"] = output_dimensionality
+                batch_requests.append(request)
+            data, error = self._call("POST", f"{name}:batchEmbedContents", {"requests": batch_requests})
+            if error:
+                return None, error
+            embeddings = data.get("embeddings", [])
+            if len(embeddings) != len(batch):
+                return None, "Embedding count does not match input"
+            vectors.extend(e.get("values", []) for e in embeddings)
+        return vectors, None
+
+    # -----------------------------
+    # CACHED CONTENTS
+    # -----------------------------
+    def create_cached_content(self, model, contents=None, system_instruction=None, ttl_seconds=3600,
+                              display_name=None):
+        """Create a context cache; contents may be a string or REST contents list"""
+        payload = {"model": _model_name(model), "ttl": f"{int(ttl_seconds)}s"}
+        if contents:
+            payload["contents"] = _text_contents(contents) if isinstance(contents, str) else contents
+        if system_instruction:
+            payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        if display_name:
+            payload["displayName"] = display_name
+        return self._call("POST", "cachedContents", payload)
+
+    def get_cached_content(self, name):
+        return self._call("GET", name if "/" in name else f"cachedContents/{name}")
+
+    def list_cached_contents(self, page_size=1000):
+        return self._list("cachedContents", "cachedContents", page_size)
+
+    def update_cached_content(self, name, ttl_seconds):
+        """Extend or shorten a cache's lifetime"""
+        name = name if "/" in name else f"cachedContents/{name}"
+        return self._call(
+            "PATCH", name, {"ttl": f"{int(ttl_seconds)}s"}, params={"updateMask": "ttl"}
+        )
+
+    def delete_cached_content(self, name):
+        return self._call("DELETE", name if "/" in name else f"cachedContents/{name}")
+
+    # -----------------------------
+    # FILES
+    # -----------------------------
+    def upload_file(self, path, mime_type=None, display_name=None):
+        """Upload a local file with the resumable protocol; returns (file dict, error)"""
+        if not self.configured:
+            return None, "Client not initialized"
+        if mime_type is None:
+            import mimetypes
+
+            mime_type, _ = mimetypes.guess_type(str(path))
+        mime_type = mime_type or "application/octet-stream"
+        size = os.path.getsize(path)
+        try:
+            start = self.session.post(
+                UPLOAD_URL,
+                headers={
+                    "x-goog-api-key": self.api_key,
+                    "X-Goog-Upload-Protocol": "resumable",
+                    "X-Goog-Upload-Command": "start",
+                    "X-Goog-Upload-Header-Content-Length": str(size),
+                    "X-Goog-Upload-Header-Content-Type": mime_type,
+                },
+                json={"file": {"displayName": display_name or os.path.basename(path)}},
+                timeout=60,
+            )
+            if start.status_code != 200:
+                return None, f"HTTP {start.status_code}: {start.text}"
+            upload_url = start.headers["X-Goog-Upload-URL"]
+
+            with open(path, "rb") as f:
+                response = self.session.post(
+                    upload_url,
+                    headers={
+                        "Content-Length": str(size),
+                        "X-Goog-Upload-Offset": "0",
+                        "X-Goog-Upload-Command": "upload, finalize",
+                    },
+                    data=f,
+                    timeout=600,
+                )
+            if response.status_code != 200:
+                return None, f"HTTP {response.status_code}: {response.text}"
+            return response.json().get("file", {}), None
+        except Exception as e:
+            return None, f"Upload failed: {str(e)}"
+
+    def get_file(self, name):
+        return self._call("GET", name if "/" in name else f"files/{name}")
+
+    def list_files(self, page_size=100):
+        return self._list("files", "files", page_size)
+
+    def delete_file(self, name):
+        return self._call("DELETE", name if "/" in name else f"files/{name}")
+
+    # -----------------------------
+    # MODELS AND TOKENS
+    # -----------------------------
+    def list_models(self, page_size=1000):
+        return self._list("models", "models", page_size)
+
+    def get_model(self, model):
+        return self._call("GET", _model_name(model))
+
+    def count_tokens(self, model, contents):
+        """Count tokens for a string or REST contents list; returns (total, error)"""
+        if isinstance(contents, str):
+            contents = _text_contents(contents)
+        data, error = self._call("POST", f"{_model_name(model)}:countTokens", {"contents": contents})
+        if error:
+            return None, error
+        return data.get("totalTokens", 0), None
@@ -0,0 +1,162 @@
+﻿import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+from . import vendor
+
+TTLCache = vendor.load("cachetools").TTLCache
+
+addon_dir = Path(__file__).parent.parent
+DEFAULT_DB_PATH = addon_dir / "user_files" / "result_cache.sqlite3"
+
+
+def make_cache_key(model, prompt, temperature, max_tokens,
+                   response_schema=None, system_instruction=None, files=None):
+    """Build a stable key from the canonical generation request"""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_schema": response_schema,
+            "system_instruction": system_instruction,
+            "files": sorted(f["uri"] for f in files) if files else None,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Two-level cache for generate_text results.
+
+    An in-memory TTLCache sits in front of a persistent SQLite table, so
+    repeated prompts are answered without another API call even after Anki
+    restarts or a bulk run is interrupted.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, memory_size=256, memory_ttl=3600,
+                 max_age_days=30, bypass_templates=()):
+        self.db_path = Path(db_path)
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.bypass_templates = set(bypass_templates or ())
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = TTLCache(maxsize=memory_size, ttl=memory_ttl)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def is_bypassed(self, template):
+        """Return True if results for this template must not be cached"""
+        return template is not None and template in self.bypass_templates
+
+    def set_bypass(self, template, bypass=True):
+        """Enable or disable the cache for a single template"""
+        if bypass:
+            self.bypass_templates.add(template)
+        else:
+            self.bypass_templates.discard(template)
+
+    def get(self, key):
+        """Return the cached text for key, or None"""
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self.hits += 1
+                return text
+
+            row = self._connect().execute(
+                "SELECT response, created FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and (self.max_age is None or time.time() - row[1] < self.max_age):
+                self._memory[key] = row[0]
+                self.hits += 1
+                return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, model, text):
+        """Store a generated text under key in both levels"""
+        with self._lock:
+            self._memory[key] = text
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, model, response, created) VALUES (?, ?, ?, ?)",
+                (key, model, text, time.time()),
+            )
+            conn.commit()
+
+    def purge_expired(self):
+        """Delete persisted entries older than max_age; returns the number removed"""
+        if self.max_age is None:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            cur = conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.max_age,))
+            conn.commit()
+            return cur.rowcount
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            conn.execute("DELETE FROM results")
+            conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current hit ratio"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_result_cache(config=None):
+    """Return the process-wide result cache configured from the add-on config"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            config = config or {}
+            _shared_cache = ResultCache(
+                memory_size=config.get("cache_memory_size", 256),
+                memory_ttl=config.get("cache_memory_ttl", 3600),
+                max_age_days=config.get("cache_max_age_days", 30),
+                bypass_templates=config.get("cache_bypass_templates", []),
+            )
+        return _shared_cache
@@ -0,0 +1,117 @@
+﻿"""Detects the running interpreter and which native accelerators are usable.
+
+lib/ ships extension modules built for one platform only (currently
+cp39-win_amd64), so on other systems the vendored protobuf silently falls back
+to its pure-Python implementation. This module reports what is actually in
+effect and lets callers keep protobuf off the hot path when it would be slow.
+"""
+
+import os
+import sys
+import sysconfig
+import threading
+import importlib.machinery
+
+from . import vendor
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_NATIVE_PROTOBUF = ("upb", "cpp")
+
+_cached = None
+_cached_lock = threading.Lock()
+_sdk_usable = None
+
+
+def interpreter_tag():
+    """e.g. cpython-39"""
+    return sys.implementation.cache_tag
+
+
+def platform_tag():
+    """e.g. win-amd64, linux-x86_64, macosx-11.0-arm64"""
+    return sysconfig.get_platform()
+
+
+def vendored_extensions(root=vendor.LIB_DIR):
+    """Return [(relative path, loadable here)] for every binary module in lib/
+
+    A file is loadable if it is its module name plus one of this interpreter's
+    extension suffixes, as the import system looks for it: _message.cp39-win_amd64.pyd
+    matches neither ".pyd" nor ".cp311-win_amd64.pyd" for the module _message.
+    """
+    suffixes = importlib.machinery.EXTENSION_SUFFIXES
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+        for filename in filenames:
+            if filename.endswith((".pyd", ".so")):
+                path = os.path.join(dirpath, filename)
+                module = filename.split(".", 1)[0]
+                found.append((os.path.relpath(path, root), any(filename == module + s for s in suffixes)))
+    return sorted(found)
+
+
+def protobuf_status():
+    """Implementation of the vendored google.protobuf: upb, cpp, python or absent"""
+    try:
+        api_implementation = vendor.load("google.protobuf.internal.api_implementation")
+    except ImportError:
+        return "absent"
+    return api_implementation.Type()
+
+
+def detect(refresh=False):
+    """Collect runtime details once per process; returns a dict"""
+    global _cached
+    with _cached_lock:
+        if _cached is not None and not refresh:
+            return _cached
+
+        extensions = vendored_extensions()
+        implementation = protobuf_status()
+        _cached = {
+            "python": sys.version.split()[0],
+            "interpreter": interpreter_tag(),
+            "platform": platform_tag(),
+            "protobuf": implementation,
+            "native_protobuf": implementation in _NATIVE_PROTOBUF,
+            "vendored_binaries": len(extensions),
+            "vendored_binaries_usable": sum(1 for _, usable in extensions if usable),
+        }
+        return _cached
+
+
+def sdk_importable():
+    """True if the vendored SDK's gRPC client imports here; checked once per process.
+
+    grpc's binary in lib/ is built for one platform too, so the SDK can fail
+    to import even where protobuf itself is native.
+    """
+    global _sdk_usable
+    with _cached_lock:
+        if _sdk_usable is None:
+            try:
+                vendor.load("google.generativeai.client")
+                _sdk_usable = True
+            except ImportError as e:
+                log.info("google.generativeai is not importable here (%s); using the JSON/REST path", e)
+                _sdk_usable = False
+        return _sdk_usable
+
+
+def use_proto_backend():
+    """True if protobuf-based SDK calls are fast here; otherwise use the JSON/REST path"""
+    return detect()["native_protobuf"] and sdk_importable()
+
+
+def describe():
+    """One-line summary of the active implementations, for status output"""
+    info = detect()
+    backend = "protobuf SDK" if use_proto_backend() else "JSON/REST"
+    return (
+        f"Python {info['python']} on {info['platform']}; protobuf: {info['protobuf']}; "
+        f"vendored binaries usable: {info['vendored_binaries_usable']}/{info['vendored_binaries']}; "
+        f"API backend: {backend}"
+    )
@@ -0,0 +1,230 @@
+﻿"""Single-pass CSV/TSV pipeline for bulk TTS or generation with bounded memory.
+
+The stages are chained generators, so each row is pulled through only when
+the writer is ready for it:
+
+    read_rows -> prepare (normalize, cache lookup) -> ordered_map (requests,
+    with backpressure) -> fill (set the target column) -> csv writer
+
+Rows come out in input order. At most `window` rows sit between the reader
+and the writer, and each clip goes from its response straight to its file,
+so memory use does not depend on the length of the input. Output is written
+to <output>.part with a checkpoint (rows written, byte offset); running
+again with resume=True truncates to the checkpoint and continues from the
+next row. The finished file is renamed to the output. Rows that still fail
+after the retries are written unchanged; running the output through again
+fills just those.
+"""
+
+import re
+import csv
+import html
+import json
+import time
+import threading
+import itertools
+import unicodedata
+from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import metrics
+from .bulk_jobs import BulkStats, call_with_retries
+from .log import get_logger
+from .note_files import dialect
+
+log = get_logger(__name__)
+
+_SOUND_RE = re.compile(r"\[sound:[^\]]*\]")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def normalize_text(text):
+    """Field text as it should be spoken: no HTML, sound tags or entities, single spaces"""
+    text = _SOUND_RE.sub(" ", text or "")
+    text = _TAG_RE.sub(" ", text)
+    text = unicodedata.normalize("NFC", html.unescape(text))
+    return " ".join(text.split())
+
+
+def read_rows(path, delimiter=None, skip=0):
+    """Yield (row number, row dict) lazily, starting after the first skip rows"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f, delimiter=dialect(path, delimiter))
+        yield from itertools.islice(enumerate(reader, start=1), skip, None)
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def ordered_map(fn, items, workers=8, window=64, ready=None):
+    """map(fn, items) on a thread pool, yielding results in input order.
+
+    At most window items are taken from items ahead of the consumer, which
+    is the backpressure: a slow writer slows the reader down. ready(item)
+    may return a result directly (e.g. a cache hit) to skip the pool.
+    """
+    window = max(window, workers)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            value = ready(item) if ready is not None else None
+            pending.append(_resolved(value) if value is not None else metrics.submit(executor, fn, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Closing the generator early (stop) drops the queued work
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class StreamPipeline:
+    """Fills target from field for every row of a CSV/TSV file (see module docstring)"""
+
+    def __init__(self, client, task, field, target, workers=8, window=64, max_retries=5, backoff=1.0,
+                 max_backoff=30.0, overwrite=False, render=str, normalize=normalize_text,
+                 checkpoint_rows=500, checkpoint_interval=2.0, limiter=None):
+        self.client = client
+        self.task = task
+        self.field = field
+        self.target = target
+        # With a limiter (utils/concurrency.py) workers is its maximum, not a fixed count
+        self.limiter = limiter
+        self.workers = limiter.max_limit if limiter is not None else max(1, workers)
+        self.window = max(window, self.workers)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.overwrite = overwrite
+        self.render = render
+        self.normalize = normalize
+        self.checkpoint_rows = checkpoint_rows
+        self.checkpoint_interval = checkpoint_interval
+        self.stats = BulkStats()
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        """Write the rows already finished, save the checkpoint and return from run()"""
+        self.stop_event.set()
+
+    # --- stages ---
+    def prepare(self, rows):
+        """(row_no, row) -> (row_no, row, text); text is None when the row is left as is"""
+        for row_no, row in rows:
+            self.stats.read += 1
+            text = self.normalize(row.get(self.field) or "")
+            if not text or (not self.overwrite and (row.get(self.target) or "").strip()):
+                self.stats.skipped += 1
+                text = None
+            yield row_no, row, text
+
+    def _ready(self, item):
+        row_no, row, text = item
+        if text is None:
+            return item, (None, None, False)
+        lookup = getattr(self.task, "lookup", None)
+        name = lookup(text) if lookup is not None else None
+        return (item, (name, None, True)) if name is not None else None
+
+    def _attempt(self, text):
+        if self.limiter is None:
+            return self.stats.timed("request", self.task, self.client, text)
+        return self.limiter.attempt(
+            lambda: self.stats.timed("request", self.task, self.client, text), self.stop_event
+        )
+
+    def _call(self, item):
+        output, error, cached, attempts = call_with_retries(
+            lambda: self._attempt(item[2]),
+            self.max_retries, self.backoff, self.max_backoff, self.stop_event, self.stats.add_retry,
+        )
+        return item, (output, error, cached)
+
+    def fill(self, results):
+        """Set the target column from each result; yields the rows in order"""
+        for (row_no, row, text), (output, error, cached) in results:
+            if text is not None:
+                if error and self.stop_event.is_set():
+                    # Cut short by stop(): leave this row for the resumed run
+                    return
+                if error:
+                    self.stats.failed += 1
+                    log.warning("Row %d failed: %.200s", row_no, error)
+                else:
+                    self.stats.done += 1
+                    self.stats.cached += cached
+                    row[self.target] = self.render(output)
+            yield row
+
+    # --- driver ---
+    def run(self, input_path, output_path, delimiter=None, resume=True, progress=None):
+        """Process input_path into output_path; returns the stats dict.
+
+        delimiter applies to the input; the output's follows its own extension.
+        """
+        output_path = Path(output_path)
+        part = Path(f"{output_path}.part")
+        checkpoint = Path(f"{output_path}.part.json")
+        delimiter = dialect(input_path, delimiter)
+        with open(input_path, newline="", encoding="utf-8-sig") as f:
+            columns = next(csv.reader(f, delimiter=delimiter), [])
+        if self.target not in columns:
+            columns.append(self.target)
+
+        skip = 0
+        if resume and part.exists() and checkpoint.exists():
+            state = json.loads(checkpoint.read_text(encoding="utf-8"))
+            skip = state["rows"]
+            with open(part, "r+b") as f:
+                f.truncate(state["offset"])
+            log.info("Resuming %s after row %d", output_path.name, skip)
+        out = open(part, "a" if skip else "w", newline="", encoding="utf-8")
+        writer = csv.DictWriter(out, fieldnames=columns, delimiter=dialect(output_path), extrasaction="ignore")
+        if not skip:
+            writer.writeheader()
+
+        def save_checkpoint(rows):
+            started = time.perf_counter()
+            out.flush()
+            state = {"rows": rows, "offset": out.tell()}
+            checkpoint.write_text(json.dumps(state), encoding="utf-8")
+            self.stats.add_stage("write", time.perf_counter() - started)
+            if progress is not None:
+                progress(self.stats)
+
+        rows_written = skip
+        last_checkpoint = time.perf_counter()
+        results = ordered_map(
+            self._call, self.prepare(read_rows(input_path, delimiter, skip)),
+            workers=self.workers, window=self.window, ready=self._ready,
+        )
+        try:
+            for row in self.fill(results):
+                writer.writerow(row)
+                rows_written += 1
+                if rows_written % self.checkpoint_rows == 0 or \
+                        time.perf_counter() - last_checkpoint >= self.checkpoint_interval:
+                    save_checkpoint(rows_written)
+                    last_checkpoint = time.perf_counter()
+                if self.stop_event.is_set():
+                    break
+        finally:
+            results.close()
+            save_checkpoint(rows_written)
+            out.close()
+
+        self.stats.finished = time.perf_counter()
+        if not self.stop_event.is_set():
+            part.replace(output_path)
+            checkpoint.unlink()
+        result = self.stats.as_dict()
+        if self.limiter is not None:
+            result["concurrency"] = self.limiter.status()
+        log.info("Stream job %s %s after %d rows: %s", output_path.name,
+                 "stopped" if self.stop_event.is_set() else "finished", rows_written, result)
+        return result
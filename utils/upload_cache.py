@@ -0,0 +1,262 @@
+﻿import os
+import time
+import sqlite3
+import hashlib
+import datetime
+import mimetypes
+import threading
+from pathlib import Path
+
+addon_dir = Path(__file__).parent.parent
+DEFAULT_DB_PATH = addon_dir / "user_files" / "upload_cache.sqlite3"
+
+# Files API uploads are kept for 48 hours.
+DEFAULT_FILE_TTL = 48 * 3600
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    if isinstance(value, str):
+        # RFC 3339 as returned by the REST API, e.g. 2024-01-01T00:00:00.123456Z
+        text = value.replace("Z", "+00:00")
+        if "." in text:
+            head, tail = text.split(".", 1)
+            frac, _, zone = tail.partition("+")
+            text = f"{head}.{frac[:6]}+{zone}" if zone else f"{head}.{frac[:6]}"
+        return datetime.datetime.fromisoformat(text).timestamp()
+    return float(value)
+
+
+def key_id(api_key):
+    """Stable, non-reversible id of an API key; uploads are only visible to their key's project"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+_file_clients = {}
+_file_clients_lock = threading.Lock()
+
+
+def genai_upload(path, mime_type, display_name, api_key):
+    """Upload with the vendored google.generativeai Files API client.
+
+    Each key gets its own FileServiceClient, so the SDK's process-wide
+    genai.configure() state is never touched.
+    """
+    from . import vendor
+
+    client_module = vendor.load("google.generativeai.client")
+    with _file_clients_lock:
+        client = _file_clients.get(api_key)
+        if client is None:
+            client = _file_clients[api_key] = client_module.FileServiceClient(
+                client_options={"api_key": api_key}
+            )
+    uploaded = client.create_file(path, mime_type=mime_type, display_name=display_name)
+    return {
+        "name": uploaded.name,
+        "uri": uploaded.uri,
+        "mime_type": uploaded.mime_type,
+        "expiration_time": uploaded.expiration_time,
+    }
+
+
+def rest_upload(path, mime_type, display_name, api_key):
+    """Upload with the proto-free REST client"""
+    from .rest_client import GeminiRestClient
+
+    remote, error = GeminiRestClient(api_key).upload_file(
+        path, mime_type=mime_type, display_name=display_name
+    )
+    if error:
+        raise RuntimeError(error)
+    return {
+        "name": remote["name"],
+        "uri": remote["uri"],
+        "mime_type": remote.get("mimeType"),
+        "expiration_time": remote.get("expirationTime"),
+    }
+
+
+class UploadCache:
+    """Reuses Files API uploads of identical local files.
+
+    Files are identified by content hash and by the API key they were
+    uploaded with (a file is only usable by its own project); the remote file
+    name and its server-side expiry are kept in SQLite so a document used by
+    many prompts is uploaded once per key and only refreshed shortly before
+    the server deletes it.
+
+    upload_fn(path, mime_type, display_name, api_key) performs the upload and
+    returns {name, uri, mime_type, expiration_time}.
+    """
+
+    def __init__(self, upload_fn, db_path=DEFAULT_DB_PATH, refresh_margin=3600):
+        self.upload_fn = upload_fn
+        self.db_path = Path(db_path)
+        self.refresh_margin = refresh_margin
+        self.hits = 0
+        self.uploads = 0
+
+        self._lock = threading.Lock()
+        self._hash_locks = {}
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(uploads)")]
+            if columns and "key_id" not in columns:
+                # Entries from before uploads were keyed per API key
+                self._conn.execute("DROP TABLE uploads")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " sha256 TEXT NOT NULL,"
+                " key_id TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " uri TEXT NOT NULL,"
+                " mime_type TEXT,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (sha256, key_id))"
+            )
+            # Remembers local hashes so unchanged files are not re-read.
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS local_files ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime REAL NOT NULL,"
+                " sha256 TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def file_hash(self, path):
+        """Return the content hash of path, reusing the stored one if size and mtime match"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT size, mtime, sha256 FROM local_files WHERE path = ?", (path,)
+            ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+
+        digest = hash_file(path)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO local_files (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime, digest),
+            )
+            conn.commit()
+        return digest
+
+    def _lookup(self, digest, account):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT name, uri, mime_type, expires FROM uploads WHERE sha256 = ? AND key_id = ?",
+                (digest, account),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "uri": row[1], "mime_type": row[2], "expires": row[3]}
+
+    def _store(self, digest, account, entry):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (sha256, key_id, name, uri, mime_type, expires)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, account, entry["name"], entry["uri"], entry["mime_type"], entry["expires"]),
+            )
+            conn.commit()
+
+    def _hash_lock(self, digest, account):
+        with self._lock:
+            return self._hash_locks.setdefault((digest, account), threading.Lock())
+
+    def upload(self, path, api_key, mime_type=None, display_name=None):
+        """Return {name, uri, mime_type, expires} for path under api_key, uploading only if needed"""
+        digest = self.file_hash(path)
+        account = key_id(api_key)
+
+        # Concurrent callers with the same file and key wait for a single upload.
+        with self._hash_lock(digest, account):
+            entry = self._lookup(digest, account)
+            if entry is not None and entry["expires"] - time.time() > self.refresh_margin:
+                self.hits += 1
+                return entry
+
+            if mime_type is None:
+                mime_type, _ = mimetypes.guess_type(str(path))
+            result = self.upload_fn(str(path), mime_type, display_name or Path(path).name, api_key)
+            expires = _to_epoch(result.get("expiration_time")) or time.time() + DEFAULT_FILE_TTL
+            entry = {
+                "name": result["name"],
+                "uri": result["uri"],
+                "mime_type": result.get("mime_type") or mime_type,
+                "expires": expires,
+            }
+            self._store(digest, account, entry)
+            self.uploads += 1
+            return entry
+
+    def forget(self, path, api_key=None):
+        """Drop the cached upload for path (under api_key, or under every key)
+        so the next call uploads again"""
+        digest = self.file_hash(path)
+        with self._lock:
+            conn = self._connect()
+            if api_key is None:
+                conn.execute("DELETE FROM uploads WHERE sha256 = ?", (digest,))
+            else:
+                conn.execute("DELETE FROM uploads WHERE sha256 = ? AND key_id = ?", (digest, key_id(api_key)))
+            conn.commit()
+
+    def purge_expired(self):
+        """Delete entries whose remote file has already expired"""
+        with self._lock:
+            conn = self._connect()
+            cur = conn.execute("DELETE FROM uploads WHERE expires < ?", (time.time(),))
+            conn.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_upload_cache():
+    """Return the process-wide upload cache; callers pass their API key to upload().
+
+    Uploads go through the vendored SDK only when a native protobuf is
+    available and the SDK imports (see runtime_info.use_proto_backend);
+    otherwise the plain JSON/REST path is used.
+    """
+    from .runtime_info import use_proto_backend
+
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = UploadCache(genai_upload if use_proto_backend() else rest_upload)
+        return _shared_cache
@@ -0,0 +1,195 @@
+﻿"""Private import namespace for the vendored packages in lib/.
+
+lib/ is never put on sys.path. Its packages are loaded under the private
+name PREFIX ("_gemini_tts_lib.requests", "_gemini_tts_lib.google.protobuf",
+...), so they never appear in sys.modules under their real names: other
+add-ons keep getting Anki's copies or their own, and we always get exactly
+the versions in lib/, whatever else was imported first.
+
+VendorFinder sits at the front of sys.meta_path but only answers for names
+under PREFIX. Each vendored module runs with its own __builtins__, whose
+__import__ maps absolute imports of lib/ packages ("import requests",
+"from google.protobuf import message") to PREFIX, and whose importlib and
+importlib.resources do the same for names passed to import_module() and the
+resource functions (certifi finds its cacert.pem this way). Imports of
+anything else, e.g. the standard library, go to the normal import system.
+
+Add-on code reaches vendored modules through load("requests") and the like;
+nothing is imported when the finder is installed.
+
+Code that looks modules up in sys.modules by literal real name, or C
+extensions that import Python modules by real name outside of a vendored
+module's frame, still see the host's modules. Nothing in lib/ that the
+add-on uses depends on that.
+"""
+
+import os
+import sys
+import types
+import builtins
+import threading
+import importlib
+import importlib.machinery
+from pathlib import Path
+
+LIB_DIR = Path(__file__).parent.parent / "lib"
+PREFIX = "_gemini_tts_lib"
+
+_install_lock = threading.Lock()
+_real_import = builtins.__import__
+
+# importlib.resources functions whose first argument is a package name
+_RESOURCE_FUNCTIONS = ("files", "path", "read_text", "read_binary", "open_text", "open_binary",
+                       "contents", "is_resource")
+
+
+def _top_level_names(root):
+    names = set()
+    for entry in os.listdir(root):
+        if entry.startswith(("_", ".")) or entry.endswith((".dist-info", ".pth")):
+            continue
+        if entry.endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES)):
+            names.add(entry.split(".", 1)[0])
+            continue
+        name, ext = os.path.splitext(entry)
+        if ext in ("", ".py"):
+            names.add(name)
+    return names
+
+
+class _ModuleProxy(types.ModuleType):
+    """A stand-in for a module with some attributes replaced; lazy ones are built on first access"""
+
+    def __init__(self, module, overrides, lazy=None):
+        super().__init__(module.__name__, module.__doc__)
+        self.__dict__.update(overrides, _module=module, _lazy=lazy or {})
+
+    def __getattr__(self, name):
+        make = self._lazy.get(name)
+        if make is None:
+            return getattr(self._module, name)
+        value = self.__dict__[name] = make()
+        return value
+
+
+class _VendorLoader(importlib.machinery.SourceFileLoader):
+    """Runs a vendored module with the finder's __builtins__"""
+
+    def __init__(self, fullname, path, finder):
+        super().__init__(fullname, path)
+        self.finder = finder
+
+    def exec_module(self, module):
+        module.__builtins__ = self.finder.builtins
+        super().exec_module(module)
+
+
+class VendorFinder:
+    """Meta-path finder loading lib/ under PREFIX (see module docstring)"""
+
+    def __init__(self, root=LIB_DIR, prefix=PREFIX):
+        self.root = str(root)
+        self.prefix = prefix
+        self.top_level = _top_level_names(self.root) if os.path.isdir(self.root) else set()
+        self.loaded = set()
+        self.builtins = {**builtins.__dict__, "__import__": self._import}
+        self._proxies = {}
+        self._proxies_lock = threading.Lock()
+
+    def private_name(self, name):
+        """PREFIX.name for a module under lib/, otherwise name unchanged"""
+        if name.partition(".")[0] in self.top_level:
+            return f"{self.prefix}.{name}"
+        return name
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname == self.prefix:
+            spec = importlib.machinery.ModuleSpec(fullname, None, is_package=True)
+            spec.submodule_search_locations = [self.root]
+            return spec
+        if not fullname.startswith(self.prefix + "."):
+            return None
+        parts = fullname[len(self.prefix) + 1:].split(".")
+        if parts[0] not in self.top_level:
+            return None
+        search_dir = os.path.join(self.root, *parts[:-1])
+        if not os.path.isdir(search_dir):
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, [search_dir])
+        if spec is None:
+            return None
+        if type(spec.loader) is importlib.machinery.SourceFileLoader:
+            spec.loader = _VendorLoader(fullname, spec.origin, self)
+        self.loaded.add(fullname)
+        return spec
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """__import__ for vendored modules"""
+        if level == 0:
+            top = name.partition(".")[0]
+            if top in self.top_level:
+                module = _real_import(f"{self.prefix}.{name}", globals, locals, fromlist, 0)
+                return module if fromlist else sys.modules[f"{self.prefix}.{top}"]
+            if top == "importlib":
+                module = _real_import(name, globals, locals, fromlist, 0)
+                if not fromlist or name == "importlib":
+                    return self._proxy("importlib")
+                if name == "importlib.resources":
+                    return self._proxy("importlib.resources")
+                return module
+        return _real_import(name, globals, locals, fromlist, level)
+
+    def _proxy(self, name):
+        with self._proxies_lock:
+            proxy = self._proxies.get(name)
+            if proxy is None:
+                proxy = self._proxies[name] = self._make_proxy(name)
+            return proxy
+
+    def _make_proxy(self, name):
+        if name == "importlib":
+            def import_module(module_name, package=None):
+                if not module_name.startswith("."):
+                    module_name = self.private_name(module_name)
+                return importlib.import_module(module_name, package)
+
+            return _ModuleProxy(importlib, {"import_module": import_module},
+                                lazy={"resources": lambda: self._proxy("importlib.resources")})
+
+        resources = importlib.import_module("importlib.resources")
+
+        def private_package(fn):
+            def wrapper(*args, **kwargs):
+                if args and isinstance(args[0], str):
+                    args = (self.private_name(args[0]), *args[1:])
+                return fn(*args, **kwargs)
+
+            wrapper.__name__ = fn.__name__
+            wrapper.__doc__ = fn.__doc__
+            return wrapper
+
+        return _ModuleProxy(resources, {
+            fn: private_package(getattr(resources, fn)) for fn in _RESOURCE_FUNCTIONS if hasattr(resources, fn)
+        })
+
+    def owns(self, module):
+        """Return True if module was loaded from lib/"""
+        origin = getattr(module, "__file__", None) or ""
+        return os.path.abspath(origin).startswith(self.root + os.sep)
+
+
+def install():
+    """Put the lib/ finder on sys.meta_path once; returns it"""
+    with _install_lock:
+        for finder in sys.meta_path:
+            if isinstance(finder, VendorFinder) and finder.root == str(LIB_DIR):
+                return finder
+        finder = VendorFinder()
+        # First, so PathFinder never loads a PREFIX module without the import mapping
+        sys.meta_path.insert(0, finder)
+        return finder
+
+
+def load(name):
+    """Import a vendored module on first use, e.g. load("requests.adapters")"""
+    return importlib.import_module(install().private_name(name))
@@ -0,0 +1,68 @@
+﻿"""Compiles the add-on and lib/ to bytecode for the running interpreter.
+
+The shipped __pycache__ folders only hold cpython-39.opt-2 files, so any
+other interpreter (or optimization level) compiles each vendored module the
+first time it is imported, on whatever thread imports it. Running this once
+in the background after startup moves that cost off the UI thread.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+addon_dir = Path(__file__).parent.parent
+STAMP_DIR = addon_dir / "user_files"
+
+
+def stamp_path():
+    """Stamp file for this interpreter and optimization level"""
+    tag = sys.implementation.cache_tag or "unknown"
+    return STAMP_DIR / f".bytecode-{tag}-O{sys.flags.optimize}.stamp"
+
+
+def is_needed():
+    """True if the warm-up has not run yet for this interpreter"""
+    return not stamp_path().exists()
+
+
+def source_files(root=addon_dir):
+    """All .py files of the add-on, including lib/"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in ("__pycache__", "user_files") and not d.startswith(".")]
+        files.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(".py"))
+    return files
+
+
+def compile_all(progress=None, root=addon_dir):
+    """Compile every source file; progress(done, total) is called as it goes.
+
+    Files whose bytecode is already current are skipped by compileall. The
+    stamp is written even if some files fail (e.g. a read-only install), so
+    the warm-up is not retried on every start.
+    """
+    import compileall
+
+    files = source_files(root)
+    total = len(files)
+    failed = 0
+    started = time.perf_counter()
+    for done, path in enumerate(files, 1):
+        if not compileall.compile_file(path, quiet=2):
+            failed += 1
+        if progress is not None and (done == total or done % 50 == 0):
+            progress(done, total)
+        # Yield the GIL so the UI thread stays responsive.
+        time.sleep(0)
+
+    elapsed = time.perf_counter() - started
+    try:
+        STAMP_DIR.mkdir(parents=True, exist_ok=True)
+        stamp_path().write_text(
+            f"files={total} failed={failed} seconds={elapsed:.1f} python={sys.version.split()[0]}\n",
+            encoding="utf-8",
+        )
+    except OSError:
+        pass
+    return total, failed, elapsed